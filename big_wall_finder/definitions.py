@@ -1,8 +1,7 @@
 """Define configurations and paths used in modules."""
 
+import functools
 import os
-import ee
-ee.Initialize()
 
 # filepaths
 ROOT_DIR = os.path.dirname(__file__)
@@ -14,7 +13,13 @@ MP_SCRAPE_JSON_PATH = os.path.join(
     'clean-data.json'
 )
 MP_DATA_PATH = os.path.join(DATA_DIR, 'mp_data.csv')
+MP_INDEX_PATH = os.path.join(DATA_DIR, 'mp_index.pkl')
+CLIFF_DATA_PATH = os.path.join(DATA_DIR, 'cliff_data.csv')
+CLIFF_JOINED_PATH = os.path.join(DATA_DIR, 'cliff_joined.csv')
 NAIP_DATA_DIR = os.path.join(DATA_DIR, 'naip_shards')
+NAIP_COMPACT_DIR = os.path.join(DATA_DIR, 'naip_shards_uint8')
+NAIP_STORE_DIR = os.path.join(DATA_DIR, 'naip_store')
+NAIP_LOCAL_DIR = os.path.join(DATA_DIR, 'naip_shards_local')
 
 
 # arbitrary thresholds based on intuition and data limits
@@ -30,17 +35,35 @@ NAIP_SAMPLE_FRAC = 0.003  # for sampling
 N_SHARDS = 100
 
 
-# interacting with ee assets
-EE_ASSET_DIR = ee.data.getAssetRoots()[0]['id'] + '/big_wall_data'
-EE_CLIFF_FOOTPRINTS = EE_ASSET_DIR + '/cliff_footprints'
-EE_CLIFFS = EE_ASSET_DIR + '/cliff_data'
-EE_JOINED = EE_ASSET_DIR + '/cliff_joined'
-MP_DATA = EE_ASSET_DIR + '/mp_data'
+# interacting with ee assets; resolved on first use, so that local modules
+# import without earth engine credentials
+EE_ASSETS = {'EE_CLIFF_FOOTPRINTS': 'cliff_footprints',
+             'EE_CLIFFS': 'cliff_data',
+             'EE_JOINED': 'cliff_joined',
+             'MP_DATA': 'mp_data'}
+
+
+@functools.lru_cache(maxsize=None)
+def ee_asset_dir():
+  """Initialize earth engine and get the big_wall_data asset directory."""
+  import ee
+  ee.Initialize()
+  return ee.data.getAssetRoots()[0]['id'] + '/big_wall_data'
+
+
+def __getattr__(name):
+  """Resolve the ee asset paths on first use."""
+  if name == 'EE_ASSET_DIR':
+    return ee_asset_dir()
+  if name in EE_ASSETS:
+    return ee_asset_dir() + '/' + EE_ASSETS[name]
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def get_ee_assets():
   """List asset names within big_wall_data directory."""
-  assets = ee.data.listAssets({'parent': EE_ASSET_DIR})
+  import ee
+  assets = ee.data.listAssets({'parent': ee_asset_dir()})
   assets = assets['assets']
   assets = [a['id'] for a in assets]
   return [a.split('/')[-1] for a in assets]
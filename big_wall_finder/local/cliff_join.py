@@ -0,0 +1,145 @@
+"""Join MP data to cliffs locally, in place of ee.cliff_join.
+
+Produces the same columns as the Earth Engine join: for each cliff, the MP
+areas within 300m for which it is the closest cliff give n_rock, n_views, and
+name, and all MP areas within 800m give the vicinity_* columns. Candidate pairs
+are found with a haversine ball tree over the MP areas, and distances from an
+MP area to a cliff footprint are then measured exactly on a local planar
+projection, which is accurate to well under a meter at these distances.
+"""
+
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+from big_wall_finder import definitions, tables
+from big_wall_finder.local.geometry_store import GeometryStore
+
+
+EARTH_RADIUS = 6_371_000  # meters
+MP_DISTANCE = 300  # meters, matching join_mp_to_cliffs
+VICINITY_DISTANCE = 800  # meters, matching join_cliffs_to_mp
+
+
+def load_mp_data(path: str = definitions.MP_DATA_PATH):
+  """Load and process MP data."""
+  mp_data = tables.read_table(path)
+  in_bounds = (mp_data.longitude.between(definitions.XMIN, definitions.XMAX) &
+               mp_data.latitude.between(definitions.YMIN, definitions.YMAX))
+  mp_data = mp_data[in_bounds & (mp_data.n_rock > 0)]
+  return mp_data.reset_index(drop=True)
+
+
+def to_meters(lon_lat: np.ndarray, origin: np.ndarray):
+  """Project longitude, latitude pairs onto planes tangent at origin."""
+  scale = np.radians(1) * EARTH_RADIUS
+  x = (lon_lat[..., 0] - origin[..., 0]) * scale * np.cos(np.radians(origin[..., 1]))
+  y = (lon_lat[..., 1] - origin[..., 1]) * scale
+  return np.stack([x, y], axis=-1)
+
+
+def distance_to_segments(p: np.ndarray, a: np.ndarray, b: np.ndarray,
+                         starts: np.ndarray):
+  """Get planar distances from points to polygons, zero for points inside.
+
+  Each row pairs a point p with a segment from a to b; the rows of each point
+  and polygon are contiguous and begin at starts."""
+
+  # even-odd rule over all rings accounts for holes
+  straddles = (a[:, 1] > p[:, 1]) != (b[:, 1] > p[:, 1])
+  with np.errstate(divide='ignore', invalid='ignore'):
+    x_cross = a[:, 0] + (b[:, 0] - a[:, 0]) * (p[:, 1] - a[:, 1]) / (b[:, 1] - a[:, 1])
+  crossings = np.add.reduceat((straddles & (p[:, 0] < x_cross)).astype(np.int64), starts)
+
+  ab, ap = b - a, p - a
+  with np.errstate(divide='ignore', invalid='ignore'):
+    t = (ap * ab).sum(axis=1) / (ab * ab).sum(axis=1)
+  t = np.nan_to_num(np.clip(t, 0, 1))  # degenerate segments
+  distance = np.sqrt(((ap - t[:, None] * ab) ** 2).sum(axis=1))
+  distance = np.minimum.reduceat(distance, starts)
+  return np.where(crossings % 2 == 1, 0, distance)
+
+
+def find_pairs(cliffs: pd.DataFrame, mp_data: pd.DataFrame, max_distance: float,
+               chunk_size: int = 2 ** 22):
+  """Find all cliff, MP area pairs within max_distance of each other.
+
+  Returns a DataFrame with the row positions of the cliff and MP area in each
+  pair and the distance between them."""
+
+  seg_a, seg_b, offsets = GeometryStore.from_geojson(cliffs['.geo']).segments()
+  counts = np.diff(offsets)
+  seg_cliff = np.repeat(np.arange(len(cliffs)), counts)
+  origins = np.add.reduceat(seg_a, offsets[:-1]) / counts[:, None]
+  seg_a = to_meters(seg_a, origins[seg_cliff])
+  seg_b = to_meters(seg_b, origins[seg_cliff])
+  radii = np.maximum.reduceat(np.sqrt((seg_a ** 2).sum(axis=1)), offsets[:-1])
+
+  mp_lon_lat = mp_data[['longitude', 'latitude']].to_numpy(dtype=np.float64)
+  tree = BallTree(np.radians(mp_lon_lat[:, ::-1]), metric='haversine')
+  candidates = tree.query_radius(np.radians(origins[:, ::-1]),
+                                 r=(radii + max_distance) / EARTH_RADIUS)
+  pair_cliff = np.repeat(np.arange(len(cliffs)), [len(c) for c in candidates])
+  pair_mp = np.concatenate([np.sort(c) for c in candidates] + [np.array([], dtype=np.int64)])
+  pair_mp = pair_mp.astype(np.int64)
+  points = to_meters(mp_lon_lat[pair_mp], origins[pair_cliff])
+
+  # measuring each pair against every segment of its cliff, in chunks of rows
+  distance = np.empty(len(pair_cliff))
+  rows = np.concatenate([[0], np.cumsum(counts[pair_cliff])])
+  start = 0
+  while start < len(pair_cliff):
+    stop = max(np.searchsorted(rows, rows[start] + chunk_size, side='right') - 1, start + 1)
+    n_rows = counts[pair_cliff[start:stop]]
+    starts = rows[start:stop] - rows[start]
+    pair = np.repeat(np.arange(start, stop), n_rows)
+    segment = np.arange(rows[stop] - rows[start]) - np.repeat(starts, n_rows)
+    segment += np.repeat(offsets[pair_cliff[start:stop]], n_rows)
+    distance[start:stop] = distance_to_segments(
+        points[pair], seg_a[segment], seg_b[segment], starts)
+    start = stop
+
+  close = distance <= max_distance
+  return pd.DataFrame({'cliff': pair_cliff[close], 'mp': pair_mp[close],
+                       'distance': distance[close]})
+
+
+def join(cliffs: pd.DataFrame, mp_data: pd.DataFrame):
+  """Add aggregated MP data to each cliff."""
+  cliffs = cliffs.reset_index(drop=True)
+  mp_data = mp_data.reset_index(drop=True)
+  pairs = find_pairs(cliffs, mp_data, VICINITY_DISTANCE)
+  pairs = pairs.join(mp_data[['n_rock', 'n_views', 'name']], on='mp')
+
+  # each MP area within MP_DISTANCE counts toward its closest cliff only
+  best = pairs[pairs.distance <= MP_DISTANCE]
+  best = best.sort_values(['distance', 'cliff'], kind='stable')
+  best = best.drop_duplicates('mp').sort_values('mp')
+  # the ee accumulator prepends each name, leaving a trailing separator
+  names = best.name.astype(str) + ' - '
+  grouped = best.assign(name=names).iloc[::-1].groupby('cliff')
+  cliffs['n_rock'] = grouped.n_rock.sum().reindex(cliffs.index, fill_value=0)
+  cliffs['n_views'] = grouped.n_views.sum().reindex(cliffs.index, fill_value=0)
+  cliffs['name'] = grouped.name.sum().reindex(cliffs.index, fill_value='')
+
+  vicinity = pairs.groupby('cliff')
+  cliffs['vicinity_n_rock'] = vicinity.n_rock.sum().reindex(cliffs.index, fill_value=0)
+  cliffs['vicinity_n_views'] = vicinity.n_views.sum().reindex(cliffs.index, fill_value=0)
+  cliffs['vicinity_n_areas'] = vicinity.size().reindex(cliffs.index, fill_value=0)
+  return cliffs
+
+
+def main():
+  """Run the main job."""
+  print('Loading cliff and MP data ...')
+  cliffs = tables.read_table(definitions.CLIFF_DATA_PATH)
+  mp_data = load_mp_data()
+  print('Joining ...')
+  cliff_joined = join(cliffs, mp_data)
+  path = definitions.CLIFF_JOINED_PATH
+  print(f'Writing joined data to {path}')
+  tables.write_table(cliff_joined, path)
+
+
+if __name__ == '__main__':
+  main()
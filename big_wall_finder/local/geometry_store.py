@@ -0,0 +1,120 @@
+"""Store cliff footprints as flat, memory-mappable coordinate buffers.
+
+The .geo column holds each footprint as a GeoJSON string, which makes up the
+bulk of the memory of any table carrying it. A GeometryStore parses those
+strings once into a single array of coordinates along with offset arrays in the
+style of Arrow: geometry i is made of the polygons
+polygon_offsets[i]:polygon_offsets[i + 1], polygon j is made of the rings
+ring_offsets[j]:ring_offsets[j + 1], and ring k is made of the coordinates
+coord_offsets[k]:coord_offsets[k + 1]. Tables then carry an integer geo_id
+indexing the store in place of .geo, and geometry is only read when needed.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+ARRAYS = ['coords', 'coord_offsets', 'ring_offsets', 'polygon_offsets', 'is_multi']
+
+
+@dataclass
+class GeometryStore:
+  """Polygons and MultiPolygons packed into flat arrays."""
+  coords: np.ndarray  # (n_coords, 2) longitude, latitude pairs
+  coord_offsets: np.ndarray  # (n_rings + 1,) into coords
+  ring_offsets: np.ndarray  # (n_polygons + 1,) into coord_offsets
+  polygon_offsets: np.ndarray  # (n_geometries + 1,) into ring_offsets
+  is_multi: np.ndarray  # (n_geometries,) whether each is a MultiPolygon
+
+  @classmethod
+  def from_geojson(cls, geos: Iterable[str]):
+    """Parse GeoJSON Polygon and MultiPolygon strings."""
+    rings, ring_counts, polygon_counts, is_multi = [], [], [], []
+    for geo in geos:
+      geo = json.loads(geo)
+      polygons = geo['coordinates']
+      if geo['type'] == 'Polygon':
+        polygons = [polygons]
+      rings.extend(ring for polygon in polygons for ring in polygon)
+      ring_counts.extend(len(polygon) for polygon in polygons)
+      polygon_counts.append(len(polygons))
+      is_multi.append(geo['type'] == 'MultiPolygon')
+
+    coord_counts = [len(ring) for ring in rings]
+    coords = [c for ring in rings for c in ring]
+    return cls(np.array(coords, dtype=np.float64).reshape(-1, 2),
+               offsets(coord_counts), offsets(ring_counts),
+               offsets(polygon_counts), np.array(is_multi, dtype=bool))
+
+  @classmethod
+  def load(cls, directory: str):
+    """Memory-map a store saved with save."""
+    return cls(*[np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+                 for name in ARRAYS])
+
+  def save(self, directory: str):
+    """Save each array as a .npy file within directory."""
+    os.makedirs(directory, exist_ok=True)
+    for name in ARRAYS:
+      np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+
+  def __len__(self):
+    return len(self.is_multi)
+
+  def rings(self, geo_id: int):
+    """Get the rings of geometry geo_id as views into coords, by polygon."""
+    polygons = []
+    for j in range(self.polygon_offsets[geo_id], self.polygon_offsets[geo_id + 1]):
+      polygons.append([
+          self.coords[self.coord_offsets[k]:self.coord_offsets[k + 1]]
+          for k in range(self.ring_offsets[j], self.ring_offsets[j + 1])])
+    return polygons
+
+  def segments(self):
+    """Get the boundary segments of all geometries.
+
+    Returns the start and end of each segment along with the offset of the
+    first segment of each geometry."""
+    # a ring with n coordinates has n - 1 segments; dropping the ring ends
+    is_end = np.zeros(len(self.coords), dtype=bool)
+    is_end[self.coord_offsets[1:] - 1] = True
+    first_coord = self.coord_offsets[self.ring_offsets[self.polygon_offsets]]
+    n_ends = np.concatenate([[0], np.cumsum(is_end)])
+    return (self.coords[:-1][~is_end[:-1]], self.coords[1:][~is_end[:-1]],
+            first_coord - n_ends[first_coord])
+
+  def to_geojson(self, geo_id: int):
+    """Get geometry geo_id as a GeoJSON string."""
+    polygons = [[ring.tolist() for ring in polygon] for polygon in self.rings(geo_id)]
+    if self.is_multi[geo_id]:
+      geo = {'type': 'MultiPolygon', 'coordinates': polygons}
+    else:
+      geo = {'type': 'Polygon', 'coordinates': polygons[0]}
+    return json.dumps(geo, separators=(',', ':'))
+
+
+def offsets(counts: list[int]):
+  """Convert counts to offsets beginning at zero."""
+  return np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+
+
+def split_geometry(df: pd.DataFrame, directory: str):
+  """Move the .geo column of df into a store saved in directory.
+
+  Returns df with .geo replaced by the integer geo_id of each row."""
+  GeometryStore.from_geojson(df['.geo']).save(directory)
+  df = df.drop(columns=['.geo'])
+  df['geo_id'] = np.arange(len(df))
+  return df
+
+
+def attach_geometry(df: pd.DataFrame, store: GeometryStore):
+  """Add back the .geo column for the rows of df, eg for exporting results."""
+  df = df.copy()
+  df['.geo'] = [store.to_geojson(geo_id) for geo_id in df.geo_id]
+  return df
@@ -0,0 +1,235 @@
+"""Sample NAIP patches of cliffs from local raster tiles and write them to shards.
+
+Tiles must be in longitude and latitude, eg warped to EPSG:4326."""
+
+from __future__ import annotations
+from dataclasses import dataclass
+import json
+import math
+import os
+import sys
+import numpy as np
+import tensorflow as tf
+from big_wall_finder import definitions, tables
+from big_wall_finder.local.cliff_join import to_meters
+from big_wall_finder.local.geometry_store import GeometryStore
+from big_wall_finder.models.cnn import naip_dataset
+
+
+# rows of the tile per chunk of the spectral gradient pass
+GRADIENT_CHUNK_ROWS = 1024
+RECORDS_PER_SHARD = 20_000
+
+
+@dataclass
+class Tile:
+  """Bands of a raster tile and the affine transform of its pixels."""
+  bands: np.ndarray  # (C, H, W) uint8, bands ordered as naip_dataset.PIXEL_BANDS
+  # (a, b, c, d, e, f) in the order of GDAL and rasterio: the corner of pixel
+  # (col, row) is at longitude a * col + b * row + c, latitude d * col + e * row + f
+  transform: tuple
+
+  @classmethod
+  def from_npy(cls, path: str):
+    """Memory-map a .npy tile; its transform is in a .json file next to it."""
+    with open(os.path.splitext(path)[0] + '.json') as f:
+      transform = tuple(json.load(f)['transform'])
+    return cls(np.load(path, mmap_mode='r'), transform)
+
+  @classmethod
+  def from_geotiff(cls, path: str):
+    """Read a GeoTIFF tile with rasterio."""
+    import rasterio  # only needed for GeoTIFF tiles
+    with rasterio.open(path) as src:
+      if src.crs is None or not src.crs.is_geographic:
+        raise ValueError(f'{path} is not in longitude and latitude.')
+      return cls(src.read(), tuple(src.transform)[:6])
+
+  @classmethod
+  def load(cls, path: str):
+    """Read a GeoTIFF or .npy tile."""
+    if path.endswith('.npy'):
+      return cls.from_npy(path)
+    return cls.from_geotiff(path)
+
+  def to_pixels(self, lon_lat: np.ndarray):
+    """Convert longitude, latitude pairs into fractional col, row pairs."""
+    a, b, c, d, e, f = self.transform
+    inverse = np.linalg.inv(np.array([[a, b], [d, e]]))
+    return (np.asarray(lon_lat) - [c, f]) @ inverse.T
+
+  def contains(self, lon_lat: np.ndarray):
+    """Whether each longitude, latitude pair falls within the tile."""
+    col_row = self.to_pixels(lon_lat)
+    return ((col_row >= 0) & (col_row < self.bands.shape[:0:-1])).all(axis=-1)
+
+
+def spectral_gradient(bands: np.ndarray, chunk_rows: int = GRADIENT_CHUNK_ROWS):
+  """Spectral angle, in radians, between opposite neighbors of each pixel.
+
+  The larger of the horizontal and vertical angles; edges repeat their pixels."""
+  n_rows, n_cols = bands.shape[1:]
+  gradient = np.empty((n_rows, n_cols), dtype=np.float32)
+  left = np.maximum(np.arange(n_cols) - 1, 0)
+  right = np.minimum(np.arange(n_cols) + 1, n_cols - 1)
+  for start in range(0, n_rows, chunk_rows):
+    stop = min(start + chunk_rows, n_rows)
+    # the chunk with one row of halo on either side
+    lo, hi = max(start - 1, 0), min(stop + 1, n_rows)
+    unit = bands[:, lo:hi].astype(np.float32)
+    norm = np.sqrt((unit ** 2).sum(axis=0))
+    unit /= np.where(norm == 0, 1, norm)
+    rows = np.arange(start, stop) - lo
+    above = np.maximum(np.arange(start, stop) - 1, 0) - lo
+    below = np.minimum(np.arange(start, stop) + 1, n_rows - 1) - lo
+    horizontal = (unit[:, rows][:, :, left] * unit[:, rows][:, :, right]).sum(axis=0)
+    vertical = (unit[:, above] * unit[:, below]).sum(axis=0)
+    cosine = np.minimum(horizontal, vertical)
+    gradient[start:stop] = np.arccos(np.clip(cosine, -1, 1))
+  return gradient
+
+
+def area(polygons: list[list[np.ndarray]]):
+  """Area in square meters of polygons given as rings of longitude, latitude pairs."""
+  origin = np.concatenate([polygon[0] for polygon in polygons]).mean(axis=0)
+  total = 0.0
+  for polygon in polygons:
+    for i, ring in enumerate(polygon):
+      x, y = to_meters(ring, origin).T
+      ring_area = abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+      total += ring_area if i == 0 else -ring_area  # later rings are holes
+  return total
+
+
+def inside_runs(rings: list[np.ndarray], row_range: range, col_range: range):
+  """Runs of pixels whose centers are inside rings, in pixel coordinates.
+
+  Returns the row, first column, and length of each run, limited to the
+  rows and columns of the given ranges."""
+  a = np.concatenate([ring[:-1] for ring in rings])
+  b = np.concatenate([ring[1:] for ring in rings])
+  y = np.arange(row_range.start, row_range.stop)[:, None] + 0.5
+  straddles = (a[:, 1] > y) != (b[:, 1] > y)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    x = a[:, 0] + (b[:, 0] - a[:, 0]) * (y - a[:, 1]) / (b[:, 1] - a[:, 1])
+  # each row crosses the rings an even number of times
+  x = np.sort(np.where(straddles, x, np.inf), axis=1)
+  if x.shape[1] % 2:
+    x = np.concatenate([x, np.full((len(x), 1), np.inf)], axis=1)
+  enter, leave = x[:, 0::2], x[:, 1::2]
+  finite = np.isfinite(leave)
+  # pixel c is inside when enter <= c + 0.5 < leave
+  first = np.where(finite, np.ceil(enter - 0.5), 0)
+  stop = np.where(finite, np.ceil(leave - 0.5), 0)
+  first = np.maximum(first, col_range.start)
+  stop = np.minimum(stop, col_range.stop)
+  lengths = np.maximum(stop - first, 0).astype(np.int64)
+  rows = np.broadcast_to(y - 0.5, lengths.shape).astype(np.int64)
+  keep = lengths > 0
+  return rows[keep], first[keep].astype(np.int64), lengths[keep]
+
+
+def sample_centers(tile: Tile, polygons: list[list[np.ndarray]], n_samples: int,
+                   kernel_size: int, rng: np.random.Generator):
+  """Rows and columns of up to n_samples distinct pixels inside polygons.
+
+  Only pixels whose patch lies within the tile are sampled."""
+  rings = [tile.to_pixels(ring) for polygon in polygons for ring in polygon]
+  n_rows, n_cols = tile.bands.shape[1:]
+  half = kernel_size // 2
+  lo, hi = np.concatenate(rings).min(axis=0), np.concatenate(rings).max(axis=0)
+  row_range = range(max(int(np.floor(lo[1])), half),
+                    min(int(np.ceil(hi[1])) + 1, n_rows - kernel_size + half + 1))
+  col_range = range(max(int(np.floor(lo[0])), half),
+                    min(int(np.ceil(hi[0])) + 1, n_cols - kernel_size + half + 1))
+  if len(row_range) == 0 or len(col_range) == 0:
+    return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+  rows, first, lengths = inside_runs(rings, row_range, col_range)
+  ends = np.cumsum(lengths)
+  total = int(ends[-1]) if len(ends) else 0
+  picks = np.sort(rng.choice(total, min(n_samples, total), replace=False))
+  run = np.searchsorted(ends, picks, side='right')
+  return rows[run], first[run] + picks - (ends[run] - lengths[run])
+
+
+def sample_tile(tile: Tile, store: GeometryStore, geo_ids, cliff_ids,
+                kernel_size: int = definitions.NAIP_KERNEL_SIZE,
+                frac: float = definitions.NAIP_SAMPLE_FRAC, n_images: int = 1, seed=0):
+  """Yield the cliff id and the sampled patches of each cliff, keyed by band."""
+  windows = np.lib.stride_tricks.sliding_window_view(
+      tile.bands, (kernel_size, kernel_size), axis=(1, 2))
+  gradient = np.lib.stride_tricks.sliding_window_view(
+      spectral_gradient(tile.bands), (kernel_size, kernel_size))
+  half = kernel_size // 2
+  rng = np.random.default_rng(seed)
+  for geo_id, cliff_id in zip(geo_ids, cliff_ids):
+    polygons = store.rings(geo_id)
+    n_samples = math.ceil(area(polygons) * frac / n_images)
+    rows, cols = sample_centers(tile, polygons, n_samples, kernel_size, rng)
+    if not len(rows):
+      continue
+    # the window at (row - half, col - half) is the patch centered at (row, col)
+    patches = windows[:, rows - half, cols - half]
+    bands = dict(zip(naip_dataset.PIXEL_BANDS, patches))
+    bands[naip_dataset.GRADIENT_BAND] = gradient[rows - half, cols - half]
+    yield cliff_id, bands
+
+
+def write_shards(samples, directory: str, records_per_shard: int = RECORDS_PER_SHARD,
+                 first_shard: int = 0):
+  """Write the patches yielded by sample_tile to compact shards; return their paths.
+
+  A shard is closed once it holds records_per_shard patches, between cliffs."""
+  os.makedirs(directory, exist_ok=True)
+  options = tf.io.TFRecordOptions(compression_type='GZIP')
+  paths, writer, n_records = [], None, 0
+  try:
+    for cliff_id, bands in samples:
+      if writer is None or n_records >= records_per_shard:
+        if writer is not None:
+          writer.close()
+        paths.append(os.path.join(directory,
+                                  f'naip_shard_{first_shard + len(paths)}.tfrecord.gz'))
+        writer, n_records = tf.io.TFRecordWriter(paths[-1], options), 0
+      for i in range(len(bands[naip_dataset.GRADIENT_BAND])):
+        example = {band: patches[i] for band, patches in bands.items()}
+        example['cliff_id'] = str(cliff_id).encode()
+        writer.write(naip_dataset.encode_compact(example).SerializeToString())
+      n_records += len(bands[naip_dataset.GRADIENT_BAND])
+  finally:
+    if writer is not None:
+      writer.close()
+  return paths
+
+
+def bounding_boxes(store: GeometryStore):
+  """Smallest and largest longitude, latitude pairs of each geometry."""
+  first_coord = store.coord_offsets[store.ring_offsets[store.polygon_offsets]]
+  return (np.minimum.reduceat(store.coords, first_coord[:-1]),
+          np.maximum.reduceat(store.coords, first_coord[:-1]))
+
+
+def main():
+  """Sample the cliffs of merged_data from the tiles given as arguments.
+
+  Each cliff is sampled from the tile holding the center of its bounding box."""
+  store = GeometryStore.load(os.path.join(definitions.DATA_DIR, 'geometry'))
+  cliffs = tables.read_table(os.path.join(definitions.DATA_DIR, 'merged_data.csv'),
+                             {'cliff_id': 'str'})
+  lo, hi = bounding_boxes(store)
+  centers = (lo + hi)[cliffs.geo_id.to_numpy()] / 2
+  sampled = np.zeros(len(cliffs), dtype=bool)
+  n_shards = 0
+  for path in sys.argv[1:]:
+    tile = Tile.load(path)
+    in_tile = tile.contains(centers) & ~sampled
+    sampled |= in_tile
+    samples = sample_tile(tile, store, cliffs.geo_id[in_tile], cliffs.cliff_id[in_tile])
+    paths = write_shards(samples, definitions.NAIP_LOCAL_DIR, first_shard=n_shards)
+    n_shards += len(paths)
+    print(f'{path}: {in_tile.sum()} cliffs in {len(paths)} shards')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,162 @@
+"""Reduce CNN predictions on NAIP patches into a table of scores per cliff.
+
+cliff_naip samples many patches of each cliff, and the CNN predicts on each
+patch; predict works with one row per cliff. Predictions are made batch by
+batch and reduced by cliff_id as they stream in, so no more than one batch and
+the statistics of finished cliffs are ever held in memory.
+
+The reduction relies on the patches of a cliff being consecutive, as they are
+when reading the shards exported by cliff_naip in order or a tensor store. The
+patches of the cliff straddling the end of a batch are carried into the next
+batch. Each cliff then gets the number of patches and the mean, max, and
+quantiles of each output, computed for all finished cliffs of a batch at once
+with segment reductions.
+"""
+
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+from big_wall_finder import tables
+from big_wall_finder.models import merge_data
+from big_wall_finder.models.cnn import naip_dataset
+
+
+QUANTILES = (0.25, 0.5, 0.75)
+BATCH_SIZE = 4096
+
+
+def segment_quantiles(values: np.ndarray, starts: np.ndarray, quantiles):
+  """Linearly interpolated quantiles of each segment of values, by column.
+
+  Segments start at starts and run to the next start; values is (n, m) and the
+  result is (len(quantiles), len(starts), m)."""
+  counts = np.diff(np.append(starts, len(values)))
+  segments = np.repeat(np.arange(len(starts)), counts)
+  result = np.empty((len(quantiles), len(starts), values.shape[1]))
+  for j in range(values.shape[1]):
+    # sorting within each segment
+    column = values[np.lexsort((values[:, j], segments)), j]
+    for i, q in enumerate(quantiles):
+      position = q * (counts - 1)
+      below = np.floor(position).astype(np.int64)
+      above = np.minimum(below + 1, counts - 1)
+      weight = position - below
+      result[i, :, j] = (1 - weight) * column[starts + below] + weight * column[starts + above]
+  return result
+
+
+class CliffAggregator():
+  """Streaming reduction of patch predictions by cliff id."""
+
+  def __init__(self, quantiles=QUANTILES, prefix='cnn'):
+    self.quantiles = tuple(quantiles)
+    self.prefix = prefix
+    self.finished = []  # tables of finished cliffs
+    self.seen = set()
+    self.pending_ids = np.array([], dtype=object)
+    self.pending = None
+
+  def update(self, cliff_ids, predictions):
+    """Add a batch of predictions, finishing every cliff but the last."""
+    cliff_ids = np.asarray(cliff_ids, dtype=object)
+    if not len(cliff_ids):
+      return
+    predictions = np.asarray(predictions, dtype=np.float64).reshape(len(cliff_ids), -1)
+    if self.pending is not None:
+      cliff_ids = np.concatenate([self.pending_ids, cliff_ids])
+      predictions = np.concatenate([self.pending, predictions])
+    starts = np.flatnonzero(np.append(True, cliff_ids[1:] != cliff_ids[:-1]))
+    # the last cliff may continue into the next batch
+    self.pending_ids, self.pending = cliff_ids[starts[-1]:], predictions[starts[-1]:]
+    if len(starts) > 1:
+      self.reduce(cliff_ids[:starts[-1]], predictions[:starts[-1]], starts[:-1])
+
+  def reduce(self, cliff_ids, predictions, starts):
+    """Reduce whole cliffs starting at starts."""
+    ids = cliff_ids[starts]
+    unique, counts = np.unique(ids.astype(str), return_counts=True)
+    repeated = self.seen.intersection(unique) | set(unique[counts > 1])
+    if repeated:
+      raise ValueError(f'Patches of cliffs {sorted(repeated)[:5]} are not consecutive.')
+    self.seen.update(ids)
+
+    counts = np.diff(np.append(starts, len(predictions)))
+    stats = {'mean': np.add.reduceat(predictions, starts) / counts[:, None],
+             'max': np.maximum.reduceat(predictions, starts)}
+    for q, values in zip(self.quantiles, segment_quantiles(predictions, starts, self.quantiles)):
+      stats[f'q{round(q * 100)}'] = values
+    self.finished.append(self.table(ids, counts, stats))
+
+  def table(self, ids, counts, stats: dict[str, np.ndarray]):
+    """Table of cliffs from their counts and (n_cliffs, n_outputs) statistics."""
+    table = {'cliff_id': ids.astype(str), f'{self.prefix}_count': counts.astype(np.int32)}
+    n_outputs = next(iter(stats.values())).shape[1]
+    for j in range(n_outputs):
+      name = self.prefix if n_outputs == 1 else f'{self.prefix}{j}'
+      for stat, values in stats.items():
+        table[f'{name}_{stat}'] = values[:, j].astype(np.float32)
+    return pd.DataFrame(table)
+
+  def result(self):
+    """Finish the last cliff and return the table of every cliff."""
+    if self.pending is not None and len(self.pending):
+      self.reduce(self.pending_ids, self.pending, np.array([0]))
+      self.pending_ids, self.pending = np.array([], dtype=object), None
+    if not self.finished:
+      # no patch was scored; the columns of a single output
+      stats = ['mean', 'max'] + [f'q{round(q * 100)}' for q in self.quantiles]
+      return self.table(np.array([], dtype=object), np.array([], dtype=np.int32),
+                        {stat: np.empty((0, 1)) for stat in stats})
+    return pd.concat(self.finished, ignore_index=True)
+
+
+def decode_ids(cliff_ids):
+  """Cliff ids of a parsed batch as str."""
+  return [cliff_id.decode() for cliff_id in cliff_ids]
+
+
+def score_shards(model, filenames, features, transform, batch_size: int = BATCH_SIZE,
+                 decode=None, quantiles=QUANTILES):
+  """Predict on the patches of shards and reduce the predictions by cliff.
+
+  transform maps a parsed batch to the inputs of the keras model. Shards are
+  read one at a time and in order, keeping the patches of a cliff together."""
+  aggregator = CliffAggregator(quantiles)
+  filenames = list(filenames)
+  if not filenames:
+    return aggregator.result()
+  dataset = naip_dataset.build_dataset(
+      filenames, features, batch_size, cycle_length=1, decode=decode,
+      transform=lambda batch: (transform(batch), batch['cliff_id']))
+  for inputs, cliff_ids in dataset:
+    aggregator.update(decode_ids(cliff_ids.numpy()), model.predict_on_batch(inputs))
+  return aggregator.result()
+
+
+def score_store(model, store, batch_size: int = BATCH_SIZE, quantiles=QUANTILES):
+  """Predict on the patches of a tensor store and reduce the predictions by cliff.
+
+  The keras model takes (n, K, K, C) patches with the channels of the store."""
+  cliff_ids = store.row_cliff_ids()
+  aggregator = CliffAggregator(quantiles)
+  for start, (patches, _) in zip(range(0, len(store), batch_size), store.batches(batch_size)):
+    aggregator.update(cliff_ids[start:start + len(patches)], model.predict_on_batch(patches))
+  return aggregator.result()
+
+
+def join_scores(merged: pd.DataFrame, scores: pd.DataFrame, fill_value: float = 0.0):
+  """Left join the cliff scores into merged_data on cliff_id.
+
+  Cliffs without patches get a count of 0 and fill_value for each statistic,
+  as most models reject missing features."""
+  joined = merged.merge(scores, how='left', on='cliff_id', validate='one_to_one')
+  counts = [c for c in scores.columns if c.endswith('_count')]
+  stats = [c for c in scores.columns if c != 'cliff_id' and c not in counts]
+  joined[counts] = joined[counts].fillna(0).astype(np.int32)
+  joined[stats] = joined[stats].fillna(fill_value).astype(np.float32)
+  return joined
+
+
+def write_scores(scores: pd.DataFrame, path: str = merge_data.CNN_SCORES_PATH):
+  """Write the table of cliff scores."""
+  tables.write_table(scores, path)
@@ -1,7 +1,8 @@
 """Run CNN from NAIP data."""
 
 import tensorflow as tf
-import params
+from big_wall_finder.models.cnn import params
+from big_wall_finder.models.cnn.naip_dataset import build_dataset
 
 
 # Should import these from gather_cliff_images or from common parameters file
@@ -13,29 +14,30 @@ import params
 
 
 def separate_input_and_output(x):
-  """Return tuple with input and output features."""
+  """Return tuple with input and output features of a parsed batch.
+
+  Bands are stacked last, so inputs are (batch, K, K, bands) and outputs
+  (batch, 1, 1)."""
   inputs = [x.get(key) for key in params.NAIP_KEYS if key not in ['mp_score', 'cliff_id']]
   outputs = [x.get('mp_score')]
-  return inputs, outputs
-
-
+  return tf.stack(inputs, axis=-1), tf.stack(outputs, axis=-1)
 
-# Use glob here once more tfrecord files available
-filenames = ['../../data/naip_shards/naip_shard_0.tfrecord.gz']
-dataset = tf.data.TFRecordDataset(filenames, compression_type='GZIP')
-dataset = dataset.take(10)
 
-dataset = dataset.map(lambda x: tf.io.parse_single_example(x, params.FEATURES_DICT))
-print(iter(dataset.take(1)).next())
-dataset = dataset.map(separate_input_and_output)
+def build_training_dataset(filenames):
+  """Shuffled and repeated batches of (inputs, outputs) of NAIP shards."""
+  return build_dataset(filenames, params.FEATURES_DICT, params.BATCH_SIZE,
+                       transform=separate_input_and_output,
+                       shuffle_buffer=params.SHUFFLE_BUFFER_SIZE,
+                       repeat=params.EPOCHS)
 
-print('#' * 80)
 
-dataset = dataset.shuffle(params.SHUFFLE_BUFFER_SIZE, reshuffle_each_iteration=True)
-dataset = dataset.batch(params.BATCH_SIZE)
-dataset = dataset.repeat(params.EPOCHS)
+if __name__ == '__main__':
+  # Use glob here once more tfrecord files available
+  filenames = ['../../data/naip_shards/naip_shard_0.tfrecord.gz']
+  dataset = build_training_dataset(filenames)
 
-print(iter(dataset.take(1)).next())
+  print('#' * 80)
+  print(iter(dataset.take(1)).next())
 
 
 
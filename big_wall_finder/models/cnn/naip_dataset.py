@@ -0,0 +1,158 @@
+"""Build tf.data pipelines over gzipped TFRecord shards of NAIP patches.
+
+Shards are read several at a time with interleave, so that decompression of one
+shard overlaps with reading of others. Serialized records are optionally cached
+in memory or on disk before shuffling, skipping decompression after the first
+epoch while still reshuffling each epoch. Records are batched before parsing,
+so that one parse_example call parses a whole batch instead of one
+parse_single_example call per record. Maps run with parallel calls, and
+batches are prefetched while the model trains on the previous one.
+
+NAIP pixels are integers between 0 and 255, yet Earth Engine exports them as
+float32. Compact shards store each R, G, B, N patch as kernel_size^2 raw uint8
+bytes and the spectral gradient S as int16 in units of 1 / S_SCALE; they are
+decoded with decode_raw and a cast within the parse map. convert_shard
+rewrites float shards as compact shards.
+"""
+
+import glob
+import os
+import numpy as np
+import tensorflow as tf
+
+
+AUTOTUNE = tf.data.AUTOTUNE
+NAIP_BANDS = ['R', 'G', 'B', 'N', 'S']
+PIXEL_BANDS = ['R', 'G', 'B', 'N']
+GRADIENT_BAND = 'S'
+# the spectral gradient is an angle in radians; int16 holds it to 1e-4
+S_SCALE = 10_000
+
+
+def naip_features(kernel_size):
+  """Features of the patches exported by cliff_naip."""
+  patch = tf.io.FixedLenFeature(shape=(kernel_size, kernel_size), dtype=tf.float32)
+  features = {band: patch for band in NAIP_BANDS}
+  features['cliff_id'] = tf.io.FixedLenFeature([], dtype=tf.string)
+  return features
+
+
+def compact_features():
+  """Features of compact shards written by convert_shard."""
+  features = {band: tf.io.FixedLenFeature([], dtype=tf.string) for band in NAIP_BANDS}
+  features['cliff_id'] = tf.io.FixedLenFeature([], dtype=tf.string)
+  return features
+
+
+def decode_compact(kernel_size):
+  """Build a function decoding the bands of a parsed batch of a compact shard."""
+  def decode(batch):
+    batch = dict(batch)
+    for band in PIXEL_BANDS:
+      pixels = tf.io.decode_raw(batch[band], tf.uint8)
+      batch[band] = tf.cast(tf.reshape(pixels, [-1, kernel_size, kernel_size]), tf.float32)
+    gradient = tf.io.decode_raw(batch[GRADIENT_BAND], tf.int16, little_endian=True)
+    gradient = tf.cast(tf.reshape(gradient, [-1, kernel_size, kernel_size]), tf.float32)
+    batch[GRADIENT_BAND] = gradient / S_SCALE
+    return batch
+  return decode
+
+
+def build_dataset(filenames, features, batch_size, transform=None, shuffle_buffer=0,
+                  cache=None, repeat=None, cycle_length=8, drop_remainder=False,
+                  compression_type='GZIP', decode=None):
+  """Read, parse, and batch TFRecord shards.
+
+  features maps keys to tf.io.FixedLenFeature as for parse_example, decode,
+  eg decode_compact(kernel_size), is applied to each parsed batch, and
+  transform, if given, then maps each batch, eg into an (inputs, outputs)
+  tuple. With a shuffle_buffer, shards and records are shuffled. cache is a
+  filename for an on-disk cache of the decompressed records, or '' to cache in
+  memory. repeat is a number of epochs, or -1 to repeat forever."""
+
+  files = tf.data.Dataset.from_tensor_slices(list(filenames))
+  if shuffle_buffer:
+    files = files.shuffle(len(filenames), reshuffle_each_iteration=True)
+  dataset = files.interleave(
+      lambda filename: tf.data.TFRecordDataset(filename, compression_type=compression_type),
+      cycle_length=min(cycle_length, len(filenames)),
+      num_parallel_calls=AUTOTUNE,
+      # reading shards in a fixed order unless shuffling anyway
+      deterministic=not shuffle_buffer)
+
+  if cache is not None:
+    dataset = dataset.cache(cache)
+  if shuffle_buffer:
+    dataset = dataset.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+  if repeat is not None:
+    dataset = dataset.repeat(repeat)
+
+  dataset = dataset.batch(batch_size, drop_remainder=drop_remainder)
+  if decode is None:
+    parse = lambda records: tf.io.parse_example(records, features)
+  else:
+    parse = lambda records: decode(tf.io.parse_example(records, features))
+  dataset = dataset.map(parse, num_parallel_calls=AUTOTUNE)
+  if transform is not None:
+    dataset = dataset.map(transform, num_parallel_calls=AUTOTUNE)
+  return dataset.prefetch(AUTOTUNE)
+
+
+def encode_compact(example: dict[str, np.ndarray]):
+  """Encode one parsed record of a float shard as a compact tf.train.Example."""
+  feature = {}
+  for key, value in example.items():
+    if key in PIXEL_BANDS:
+      pixels = np.rint(value)
+      if not np.array_equal(pixels, value) or pixels.min() < 0 or pixels.max() > 255:
+        raise ValueError(f'Band {key} does not hold uint8 pixels.')
+      value = pixels.astype(np.uint8).tobytes()
+    elif key == GRADIENT_BAND:
+      gradient = np.rint(np.asarray(value, dtype=np.float64) * S_SCALE)
+      value = np.clip(gradient, -2 ** 15, 2 ** 15 - 1).astype('<i2').tobytes()
+    # bytes go in as they are, as numpy strips trailing zero bytes
+    if isinstance(value, bytes):
+      feature[key] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+      continue
+    value = np.ravel(value)
+    if value.dtype.kind in 'SO':
+      feature[key] = tf.train.Feature(bytes_list=tf.train.BytesList(value=value.tolist()))
+    elif value.dtype.kind in 'iu':
+      feature[key] = tf.train.Feature(int64_list=tf.train.Int64List(value=value))
+    else:
+      feature[key] = tf.train.Feature(float_list=tf.train.FloatList(value=value))
+  return tf.train.Example(features=tf.train.Features(feature=feature))
+
+
+def convert_shard(source: str, destination: str, features: dict, batch_size: int = 1024):
+  """Rewrite a gzipped float shard as a compact shard; return the number of records.
+
+  features parses the source, eg naip_features(kernel_size); features other
+  than the NAIP bands are copied as they are."""
+  dataset = tf.data.TFRecordDataset(source, compression_type='GZIP').batch(batch_size)
+  dataset = dataset.map(lambda records: tf.io.parse_example(records, features))
+  options = tf.io.TFRecordOptions(compression_type='GZIP')
+  n_records = 0
+  with tf.io.TFRecordWriter(destination, options) as writer:
+    for batch in dataset.as_numpy_iterator():
+      for i in range(len(batch['cliff_id'])):
+        example = encode_compact({key: values[i] for key, values in batch.items()})
+        writer.write(example.SerializeToString())
+        n_records += 1
+  return n_records
+
+
+def main():
+  """Convert the NAIP shards exported by cliff_naip into compact shards."""
+  from tqdm import tqdm
+  from big_wall_finder import definitions
+  os.makedirs(definitions.NAIP_COMPACT_DIR, exist_ok=True)
+  features = naip_features(definitions.NAIP_KERNEL_SIZE)
+  sources = sorted(glob.glob(os.path.join(definitions.NAIP_DATA_DIR, '*.tfrecord.gz')))
+  for source in tqdm(sources):
+    destination = os.path.join(definitions.NAIP_COMPACT_DIR, os.path.basename(source))
+    convert_shard(source, destination, features)
+
+
+if __name__ == '__main__':
+  main()
@@ -7,7 +7,8 @@ KERNEL_SIZE = 8
 
 NAIP_KEYS = ['R', 'G', 'B', 'N']
 NAIP_VALUES = [flf(shape=(KERNEL_SIZE, KERNEL_SIZE), dtype=tf.float32) for _ in NAIP_KEYS]
-# TODO: Is it possible to use uint8 rather than tf.float?
+# NAIP bands are integers in [0, 255]; see naip_dataset.compact_features for
+# shards storing them as uint8.
 
 SCALAR_KEYS = ['height', 'pixel_count', 'mp_score', 'cliff_id']
 SCALAR_VALUES = [flf(shape=(1,), dtype=tf.float32) for _ in SCALAR_KEYS]
@@ -0,0 +1,149 @@
+"""Convert NAIP TFRecord shards into memory-mapped NumPy arrays indexed by cliff_id."""
+
+from __future__ import annotations
+from dataclasses import dataclass
+import os
+import numpy as np
+import tensorflow as tf
+from big_wall_finder.models.cnn import naip_dataset
+
+
+PATCHES = 'patches.npy'
+CLIFF_IDS = 'cliff_ids.npy'
+OFFSETS = 'offsets.npy'
+
+
+def read_cliff_ids(filenames, batch_size: int = 4096, compression_type: str = 'GZIP'):
+  """Cliff id of each record of the shards, in order."""
+  features = {'cliff_id': tf.io.FixedLenFeature([], dtype=tf.string)}
+  dataset = tf.data.TFRecordDataset(list(filenames), compression_type=compression_type)
+  dataset = dataset.batch(batch_size).map(lambda records: tf.io.parse_example(records, features))
+  batches = [batch['cliff_id'] for batch in dataset.as_numpy_iterator()]
+  return np.concatenate(batches).astype(str) if batches else np.array([], dtype=str)
+
+
+def build_store(filenames, directory: str, features: dict, bands=None, decode=None,
+                batch_size: int = 1024, dtype='float32', compression_type: str = 'GZIP'):
+  """Write the records of shards into a tensor store; return the number of rows.
+
+  features and decode are as for naip_dataset.build_dataset, eg
+  naip_features(kernel_size) for float shards or compact_features() with
+  decode_compact(kernel_size) for compact ones. Rows are sorted by cliff id, and
+  rows offsets[i]:offsets[i + 1] of patches.npy hold the patches of
+  cliff_ids[i]. Features other than bands and cliff_id are stored as scalar
+  columns, one .npy file each."""
+  bands = naip_dataset.NAIP_BANDS if bands is None else list(bands)
+  filenames = list(filenames)
+  # first pass: the row of each record once sorted by cliff id
+  cliff_ids = read_cliff_ids(filenames, compression_type=compression_type)
+  order = np.argsort(cliff_ids, kind='stable')
+  rows = np.empty(len(order), dtype=np.int64)
+  rows[order] = np.arange(len(order))
+  unique_ids, counts = np.unique(cliff_ids[order], return_counts=True)
+  offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+  # second pass: scattering the parsed batches to their rows
+  os.makedirs(directory, exist_ok=True)
+  patches = scalars = None
+  dataset = tf.data.TFRecordDataset(filenames, compression_type=compression_type)
+  dataset = dataset.batch(batch_size).map(lambda records: tf.io.parse_example(records, features))
+  if decode is not None:
+    dataset = dataset.map(decode)
+  start = 0
+  for batch in dataset.as_numpy_iterator():
+    stacked = np.stack([batch[band] for band in bands], axis=-1)
+    if patches is None:
+      patches = np.lib.format.open_memmap(os.path.join(directory, PATCHES), mode='w+',
+                                          dtype=dtype, shape=(len(rows),) + stacked.shape[1:])
+      scalars = {key: np.empty(len(rows), dtype=batch[key].dtype) for key in batch
+                 if key not in bands and key != 'cliff_id'}
+    batch_rows = rows[start:start + len(stacked)]
+    patches[batch_rows] = stacked
+    for key, column in scalars.items():
+      column[batch_rows] = batch[key].reshape(len(stacked))
+    start += len(stacked)
+
+  if patches is None:
+    raise ValueError('No records in the shards.')
+  patches.flush()
+  del patches
+  for key, column in scalars.items():
+    np.save(os.path.join(directory, key + '.npy'), column)
+  np.save(os.path.join(directory, CLIFF_IDS), unique_ids)
+  np.save(os.path.join(directory, OFFSETS), offsets)
+  return len(rows)
+
+
+@dataclass
+class TensorStore:
+  """Memory-mapped patches, scalar columns, and cliff index of a store."""
+  patches: np.ndarray
+  scalars: dict[str, np.ndarray]
+  cliff_ids: np.ndarray
+  offsets: np.ndarray
+
+  @classmethod
+  def load(cls, directory: str):
+    """Open a store written by build_store without reading its patches."""
+    scalars = {}
+    for name in sorted(os.listdir(directory)):
+      if name.endswith('.npy') and name not in [PATCHES, CLIFF_IDS, OFFSETS]:
+        scalars[name[:-4]] = np.load(os.path.join(directory, name), mmap_mode='r')
+    return cls(np.load(os.path.join(directory, PATCHES), mmap_mode='r'), scalars,
+               np.load(os.path.join(directory, CLIFF_IDS)),
+               np.load(os.path.join(directory, OFFSETS)))
+
+  def __len__(self):
+    return len(self.patches)
+
+  def rows(self, cliff_id: str):
+    """Slice of the rows of a cliff, or an empty slice if it has none."""
+    i = np.searchsorted(self.cliff_ids, cliff_id)
+    if i == len(self.cliff_ids) or self.cliff_ids[i] != cliff_id:
+      return slice(0, 0)
+    return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+  def cliff(self, cliff_id: str):
+    """View of the patches of a cliff."""
+    return self.patches[self.rows(cliff_id)]
+
+  def row_cliff_ids(self):
+    """Cliff id of each row."""
+    return np.repeat(self.cliff_ids, np.diff(self.offsets))
+
+  def take(self, rows):
+    """Patches and scalars of arbitrary rows, read in ascending order."""
+    rows = np.asarray(rows)
+    order = np.argsort(rows, kind='stable')
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    # sorted reads are sequential within the file
+    patches = self.patches[rows[order]][inverse]
+    return patches, {key: np.asarray(column[rows]) for key, column in self.scalars.items()}
+
+  def batches(self, batch_size: int, shuffle: bool = False, seed=None):
+    """Yield views of consecutive rows, in a random order of batches if shuffling.
+
+    Batches are slices of the memory map, so no patches are copied; shuffling
+    the order of the batches rather than of the rows keeps each read
+    sequential. Use take for batches of rows drawn at random."""
+    starts = np.arange(0, len(self), batch_size)
+    if shuffle:
+      starts = np.random.default_rng(seed).permutation(starts)
+    for start in starts:
+      rows = slice(int(start), int(start) + batch_size)
+      yield self.patches[rows], {key: column[rows] for key, column in self.scalars.items()}
+
+
+def main():
+  """Build a tensor store of the compact NAIP shards."""
+  import glob
+  from big_wall_finder import definitions
+  filenames = sorted(glob.glob(os.path.join(definitions.NAIP_COMPACT_DIR, '*.tfrecord.gz')))
+  n_rows = build_store(filenames, definitions.NAIP_STORE_DIR, naip_dataset.compact_features(),
+                       decode=naip_dataset.decode_compact(definitions.NAIP_KERNEL_SIZE))
+  print(f'Stored {n_rows} patches in {definitions.NAIP_STORE_DIR}.')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,101 @@
+"""Fit several models on one split and rank unexplored cliffs by their weighted scores.
+
+An Ensemble splits the cached feature matrix once and shares it between all
+members. Members are fit, scored, and run on every cliff concurrently on a pool
+of threads; sklearn and xgboost release the GIL while fitting and predicting,
+and threads share the matrix without copying it. The results table holds the
+score of each member and their weighted sum, summary_score, for the cliffs
+with no Mountain Project entries yet, best first. The members table holds the
+train and test scores of each member and the seconds spent fitting and
+predicting.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+import concurrent.futures
+import copy
+import time
+import numpy as np
+import pandas as pd
+from big_wall_finder import tables
+from big_wall_finder.models import predict
+
+
+# columns of merged_data copied into the results
+RESULT_COLUMNS = ['latitude', 'longitude', 'height', 'geo_id', 'mp_score']
+RESULTS_PATH = '../data/ensemble_results.csv'
+
+
+@dataclass
+class MemberResult:
+  """Scores and timing of one fitted member."""
+  name: str
+  weight: float
+  train_score: float
+  test_score: float
+  fit_seconds: float
+  predict_seconds: float
+  predictions: np.ndarray
+
+
+@dataclass
+class EnsembleResults:
+  """Ranked unexplored cliffs and the scores and timing of each member."""
+  results: pd.DataFrame
+  members: pd.DataFrame
+
+  def write(self, path: str = RESULTS_PATH):
+    """Write the results table."""
+    tables.write_table(self.results, path)
+
+
+class Ensemble():
+  """Weighted ensemble of models sharing one train test split."""
+
+  def __init__(self, names, weights=None, params=None, random_state=None):
+    weights = [1.0] * len(names) if weights is None else list(weights)
+    if len(weights) != len(names):
+      raise ValueError('Give one weight per model.')
+    self.weights = dict(zip(names, weights))
+    # building the split once; members are shallow copies sharing it
+    base = predict.Model('linear', random_state=random_state)
+    self.members = {}
+    for name in names:
+      member = copy.copy(base)
+      member.set_model(name, (params or {}).get(name))
+      self.members[name] = member
+
+  def fit_member(self, name, cache=False):
+    """Fit, score, and predict with one member."""
+    member = self.members[name]
+    start = time.perf_counter()
+    member.train(cache=cache)
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = member.get_predictions()
+    predict_seconds = time.perf_counter() - start
+    return MemberResult(name, self.weights[name],
+                        member.model.score(member.X_train, member.y_train),
+                        member.model.score(member.X_test, member.y_test),
+                        fit_seconds, predict_seconds, np.ravel(predictions))
+
+  def run(self, n_threads=None, cache=False):
+    """Fit all members concurrently and rank the unexplored cliffs."""
+    with concurrent.futures.ThreadPoolExecutor(n_threads or len(self.members)) as pool:
+      member_results = list(pool.map(lambda name: self.fit_member(name, cache),
+                                     self.members))
+
+    data = predict.load_features().data
+    results = data[[c for c in RESULT_COLUMNS if c in data]].copy()
+    if 'height' in results:
+      results.height *= 1000
+    results['summary_score'] = 0.0
+    for member in member_results:
+      results[member.name + '_score'] = member.predictions
+      results.summary_score += member.weight * member.predictions
+    results = results[results.mp_score == 0]  # omitting what is already known!
+    results = results.sort_values(by='summary_score', ascending=False, ignore_index=True)
+
+    members = pd.DataFrame([{key: value for key, value in vars(member).items()
+                             if key != 'predictions'} for member in member_results])
+    return EnsembleResults(results, members)
@@ -0,0 +1,72 @@
+"""Successive halving search of hyperparameters on growing budgets."""
+
+from __future__ import annotations
+import numpy as np
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # pylint: disable=unused-import
+from sklearn.model_selection import HalvingRandomSearchCV
+from xgboost import XGBRegressor
+from big_wall_finder.models import predict
+
+
+# budget parameter and its largest value; other models are budgeted by n_samples
+RESOURCES = {'forest': ('n_estimators', 500),
+             'xgb': ('n_estimators', 500),
+             'neural': ('epochs', 1000)}
+
+# rounds without improvement of the held out score before stopping
+EARLY_STOPPING_ROUNDS = 20
+VALIDATION_FRACTION = 0.1
+
+
+class EarlyStoppingXGBRegressor(XGBRegressor):
+  """XGBRegressor which holds out part of its training data to stop boosting early."""
+
+  def fit(self, X, y, sample_weight=None, **kwargs):  # pylint: disable=arguments-differ
+    X, y = np.asarray(X), np.asarray(y)
+    indices = np.random.default_rng(0).permutation(len(y))
+    n_validation = max(1, int(VALIDATION_FRACTION * len(y)))
+    validation, train = indices[:n_validation], indices[n_validation:]
+    if sample_weight is not None:
+      sample_weight = np.asarray(sample_weight)
+      kwargs['sample_weight_eval_set'] = [sample_weight[validation]]
+      sample_weight = sample_weight[train]
+    return super().fit(X[train], y[train], sample_weight=sample_weight,
+                       eval_set=[(X[validation], y[validation])], verbose=False, **kwargs)
+
+
+def with_early_stopping(name, estimator):
+  """Copy an estimator of a model so that it stops training early, if it can."""
+  if name == 'xgb':
+    return EarlyStoppingXGBRegressor(**estimator.get_params()).set_params(
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+  estimator = clone(estimator)
+  if name == 'neural':
+    from tensorflow.keras.callbacks import EarlyStopping
+    estimator.set_params(validation_split=VALIDATION_FRACTION,
+                         callbacks=[EarlyStopping(patience=EARLY_STOPPING_ROUNDS,
+                                                  restore_best_weights=True)])
+  return estimator
+
+
+def halving_search(name, estimator, random_grid, X, y, n_candidates, n_folds=5,
+                   verbose=1, n_jobs=2, factor=3, random_state=None, sample_weight=None):
+  """Search random hyperparameters by successive halving.
+
+  Returns the best parameters among the keys of random_grid, as
+  RandomizedSearchCV would. sample_weight is passed on to the fits of
+  estimators which take it."""
+
+  resource, max_resources = RESOURCES.get(name, ('n_samples', 'auto'))
+  # the budget cannot also be searched; its largest value is the full budget
+  grid = {key: values for key, values in random_grid.items() if key != resource}
+  rs = HalvingRandomSearchCV(estimator=with_early_stopping(name, estimator),
+                             param_distributions=grid, n_candidates=n_candidates,
+                             resource=resource, max_resources=max_resources,
+                             min_resources='exhaust', factor=factor, cv=n_folds,
+                             verbose=verbose, n_jobs=n_jobs, random_state=random_state)
+  if sample_weight is not None and predict.accepts_sample_weight(name, estimator):
+    rs.fit(X, y, sample_weight=sample_weight)
+  else:
+    rs.fit(X, y)
+  return {key: value for key, value in rs.best_params_.items() if key in random_grid}
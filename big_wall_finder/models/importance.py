@@ -0,0 +1,62 @@
+"""Permutation importance of the features of any fitted model, on a process pool."""
+
+from __future__ import annotations
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from sklearn.metrics import r2_score
+from tqdm import tqdm
+
+
+# estimator, test set, and baseline score held by each worker
+worker_state = {}
+
+
+def init_worker(estimator, X: pd.DataFrame, y: np.ndarray, baseline: float):
+  """Hold a private copy of the test matrix within a worker."""
+  values = np.array(X.to_numpy(), order='C')
+  worker_state.update(estimator=estimator, values=values, y=y, baseline=baseline,
+                      # edits to values show through this view
+                      X=pd.DataFrame(values, index=X.index, columns=X.columns, copy=False))
+
+
+def score_feature(column: int, n_repeats: int, seed: np.random.SeedSequence):
+  """Drops in score when shuffling one column, restoring it afterwards."""
+  values, rng = worker_state['values'], np.random.default_rng(seed)
+  original = values[:, column].copy()
+  drops = []
+  try:
+    for _ in range(n_repeats):
+      values[:, column] = original[rng.permutation(len(original))]
+      predictions = worker_state['estimator'].predict(worker_state['X'])
+      drops.append(worker_state['baseline'] - r2_score(worker_state['y'], np.ravel(predictions)))
+  finally:
+    values[:, column] = original
+  return drops
+
+
+def permutation_importance(estimator, X: pd.DataFrame, y, n_repeats: int = 5,
+                           n_processes: int = 1, random_state=0):
+  """Permutation importance of each column of X, most important first."""
+  y = np.asarray(y)
+  baseline = r2_score(y, np.ravel(estimator.predict(X)))
+  seeds = np.random.SeedSequence(random_state).spawn(X.shape[1])
+
+  if n_processes == 1:
+    init_worker(estimator, X, y, baseline)
+    try:
+      drops = [score_feature(j, n_repeats, seeds[j]) for j in tqdm(range(X.shape[1]))]
+    finally:
+      # not keeping the estimator and test matrix alive after the call
+      worker_state.clear()
+  else:
+    with concurrent.futures.ProcessPoolExecutor(
+        n_processes, initializer=init_worker, initargs=(estimator, X, y, baseline)) as pool:
+      futures = [pool.submit(score_feature, j, n_repeats, seeds[j]) for j in range(X.shape[1])]
+      drops = [future.result() for future in tqdm(futures)]
+
+  drops = np.array(drops)
+  importance = pd.DataFrame({'feature': X.columns,
+                             'importance': drops.mean(axis=1),
+                             'std': drops.std(axis=1)})
+  return importance.sort_values('importance', ascending=False, ignore_index=True)
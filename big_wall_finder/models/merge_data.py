@@ -1,25 +1,53 @@
+import os
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
+from big_wall_finder import tables
+from big_wall_finder.local.geometry_store import split_geometry
+
+
+# Dtypes of cliff_joined and merged_data columns; other numeric columns, ie the
+# landsat, slope, and geology features, are float32. Coordinates keep float64.
+CLIFF_SCHEMA = {'latitude': 'float64',
+                'longitude': 'float64',
+                'custom_index': 'int64',
+                'road_within_*': 'int8',
+                '*num_views': 'int32',
+                '*num_rock_routes': 'int32'}
+MERGED_SCHEMA = {'latitude': 'float64',
+                 'longitude': 'float64',
+                 'geo_id': 'int32',
+                 'cliff_id': 'str',
+                 'is_accessible': 'bool'}
+FEATURE_DTYPE = 'float32'
+# per cliff scores of the CNN, joined when present; see cnn/cliff_scores.py
+CNN_SCORES_PATH = '../data/cnn_cliff_scores.csv'
+
+
+def merge_mp(cliff, mp):
+  """Set num_views and the raw mp_score of each cliff from its MP areas.
+
+  MP areas are matched to cliffs through custom_index. A cliff with at least one
+  MP area gets a raw score of 1000 plus its rock routes and views."""
+  sums = mp.groupby('custom_index')[['num_rock_routes', 'num_views']].sum()
+  has_mp = cliff.custom_index.isin(sums.index).to_numpy()
+  sums = sums.reindex(cliff.custom_index, fill_value=0)
+  num_views = sums.num_views.to_numpy()
+  cliff['mp_score'] = np.where(has_mp, 1000 + sums.num_rock_routes.to_numpy() + num_views, 0)
+  cliff['num_views'] = np.where(has_mp, num_views, 0)
+  return cliff
+
 
 def prepare_big_wall_data():
   """Merge and clean the datasets calculated with earth engine.
 
   See the notebook explore_data.ipynb for a detailed discussion.
   """
-  cliff = pd.read_csv('../data/cliff_joined.csv')
-  mp = pd.read_csv('../data/mp_joined.csv')
+  cliff = tables.read_table('../data/cliff_joined.csv', CLIFF_SCHEMA, FEATURE_DTYPE)
+  mp = tables.read_table('../data/mp_joined.csv')
 
   # Merging cliff with mp.
   print('Merging....')
-  cliff['mp_score'] = 0
-  cliff['num_views'] = 0
-  for i, row in tqdm(cliff.iterrows(), total=cliff.shape[0]):
-    filtered = mp[mp.custom_index == row.custom_index]
-    mp_count = filtered.shape[0]
-    if mp_count:
-      cliff.at[i, 'num_views'] = filtered.num_views.sum()
-      cliff.at[i, 'mp_score'] = 1000 + filtered.num_rock_routes.sum() + filtered.num_views.sum()
+  cliff = merge_mp(cliff, mp)
 
   # Giving mp_score a log-weighting; it now takes on values between 0 and 1.
   # A score with 1 is as good as el cap.
@@ -53,6 +81,9 @@ def prepare_big_wall_data():
 
   cliff['is_accessible'] = accessible
 
+  # Keeping the earth engine id of each cliff, the cliff_id of its NAIP patches.
+  cliff = cliff.rename(columns={'system:index': 'cliff_id'})
+
   # Dropping all the stuff we don't need.
   cliff.drop(columns=['road_within_500m',
                       'road_within_1000m',
@@ -64,14 +95,19 @@ def prepare_big_wall_data():
                       'num_views',
                       'vicinity_num_rock_routes',
                       'vicinity_num_views',
-                      'system:index',
                       'custom_index',
                       'vicinity_mp_areas'], inplace=True)
 
-  return cliff
+  return tables.apply_schema(cliff, MERGED_SCHEMA, FEATURE_DTYPE)
 
 
 if __name__ == '__main__':
   merged = prepare_big_wall_data()
+  if os.path.exists(CNN_SCORES_PATH):
+    from big_wall_finder.models.cnn import cliff_scores
+    scores = tables.read_table(CNN_SCORES_PATH, {'cliff_id': 'str'})
+    merged = cliff_scores.join_scores(merged, scores)
   print('Writing....')
-  merged.to_csv('../data/merged_data.csv', header=True, index=False)
+  # footprints go to a memory-mapped store; the table only keeps a geo_id
+  merged = split_geometry(merged, '../data/geometry')
+  tables.write_table(merged, '../data/merged_data.csv')
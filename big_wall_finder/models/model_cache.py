@@ -0,0 +1,95 @@
+"""Cache fitted estimators on disk, keyed by their training data and params.
+
+A key hashes the training matrix, the target, any sample weights, the model
+name, all params of the estimator, and the version of the library defining
+it; any change gives a new key. Estimators are pickled to one file per key.
+Loading a file marks it as recently used, and the least recently used files
+are evicted once the cache outgrows max_bytes.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+import hashlib
+import json
+import os
+import pickle
+import sys
+import numpy as np
+import pandas as pd
+
+
+CACHE_DIR = 'model_cache'
+MAX_BYTES = 2 ** 31
+
+
+def fingerprint(X: pd.DataFrame, y: pd.Series, name: str, estimator, sample_weight=None):
+  """Hash everything which determines a fitted estimator."""
+  library = type(estimator).__module__.split('.')[0]
+  params = json.dumps(estimator.get_params(), sort_keys=True, default=str)
+  digest = hashlib.blake2b(digest_size=16)
+  digest.update(json.dumps([name, library, getattr(sys.modules[library], '__version__', None),
+                            params, list(map(str, X.columns)), str(y.name)]).encode())
+  digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+  digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+  if sample_weight is not None:
+    digest.update(b'sample_weight')
+    digest.update(np.ascontiguousarray(sample_weight, dtype=np.float64).tobytes())
+  return digest.hexdigest()
+
+
+@dataclass
+class ModelCache:
+  """Directory of pickled estimators evicted by least recent use."""
+  directory: str = CACHE_DIR
+  max_bytes: int = MAX_BYTES
+
+  def path(self, key: str):
+    """Path of the file holding an estimator."""
+    return os.path.join(self.directory, key + '.pkl')
+
+  def get(self, key: str):
+    """Load the estimator of key, or None if it is not cached."""
+    path = self.path(key)
+    try:
+      with open(path, 'rb') as f:
+        estimator = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+      return None
+    try:
+      os.utime(path)  # marking as recently used
+    except FileNotFoundError:
+      pass  # evicted since it was loaded
+    return estimator
+
+  def put(self, key: str, estimator):
+    """Store an estimator, then evict old ones beyond max_bytes."""
+    os.makedirs(self.directory, exist_ok=True)
+    path = self.path(key)
+    # writing to a temporary file so that readers never see half an estimator
+    with open(path + '.tmp', 'wb') as f:
+      pickle.dump(estimator, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+    self.evict(keep=path)
+
+  def evict(self, keep: str | None = None):
+    """Delete the least recently used estimators until the cache fits."""
+    entries = []
+    for entry in os.scandir(self.directory):
+      if entry.name.endswith('.pkl'):
+        # another thread or process may evict the file meanwhile
+        try:
+          stat = entry.stat()
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+      if total <= self.max_bytes:
+        break
+      if path != keep:
+        try:
+          os.remove(path)
+        except FileNotFoundError:
+          pass  # already evicted
+        total -= size
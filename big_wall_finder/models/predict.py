@@ -1,136 +1,424 @@
-
-
-
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+import copy
+import functools
+import importlib
 import json
 import os
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from xgboost import XGBRegressor
-from sklearn.linear_model import LinearRegression, Ridge, Lasso
-from sklearn.neighbors import KNeighborsRegressor
-from sklearn.tree import DecisionTreeRegressor
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import RandomizedSearchCV
-from imblearn.over_sampling import RandomOverSampler #, SMOTE, SVMSMOTE, ADASYN
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Dropout
-from tensorflow.keras.wrappers.scikit_learn import KerasRegressor
-from tensorflow.keras.optimizers import Adam, SGD, RMSprop
 
+if TYPE_CHECKING:
+  import pandas as pd
+
+
+DATA_PATH = '../data/merged_data.csv'
+PARAMS_PATH = 'best_params.json'
+JOURNAL_PATH = 'tuning_journal.jsonl'
+RESULTS_PATH = '../data/results.csv'
+
+# Columns of merged_data.csv which are not model features. Footprints are kept
+# in the geometry store and referenced through geo_id; older tables hold .geo.
+NON_FEATURES = ['latitude', 'longitude', 'is_accessible', '.geo', 'geo_id', 'cliff_id',
+                'mp_score']
+
+# Estimators are imported on first use; importing sklearn, xgboost, and
+# tensorflow takes seconds. The neural model is built with tf.keras.
+MODELS = {'linear': 'sklearn.linear_model.LinearRegression',
+          'ridge': 'sklearn.linear_model.Ridge',
+          'lasso': 'sklearn.linear_model.Lasso',
+          'knn': 'sklearn.neighbors.KNeighborsRegressor',
+          'tree': 'sklearn.tree.DecisionTreeRegressor',
+          'forest': 'sklearn.ensemble.RandomForestRegressor',
+          'xgb': 'xgboost.XGBRegressor',
+          'neural': None}
+
+
+# Hyperparameter grids for random search; linear has no hyperparameters.
+FOREST_GRID = {'max_features': ['auto', 'sqrt'],
+               'max_depth': [4, 5, 6, 7, 8, 9, 10, None],
+               'min_samples_split': [2, 3, 4, 5],
+               'min_samples_leaf': [1, 2, 3, 4, 5],
+               'bootstrap': [True, False]}
+
+LASSO_GRID = {'alpha': [.0001, .0002, .0005, .001, .002, .005, .01, .1, 1, 10],
+              'tol': [2.5],
+              'max_iter': [5000]}  # doesn't converge with default values
+
+RIDGE_GRID = {'alpha': [0.1, 1, 2, 5, 10, 20, 50, 100]}
+
+KNN_GRID = {'n_neighbors': [8, 16, 32, 64, 128],
+            'p': [1, 1.5, 2, 2.5]}
+
+TREE_GRID = {'ccp_alpha': [0, .005, .01, .02, .05, .1],
+             'max_features': ['auto', 'sqrt'],
+             'max_depth': [3, 4, 5, 6, 7, None],
+             'min_samples_split': [2, 3, 4, 5],
+             'min_samples_leaf': [1, 2, 3, 4]}
+
+XGB_GRID = {'max_depth': [3, 4, 5, 6, 7, 8, 9, None],
+            'min_child_weight': [1, 2, 4, 6, 8, 10],
+            # learning_rate = eta; should increase n_estimators with low eta
+            'learning_rate': [.01, .03, .05, .1, .2],
+            'subsample': [.7, .75, .8, .85, .9],
+            'colsample_bytree': [.7, .75, .8, .85, .9]}
+
+NEURAL_GRID = {'epochs': [10, 30, 100, 300, 1000],
+               'batch_size': [8, 16, 32, 64],
+               'learning_rate': [.001, .01, .1, .5],
+               'dropout_rate': [0, 0.05, 0.1, 0.15, 0.2],
+               'neurons': [100, 200, 300, 400],
+               'optimizer': ['sgd', 'rmsprop', 'adam'],
+               'activation': ['relu', 'tanh']}
+
+RANDOM_GRIDS = {'ridge': RIDGE_GRID,
+                'lasso': LASSO_GRID,
+                'knn': KNN_GRID,
+                'tree': TREE_GRID,
+                'forest': FOREST_GRID,
+                'xgb': XGB_GRID,
+                'neural': NEURAL_GRID}
+
+
+def import_model(name):
+  """Import the estimator class of a model."""
+  module, _, class_name = MODELS[name].rpartition('.')
+  return getattr(importlib.import_module(module), class_name)
+
+
+def build_estimator(name, n_features):
+  """Build the estimator of a model with default hyperparameters."""
+  if name != 'neural':
+    return import_model(name)()
+
+  # Using vanilla tf.keras model
+  from tensorflow.keras.models import Sequential
+  from tensorflow.keras.layers import Dense, Dropout
+  from tensorflow.keras.wrappers.scikit_learn import KerasRegressor
+  from tensorflow.keras.optimizers import Adam, SGD, RMSprop
+
+  def build_fn(dropout_rate=0, optimizer='adam', activation='relu',
+               neurons=100, learning_rate=0.01):
+    model = Sequential()
+    model.add(Dense(neurons, input_dim=n_features, activation=activation))
+    model.add(Dropout(dropout_rate))
+    model.add(Dense(1))
+    opt_dict = {'adam': Adam(learning_rate=learning_rate),
+                'sgd': SGD(learning_rate=learning_rate),
+                'rmsprop': RMSprop(learning_rate=learning_rate)}
+
+    model.compile(loss='mean_squared_error', optimizer=opt_dict[optimizer])
+    return model
+  return KerasRegressor(build_fn=build_fn, verbose=1)
+
+
+def balanced_weights(y):
+  """Weight rows inversely to the size of their class of mp_score.
+
+  Classes are those of the oversampling in set_train_test; every class gets
+  the same total weight, and the weights average to one."""
+  import numpy as np
+  # Discretizing the continuous target variable mp_score to create 10 integer classes.
+  _, classes, counts = np.unique(np.ceil(10 * np.asarray(y)).astype('int32'),
+                                 return_inverse=True, return_counts=True)
+  return len(classes) / (len(counts) * counts[classes])
+
+
+def accepts_sample_weight(name, estimator):
+  """Whether the fit of an estimator takes sample_weight."""
+  from sklearn.utils.validation import has_fit_parameter
+  # KerasRegressor passes it on to Sequential.fit through **kwargs
+  return name == 'neural' or has_fit_parameter(estimator, 'sample_weight')
+
+
+def weighted_indices(sample_weight, seed=0):
+  """Draw as many row indices as rows, each with probability proportional to its weight."""
+  import numpy as np
+  p = np.asarray(sample_weight) / np.sum(sample_weight)
+  return np.sort(np.random.default_rng(seed).choice(len(p), size=len(p), p=p))
+
+
+@dataclass(frozen=True)
+class Features:
+  """Features and targets of merged_data, shared by all Model instances."""
+  data: pd.DataFrame  # all cliffs
+  X: pd.DataFrame  # features of accessible cliffs
+  y: pd.Series  # mp_score of accessible cliffs
+  X_pred: pd.DataFrame  # features of all cliffs
+
+
+@dataclass
+class IncrementalReport:
+  """Timing and test scores of an incremental retraining."""
+  n_changed: int  # changed rows found in the train or test set
+  incremental_seconds: float
+  incremental_score: float
+  full_seconds: float | None = None  # of a refit from scratch, when compared
+  full_score: float | None = None
+
+  @property
+  def seconds_saved(self):
+    """Seconds saved over the full refit, or None if it was not compared."""
+    return None if self.full_seconds is None else self.full_seconds - self.incremental_seconds
+
+  def within(self, tolerance):
+    """Whether the incremental test score is at most tolerance below the full refit."""
+    return self.full_score is None or self.incremental_score >= self.full_score - tolerance
+
+
+@functools.lru_cache(maxsize=None)
+def load_features():
+  """Load merged_data and split off its features once."""
+  from big_wall_finder import tables
+  from big_wall_finder.models import merge_data
+  data = tables.read_table(DATA_PATH, merge_data.MERGED_SCHEMA, merge_data.FEATURE_DTYPE)
+  X_pred = data.drop(columns=NON_FEATURES, errors='ignore')
+  accessible = data.is_accessible.to_numpy()
+  return Features(data, X_pred[accessible], data.mp_score[accessible], X_pred)
+
+
+@functools.lru_cache(maxsize=None)
+def load_best_params():
+  """Load the hyperparameters saved by tune_all_hyperparameters, if any."""
+  if not os.path.exists(PARAMS_PATH):
+    return None
+  with open(PARAMS_PATH) as f:
+    best_params = json.load(f)
+
+  # Adding in a few extra "best" parameters
+  best_params['forest']['n_estimators'] = 500
+  best_params['forest']['n_jobs'] = -1
+  best_params['xgb']['n_estimators'] = 500
+  best_params['xgb']['n_jobs'] = -1
+
+  # Putting in temporarily empty 'neural' params
+  best_params['neural'] = {}
+  return best_params
 
 
 class Model():
   """Apply various ML models on cliff data."""
 
   # Static variables and class methods
-  data = pd.read_csv('../data/merged_data.csv')
-  accessible = data[data.is_accessible]
-
-  models = {'linear': LinearRegression,
-            'ridge': Ridge,
-            'lasso': Lasso,
-            'knn': KNeighborsRegressor,
-            'tree': DecisionTreeRegressor,
-            'forest': RandomForestRegressor,
-            'xgb': XGBRegressor,
-            'neural': None}
-
-  best_params = None
-  if os.path.exists('best_params.json'):
-    with open('best_params.json') as f:
-      best_params = json.load(f)
-
-    # Adding in a few extra "best" parameters
-    best_params['forest']['n_estimators'] = 500
-    best_params['forest']['n_jobs'] = -1
-    best_params['xgb']['n_estimators'] = 500
-    best_params['xgb']['n_jobs'] = -1
-
-    # Putting in temporarily empty 'neural' params
-    best_params['neural'] = {}
-
+  models = MODELS
+  sample_weight = None  # per row weights of the training set when balancing by weights
 
   @classmethod
-  def tune_all_hyperparameters(cls, n_iter, save=True):
-    """Search over random hyperparameters for each model and save best."""
+  def tune_all_hyperparameters(cls, n_iter, save=True, n_processes=1, halving=False,
+                                journal_path=None, create_balanced=False):
+    """Search over random hyperparameters for each model and save best.
+
+    With n_processes > 1 the candidates of all models are cross validated
+    together on one pool of processes; see tuning.tune_in_pool. With a
+    journal_path, such as JOURNAL_PATH, every fold score is also written there
+    as it finishes, and an interrupted search is resumed from it. With halving
+    each model is searched by successive halving instead. create_balanced is
+    passed on to each Model."""
+    if halving and (n_processes > 1 or journal_path):
+      raise ValueError('Successive halving does not run on the shared pool.')
     best_params = {}
-    for model_name in cls.models:
-      m = cls(model_name)
-      params = m.test_random_hyperparameters(n_iter=n_iter)
-      best_params[model_name] = params
-      m.model.set_params(**params)
-      m.print_evaluate_hyperparameters()
+    if n_processes > 1 or journal_path:
+      from big_wall_finder.models import tuning
+      # all models share one train test split, placed in shared memory; a
+      # resumed search must see the same split as the journal
+      base = cls('linear', random_state=0, create_balanced=create_balanced)
+      best_params = tuning.tune_in_pool(base.X_train, base.y_train, n_iter,
+                                        n_processes=n_processes,
+                                        journal_path=journal_path,
+                                        sample_weight=base.sample_weight)
+      for model_name, params in best_params.items():
+        m = copy.copy(base)
+        m.set_model(model_name)
+        m.model.set_params(**params)
+        m.print_evaluate_hyperparameters()
+
+    else:
+      for model_name in cls.models:
+        m = cls(model_name, create_balanced=create_balanced)
+        params = m.test_random_hyperparameters(n_iter=n_iter, halving=halving)
+        best_params[model_name] = params
+        m.model.set_params(**params)
+        m.print_evaluate_hyperparameters()
     if save:
-      if os.path.exists('best_params.json'):
-        os.rename('best_params.json', 'best_params_old.json')
-      with open('best_params.json', 'w') as f:
+      if os.path.exists(PARAMS_PATH):
+        os.rename(PARAMS_PATH, 'best_params_old.json')
+      with open(PARAMS_PATH, 'w') as f:
         json.dump(best_params, f, indent=2)
+      load_best_params.cache_clear()
 
     return best_params
 
 
-  def __init__(self, name, params=None):
-    self.name = name
-    self.X_train, self.X_test, self.y_train, self.y_test = self.set_train_test()
-
-    if name in self.__class__.models:
-      if name == 'neural':
-        # Using vanilla tf.keras model
-        def build_fn(dropout_rate=0, optimizer='adam', activation='relu',
-                     neurons=100, learning_rate=0.01):
-          model = Sequential()
-          model.add(Dense(neurons, input_dim=self.X_train.shape[1],
-                          activation=activation))
-          model.add(Dropout(dropout_rate))
-          model.add(Dense(1))
-          opt_dict = {'adam': Adam(learning_rate=learning_rate),
-                      'sgd': SGD(learning_rate=learning_rate),
-                      'rmsprop': RMSprop(learning_rate=learning_rate)}
-
-          model.compile(loss='mean_squared_error', optimizer=opt_dict[optimizer])
-          return model
-        self.model = KerasRegressor(build_fn=build_fn, verbose=1)
-
-      else:
-        self.model = self.__class__.models[name]()  # initializing model here
-    else:
+  def __init__(self, name, params=None, random_state=None, create_balanced=False):
+    self.X_train, self.X_test, self.y_train, self.y_test = \
+        self.set_train_test(create_balanced=create_balanced, random_state=random_state)
+    self.set_model(name, params)
+
+  def set_model(self, name, params=None):
+    """Build a new estimator with params, or the best params if none given."""
+    if name not in self.__class__.models:
       raise TypeError(f'Unknown model! The only known models are: {self.__class__.models.keys()}')
+    self.name = name
+    self.model = self.build_model()  # initializing model here
+
+    best_params = load_best_params()
     if params:
       self.model.set_params(**params)  # may throw error if keyword not viable
-    elif self.__class__.best_params:
-      self.model.set_params(**self.__class__.best_params[self.name])
+    elif best_params:
+      self.model.set_params(**best_params[self.name])
+
+  def build_model(self):
+    """Build the estimator with default hyperparameters."""
+    return build_estimator(self.name, self.X_train.shape[1])
+
+  def set_train_test(self, train_size=0.9, create_balanced=False, random_state=None):
+    """Create balanced classes by oversampling.
 
-  def set_train_test(self, train_size=0.9, create_balanced=False):
-    """Create balanced classes by oversampling."""
+    With create_balanced='weights' the training set is left as is, and
+    sample_weight is set to weights balancing the same classes instead."""
+    import numpy as np
 
-    # Creating the train test split.
-    X = self.__class__.accessible.drop(columns=['latitude', 'longitude', 'is_accessible',
-                                                '.geo', 'mp_score'])
-    y = self.__class__.accessible.mp_score
-    mask = np.random.rand(len(X)) < train_size
+    # Creating the train test split from the cached features.
+    features = load_features()
+    X, y = features.X, features.y
+    mask = np.random.RandomState(random_state).rand(len(X)) < train_size
     X_train, X_test, y_train, y_test = X[mask], X[~mask], y[mask], y[~mask]
+    self.sample_weight = None
 
     if not create_balanced:
       return X_train, X_test, y_train, y_test
 
+    if create_balanced == 'weights':
+      self.sample_weight = balanced_weights(y_train)
+      return X_train, X_test, y_train, y_test
+
     # Discretizing the continuous target variable mp_score to create 10 integer classes.
     y_train_discretized = np.ceil(10 * y_train).astype('int32')
 
     # Grabbing an equal number of samples from each class
+    from imblearn.over_sampling import RandomOverSampler  # , SMOTE, SVMSMOTE, ADASYN
     model = RandomOverSampler()
     X_train, _ = model.fit_resample(X_train, y_train_discretized)
 
     # Back to the continuous targets which were kept in X.
     indices = model.sample_indices_
-    y_train = y.iloc[indices]
+    y_train = y_train.iloc[indices]
 
     return X_train, X_test, y_train, y_test
 
 
-  def train(self):
-    """Train the model."""
-    self.model.fit(self.X_train, self.y_train)
+  def fit(self):
+    """Fit the model on the training set, weighted by sample_weight if set."""
+    if self.sample_weight is None:
+      self.model.fit(self.X_train, self.y_train)
+    elif accepts_sample_weight(self.name, self.model):
+      self.model.fit(self.X_train, self.y_train, sample_weight=self.sample_weight)
+    else:
+      # resampling rows by weight for estimators which cannot weight them, eg knn
+      indices = weighted_indices(self.sample_weight)
+      self.model.fit(self.X_train.iloc[indices], self.y_train.iloc[indices])
+
+  @property
+  def picklable(self):
+    """Whether the estimator pickles, to the model cache or to worker processes."""
+    return self.name != 'neural'  # the Keras model does not pickle
+
+  def train(self, cache=False):
+    """Train the model.
+
+    With cache, an estimator fitted before on the same training data with the
+    same params is loaded from model_cache instead; see model_cache.ModelCache."""
+    if not cache or not self.picklable:
+      self.fit()
+      return
+
+    from big_wall_finder.models import model_cache
+    key = model_cache.fingerprint(self.X_train, self.y_train, self.name, self.model,
+                                  self.sample_weight)
+    models = model_cache.ModelCache()
+    fitted = models.get(key)
+    if fitted is None:
+      self.fit()
+      models.put(key, self.model)
+    else:
+      self.model = fitted
+
+  def update_labels(self, delta):
+    """Replace mp_score of the rows of the train and test sets found in delta.
+
+    delta is a Series of new mp_score indexed as the rows of merged_data."""
+    n_changed = 0
+    for attribute in ['y_train', 'y_test']:
+      y = getattr(self, attribute)
+      changed = delta.index.intersection(y.index)
+      if len(changed):
+        y = y.copy()  # the split shares memory with the cached features
+        y.loc[changed] = delta.loc[changed].astype(y.dtype)
+        setattr(self, attribute, y)
+        n_changed += len(changed)
+    if self.sample_weight is not None:
+      self.sample_weight = balanced_weights(self.y_train)
+    return n_changed
+
+  def train_incremental(self, delta, n_estimators=50, epochs=10, compare=False,
+                        tolerance=0.01):
+    """Update the labels of changed rows and continue training the fitted model.
+
+    A forest grows n_estimators more trees with warm_start, xgb boosts
+    n_estimators more rounds from its booster, and the neural model is fine
+    tuned for a few epochs from its weights; other models are cheap and refit.
+    The params of the estimator are then restored, so a later train fits as
+    many trees or rounds as before. With compare, a copy is also refit from
+    scratch to report the time saved and to check that the test score is
+    within tolerance."""
+    import time
+    from sklearn.base import clone
+    n_changed = self.update_labels(delta)
+    if compare:
+      # an unfitted copy with the current params, sharing the updated labels
+      fresh = copy.copy(self)
+      fresh.model = clone(self.model)
+      if self.name == 'forest':
+        fresh.model.set_params(warm_start=False)
+
+    original = self.model.get_params().get('n_estimators')
+    start = time.perf_counter()
+    if self.name == 'forest':
+      self.model.set_params(warm_start=True,
+                            n_estimators=len(self.model.estimators_) + n_estimators)
+      try:
+        self.fit()
+      finally:
+        # later fits start over with as many trees as before
+        self.model.set_params(warm_start=False, n_estimators=original)
+    elif self.name == 'xgb':
+      self.model.set_params(n_estimators=n_estimators)
+      kwargs = {'xgb_model': self.model.get_booster()}
+      if self.sample_weight is not None:
+        kwargs['sample_weight'] = self.sample_weight
+      try:
+        self.model.fit(self.X_train, self.y_train, **kwargs)
+      finally:
+        self.model.set_params(n_estimators=original)
+    elif self.name == 'neural':
+      # fitting the wrapper would rebuild the network; fitting the network keeps its weights
+      self.model.model.fit(self.X_train, self.y_train, epochs=epochs,
+                           sample_weight=self.sample_weight, verbose=0)
+    else:
+      self.fit()
+    report = IncrementalReport(n_changed, time.perf_counter() - start,
+                               self.model.score(self.X_test, self.y_test))
+
+    if compare:
+      start = time.perf_counter()
+      fresh.fit()
+      report.full_seconds = time.perf_counter() - start
+      report.full_score = fresh.model.score(self.X_test, self.y_test)
+      print(f'Incremental {self.name}: {report.incremental_seconds:.1f}s, '
+            f'test score {report.incremental_score:.4f}; full refit: '
+            f'{report.full_seconds:.1f}s, test score {report.full_score:.4f}')
+      if not report.within(tolerance):
+        print(f'Incremental test score is more than {tolerance} below the full refit!')
+    return report
 
   def print_score(self):
     """Print the r^2 score of the train and test set."""
@@ -141,83 +429,88 @@ class Model():
     print(f'Test score: {self.model.score(self.X_test, self.y_test)}')
     print('-' * 80 + '\n')
 
-  def get_predictions(self):
+  def get_predictions(self, chunk_size=100_000):
     """Run the model on the entire dataset."""
-    X_pred = self.__class__.data.drop(columns=['latitude', 'longitude', 'mp_score',
-                                               'is_accessible', '.geo'])
-    return self.model.predict(X_pred)
-
-  def plot_feature_importance(self):
-    """Plot feature importance of a tree method."""
-    if self.name not in ['tree', 'forest', 'xgb']:
-      raise NotImplementedError('Only implemented for tree models.')
+    import numpy as np
+    X_pred = load_features().X_pred
+    # predicting in chunks bounds the memory of brute force knn
+    return np.concatenate([self.model.predict(X_pred.iloc[i:i + chunk_size])
+                           for i in range(0, len(X_pred), chunk_size)])
+
+  def write_predictions(self, path=RESULTS_PATH, chunk_size=100_000, n_processes=1):
+    """Stream the dataset through the model in chunks and write scores to path.
+
+    The scores of other models already in path are kept. Chunks are scored on
+    n_processes processes; see scoring.score_table."""
+    from big_wall_finder.models import scoring
+    if not self.picklable:
+      n_processes = 1
+    return scoring.score_table(self.model, self.name + '_score', path,
+                               chunk_size=chunk_size, n_processes=n_processes)
+
+  def permutation_importance(self, n_repeats=5, n_processes=1):
+    """Drop in test r^2 when shuffling each feature; see importance.permutation_importance."""
+    from big_wall_finder.models import importance
+    if not self.picklable:
+      n_processes = 1
+    return importance.permutation_importance(self.model, self.X_test, self.y_test,
+                                             n_repeats=n_repeats, n_processes=n_processes)
+
+  def plot_feature_importance(self, permutation=False, n_processes=1):
+    """Plot feature importance of a tree method, or permutation importance of any model."""
+    import numpy as np
+    import matplotlib.pyplot as plt
+    if permutation or self.name not in ['tree', 'forest', 'xgb']:
+      importances = self.permutation_importance(n_processes=n_processes)
+      importances = importances.set_index('feature').importance[self.X_train.columns]
+      xlabel = 'Permutation importance (drop in test r^2)'
+    else:
+      importances = self.model.feature_importances_
+      xlabel = 'Feature importance'
     n_features = self.X_train.shape[1]
-    plt.barh(range(n_features), self.model.feature_importances_, align='center')
+    plt.barh(range(n_features), importances, align='center')
     plt.yticks(np.arange(n_features), self.X_train.columns)
-    plt.xlabel('Feature importance')
+    plt.xlabel(xlabel)
     plt.ylabel('Feature')
     plt.ylim(-1, n_features)
     plt.show()
 
 
-  def test_random_hyperparameters(self, n_iter, n_folds=5, verbose=1):
-    """Use cross validation to run model on various choices of hyperparameters."""
+  def export_trees(self, path):
+    """Save a fitted tree model as a node table which predicts with NumPy alone."""
+    from big_wall_finder.models.tree_ensemble import TreeEnsemble
+    if self.name not in ['tree', 'forest', 'xgb']:
+      raise NotImplementedError('Only implemented for tree models.')
+    ensemble = TreeEnsemble.from_model(self.model)
+    ensemble.save(path)
+    return ensemble
+
+  def test_random_hyperparameters(self, n_iter, n_folds=5, verbose=1, halving=False):
+    """Use cross validation to run model on various choices of hyperparameters.
+
+    With halving, candidates are first cross validated on small budgets and
+    only the most promising are fit in full; see halving.halving_search."""
 
     # Early exit if running linear model; no hyperparameters available.
     if self.name == 'linear':
       return {}
 
-    forest_grid = {'max_features': ['auto', 'sqrt'],
-                   'max_depth': [4, 5, 6, 7, 8, 9, 10, None],
-                   'min_samples_split': [2, 3, 4, 5],
-                   'min_samples_leaf': [1, 2, 3, 4, 5],
-                   'bootstrap': [True, False]}
-
-    lasso_grid = {'alpha': [.0001, .0002, .0005, .001, .002, .005, .01, .1, 1, 10],
-                  'tol': [2.5],
-                  'max_iter': [5000]}  # doesn't converge with default values
-
-    ridge_grid = {'alpha': [0.1, 1, 2, 5, 10, 20, 50, 100]}
-
-    knn_grid = {'n_neighbors': [8, 16, 32, 64, 128],
-                'p': [1, 1.5, 2, 2.5]}
-
-    tree_grid = {'ccp_alpha': [0, .005, .01, .02, .05, .1],
-                 'max_features': ['auto', 'sqrt'],
-                 'max_depth': [3, 4, 5, 6, 7, None],
-                 'min_samples_split': [2, 3, 4, 5],
-                 'min_samples_leaf': [1, 2, 3, 4]}
-
-    xgb_grid = {'max_depth': [3, 4, 5, 6, 7, 8, 9, None],
-                'min_child_weight': [1, 2, 4, 6, 8, 10],
-                # learning_rate = eta; should increase n_estimators with low eta
-                'learning_rate': [.01, .03, .05, .1, .2],  
-                'subsample': [.7, .75, .8, .85, .9],
-                'colsample_bytree': [.7, .75, .8, .85, .9]}
-
-    neural_grid = {'epochs': [10, 30, 100, 300, 1000],
-                   'batch_size': [8, 16, 32, 64],
-                   'learning_rate': [.001, .01, .1, .5],
-                   'dropout_rate': [0, 0.05, 0.1, 0.15, 0.2],
-                   'neurons': [100, 200, 300, 400],
-                   'optimizer': ['sgd', 'rmsprop', 'adam'],
-                   'activation': ['relu', 'tanh']}
-
-
-    random_grids = {'ridge': ridge_grid,
-                    'lasso': lasso_grid,
-                    'knn': knn_grid,
-                    'tree': tree_grid,
-                    'forest': forest_grid,
-                    'xgb': xgb_grid,
-                    'neural': neural_grid}
-
-    random_grid = random_grids[self.name]
+    random_grid = RANDOM_GRIDS[self.name]
+
+    if halving:
+      from big_wall_finder.models.halving import halving_search
+      return halving_search(self.name, self.model, random_grid, self.X_train,
+                            self.y_train, n_iter, n_folds=n_folds, verbose=verbose,
+                            sample_weight=self.sample_weight)
 
     # Random search of hyperparameters chosen uniformly from possibilities above.
+    from sklearn.model_selection import RandomizedSearchCV
     rs = RandomizedSearchCV(estimator=self.model, param_distributions=random_grid,
                             n_iter=n_iter, cv=n_folds, verbose=verbose, n_jobs=2)
-    rs.fit(self.X_train, self.y_train)
+    if self.sample_weight is not None and accepts_sample_weight(self.name, self.model):
+      rs.fit(self.X_train, self.y_train, sample_weight=self.sample_weight)
+    else:
+      rs.fit(self.X_train, self.y_train)
     return rs.best_params_
 
   def print_evaluate_hyperparameters(self):
@@ -232,8 +525,9 @@ class Model():
       self.print_score()
       print('#' * 80)
 
-      # Training with default parameters
-      other = self.__class__(self.name)
+      # Training with default parameters on the same split
+      other = copy.copy(self)
+      other.model = self.build_model()
       other.train()
       print(f'{other.name} with default hyperparameters:')
       print(other.model.get_params())
@@ -244,20 +538,11 @@ class Model():
 if __name__ == '__main__':
   #ran = run_all()
   #ran.to_csv('../data/simplified_results.csv', header=True, index=False)
-  # results = Model.data[['latitude', 'longitude', 'height', 'mp_score']].copy()
-  # results.height *= 1000
-  # for model_name in Model.models:
-  #   parameters = {}
-  #   if model_name in ['forest', 'xgb']:
-  #     parameters = {'n_estimators': 200, 'n_jobs': -1}
-  #   m = Model(model_name, parameters)
-  #   m.train()
-  #   m.print_score()
-  #   results[model_name + '_score'] = m.get_predictions()
-  # results['summary_score'] = results.forest_score + results.xgb_score
-  # results.sort_values(by='summary_score', ascending=False, inplace=True)
-  # results = results[results.mp_score == 0]  # omitting what is already known!
-  # print(results.drop(columns=['ridge_score', 'lasso_score']).head(50))  # dropping bad models
+  # from big_wall_finder.models.ensemble import Ensemble
+  # ensemble = Ensemble(['forest', 'xgb'], random_state=0).run(cache=True)
+  # print(ensemble.members)
+  # print(ensemble.results.head(50))
+  # ensemble.write()
   # for model_name in Model.models:
   #   m = Model(model_name)
   #   m.print_evaluate_hyperparameters()
@@ -0,0 +1,99 @@
+"""Score the cliff table in chunks on a process pool, appending to a results file."""
+
+from __future__ import annotations
+import collections
+import concurrent.futures
+import os
+import pandas as pd
+from tqdm import tqdm
+from big_wall_finder import tables
+from big_wall_finder.models import merge_data, predict
+
+
+CHUNK_SIZE = 100_000
+# columns of the cliff table copied next to the scores
+KEEP_COLUMNS = ['latitude', 'longitude', 'geo_id', 'mp_score']
+# chunks read ahead of the one being written, per worker
+CHUNKS_PER_WORKER = 2
+
+# fitted estimator of each worker
+worker_estimator = None
+
+
+def init_worker(estimator):
+  """Hold the fitted estimator within a pool worker."""
+  global worker_estimator  # pylint: disable=global-statement
+  worker_estimator = estimator
+
+
+def score_chunk(chunk: pd.DataFrame, score_column: str):
+  """Score a chunk of the cliff table."""
+  scores = chunk[[c for c in KEEP_COLUMNS if c in chunk]].copy()
+  X = chunk.drop(columns=predict.NON_FEATURES, errors='ignore')
+  scores[score_column] = worker_estimator.predict(X)
+  return scores
+
+
+def merge_scores(earlier: pd.DataFrame, scores: pd.DataFrame, score_column: str):
+  """Add the scores of a chunk to the same rows of an earlier results file."""
+  if len(earlier) != len(scores):
+    raise ValueError('The results file does not hold the rows of the cliff table.')
+  # rescoring a model replaces its column
+  earlier = earlier.drop(columns=score_column, errors='ignore')
+  earlier[score_column] = scores[score_column].to_numpy()
+  return earlier
+
+
+def score_table(estimator, score_column: str, out_path: str, data_path: str = predict.DATA_PATH,
+                chunk_size: int = CHUNK_SIZE, n_processes: int = 1, merge: bool = True):
+  """Write the scores of every cliff in data_path to out_path; return the number of rows.
+
+  With merge, the columns of an existing out_path, eg the scores of other
+  models, are kept next to the new scores."""
+  # casting each chunk as load_features casts the training data
+  chunks = (tables.apply_schema(chunk, merge_data.MERGED_SCHEMA, merge_data.FEATURE_DTYPE)
+            for chunk in pd.read_csv(data_path, chunksize=chunk_size))
+  earlier = None
+  if merge and os.path.exists(out_path):
+    earlier = pd.read_csv(out_path, chunksize=chunk_size)
+  n_rows = 0
+  # writing next to out_path, which is read until the last chunk
+  tmp_path = out_path + '.tmp'
+  try:
+    with open(tmp_path, 'w', newline='') as f:
+      def write(scores):
+        nonlocal n_rows
+        if earlier is not None:
+          scores = merge_scores(next(earlier, scores.iloc[:0]), scores, score_column)
+        scores.to_csv(f, header=n_rows == 0, index=False)
+        n_rows += len(scores)
+
+      if n_processes == 1:
+        init_worker(estimator)
+        try:
+          for chunk in tqdm(chunks):
+            write(score_chunk(chunk, score_column))
+        finally:
+          # not keeping the fitted estimator alive after the call
+          init_worker(None)
+      else:
+        with concurrent.futures.ProcessPoolExecutor(
+            n_processes, initializer=init_worker, initargs=(estimator,)) as pool:
+          # submitting a bounded window of chunks so that reading keeps pace with scoring
+          pending = collections.deque()
+          for chunk in tqdm(chunks):
+            pending.append(pool.submit(score_chunk, chunk, score_column))
+            if len(pending) >= CHUNKS_PER_WORKER * n_processes:
+              write(pending.popleft().result())
+          while pending:
+            write(pending.popleft().result())
+      if earlier is not None and next(earlier, None) is not None:
+        raise ValueError('The results file does not hold the rows of the cliff table.')
+  except BaseException:
+    os.remove(tmp_path)
+    raise
+  finally:
+    if earlier is not None:
+      earlier.close()
+  os.replace(tmp_path, out_path)
+  return n_rows
@@ -0,0 +1,188 @@
+"""Flatten fitted forest and xgb models into arrays and evaluate them with NumPy.
+
+The nodes of all trees of an ensemble are concatenated into one node table of
+feature, threshold, left, right, and value columns; roots holds the first node
+of each tree. A row goes left at a node when its feature is at most the float32
+threshold, or when it is missing and default_left is set; leaves point to
+themselves on both sides. Evaluation moves every (row, tree) pair down one
+level at a time with a few gathers over the whole batch, drops pairs as they
+reach leaves, and then sums the values reached per row. Leaf values of a forest
+are divided by its number of trees, and xgb adds its base_score.
+
+Both libraries compare float32 features, sklearn with x <= threshold on float64
+thresholds and xgb with x < threshold on float32 thresholds. Each threshold is
+rounded down to the largest float32 giving the same comparisons under <=, so
+that predictions match the native ones up to the order of summation. Saved
+ensembles load with NumPy alone.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, fields
+import json
+import numpy as np
+
+
+# rows evaluated together; small chunks keep the node gathers in cache
+ROW_CHUNK_SIZE = 512
+
+
+def float32_at_most(thresholds):
+  """Round thresholds down to float32, keeping which float32 values are at most them."""
+  rounded = np.asarray(thresholds).astype(np.float32)
+  above = rounded.astype(np.float64) > thresholds
+  rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+  return rounded
+
+
+def link_leaves(left, right, is_leaf, offset):
+  """Offset children into the node table and point leaves to themselves."""
+  nodes = np.arange(len(left)) + offset
+  left = np.where(is_leaf, nodes, np.asarray(left) + offset).astype(np.int32)
+  right = np.where(is_leaf, nodes, np.asarray(right) + offset).astype(np.int32)
+  return left, right
+
+
+@dataclass
+class TreeEnsemble:
+  """Node table of a tree ensemble regressor."""
+  feature: np.ndarray  # int32 feature of each split; 0 at leaves
+  threshold: np.ndarray  # float32 split threshold; inf at leaves
+  default_left: np.ndarray  # bool; whether missing values go left
+  left: np.ndarray  # int32 node reached when going left
+  right: np.ndarray  # int32 node reached when going right
+  value: np.ndarray  # float64 value added at a leaf; 0 elsewhere
+  roots: np.ndarray  # int32 root node of each tree
+  base_score: float
+  max_depth: int
+
+  @classmethod
+  def concatenate(cls, trees: list[dict], base_score: float = 0.0):
+    """Build the node table of trees given as columns of their own nodes."""
+    columns = {key: [] for key in ['feature', 'threshold', 'default_left',
+                                   'left', 'right', 'value']}
+    roots, offset, max_depth = [], 0, 0
+    for tree in trees:
+      left, right = link_leaves(tree['left'], tree['right'], tree['is_leaf'], offset)
+      columns['left'].append(left)
+      columns['right'].append(right)
+      columns['feature'].append(np.where(tree['is_leaf'], 0, tree['feature']).astype(np.int32))
+      columns['threshold'].append(np.where(tree['is_leaf'], np.float32(np.inf),
+                                           tree['threshold']).astype(np.float32))
+      columns['default_left'].append(np.asarray(tree['default_left'], dtype=bool))
+      columns['value'].append(np.where(tree['is_leaf'], tree['value'], 0).astype(np.float64))
+      roots.append(offset)
+      offset += len(left)
+      max_depth = max(max_depth, tree['depth'])
+    return cls(**{key: np.concatenate(column) for key, column in columns.items()},
+               roots=np.array(roots, dtype=np.int32), base_score=float(base_score),
+               max_depth=int(max_depth))
+
+  @classmethod
+  def from_forest(cls, model):
+    """Export a fitted sklearn RandomForestRegressor or DecisionTreeRegressor."""
+    estimators = getattr(model, 'estimators_', [model])
+    trees = []
+    for estimator in estimators:
+      tree = estimator.tree_
+      n_nodes = tree.node_count
+      is_leaf = tree.children_left == -1
+      trees.append({'feature': tree.feature, 'is_leaf': is_leaf,
+                    'threshold': float32_at_most(tree.threshold),
+                    'default_left': getattr(tree, 'missing_go_to_left', np.zeros(n_nodes)),
+                    'left': tree.children_left, 'right': tree.children_right,
+                    'value': tree.value[:, 0, 0] / len(estimators),
+                    'depth': tree.max_depth})
+    return cls.concatenate(trees)
+
+  @classmethod
+  def from_xgb(cls, model):
+    """Export a fitted XGBRegressor with numerical features."""
+    learner = json.loads(model.get_booster().save_raw(raw_format='json'))['learner']
+    booster = learner['gradient_booster']['model']
+    xgb_trees = booster['trees']
+    # predict stops at the best iteration of a model fit with early stopping
+    best_iteration = getattr(model, 'best_iteration', None) \
+        if model.get_params().get('early_stopping_rounds') else None
+    if best_iteration is not None:
+      xgb_trees = xgb_trees[:booster['iteration_indptr'][best_iteration + 1]]
+
+    trees = []
+    for tree in xgb_trees:
+      left = np.array(tree['left_children'])
+      is_leaf = left == -1
+      conditions = np.array(tree['split_conditions'], dtype=np.float32)
+      # x < t is x <= the float32 just below t
+      thresholds = np.nextafter(conditions, np.float32(-np.inf))
+      trees.append({'feature': np.array(tree['split_indices']), 'is_leaf': is_leaf,
+                    'threshold': thresholds,
+                    'default_left': np.array(tree['default_left'], dtype=bool),
+                    'left': left, 'right': np.array(tree['right_children']),
+                    'value': conditions.astype(np.float64),
+                    'depth': tree_depth(left, np.array(tree['right_children']))})
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+    return cls.concatenate(trees, base_score)
+
+  @classmethod
+  def from_model(cls, model):
+    """Export a fitted forest, tree, or xgb model."""
+    if hasattr(model, 'get_booster'):
+      return cls.from_xgb(model)
+    return cls.from_forest(model)
+
+  def predict(self, X):
+    """Evaluate all trees on the rows of X."""
+    X = np.asarray(X, dtype=np.float32)
+    n_trees = len(self.roots)
+    # children of node i at 2i and 2i + 1, to step with one gather
+    children = np.stack([self.left, self.right], axis=1).ravel()
+    is_leaf = self.left == np.arange(len(self.left))
+    has_missing = np.isnan(X).any()
+    predictions = np.empty(len(X))
+    for start in range(0, len(X), ROW_CHUNK_SIZE):
+      chunk = X[start:start + ROW_CHUNK_SIZE]
+      values = chunk.ravel()
+      # one (row, tree) pair per position, walked down while it is not at a leaf
+      nodes = np.tile(self.roots, len(chunk))
+      offsets = np.repeat(np.arange(len(chunk)) * X.shape[1], n_trees)
+      positions = np.arange(len(nodes))
+      leaves = np.empty(len(nodes), dtype=np.int32)
+      for _ in range(self.max_depth):
+        x = values[offsets + self.feature[nodes]]
+        go_right = ~(x <= self.threshold[nodes])
+        if has_missing:
+          go_right &= ~(np.isnan(x) & self.default_left[nodes])
+        nodes = children[2 * nodes + go_right]
+        done = is_leaf[nodes]
+        if done.any():
+          leaves[positions[done]] = nodes[done]
+          nodes, offsets, positions = nodes[~done], offsets[~done], positions[~done]
+          if len(nodes) == 0:
+            break
+      leaves[positions] = nodes
+      predictions[start:start + len(chunk)] = \
+          self.value[leaves].reshape(len(chunk), n_trees).sum(axis=1)
+    return predictions + self.base_score
+
+  def save(self, path: str):
+    """Save the node table to an npz file."""
+    np.savez(path, **{f.name: getattr(self, f.name) for f in fields(self)})
+
+  @classmethod
+  def load(cls, path: str):
+    """Load a node table saved by save."""
+    with np.load(path) as npz:
+      ensemble = cls(**{f.name: npz[f.name] for f in fields(cls)})
+    ensemble.base_score = float(ensemble.base_score)
+    ensemble.max_depth = int(ensemble.max_depth)
+    return ensemble
+
+
+def tree_depth(left, right):
+  """Depth of a tree given by the children of its nodes, rooted at node 0."""
+  depth, level = 0, np.array([0])
+  while True:
+    level = np.concatenate([left[level], right[level]])
+    level = level[level != -1]
+    if len(level) == 0:
+      return depth
+    depth += 1
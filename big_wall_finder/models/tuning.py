@@ -0,0 +1,224 @@
+"""Cross validate hyperparameter candidates of all models on one process pool.
+
+Fold scores may be journaled to disk so that an interrupted run resumes."""
+
+from __future__ import annotations
+import concurrent.futures
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from sklearn.model_selection import KFold, ParameterSampler
+from tqdm import tqdm
+from big_wall_finder.models import predict
+
+
+# submitting the most expensive models first so that they do not run last
+COST_ORDER = ['neural', 'forest', 'xgb', 'knn', 'tree', 'lasso', 'ridge']
+
+# shared memory and arrays attached to by each worker
+worker_arrays: dict[str, tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+
+
+def share(array: np.ndarray):
+  """Copy array into a new block of shared memory."""
+  shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+  np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+  return shm
+
+
+def init_worker(specs: dict[str, tuple[str, tuple[int, ...], str]]):
+  """Map the shared training arrays within a pool worker."""
+  for key, (name, shape, dtype) in specs.items():
+    # workers share the resource tracker of the parent, which unlinks the block
+    shm = shared_memory.SharedMemory(name=name)
+    worker_arrays[key] = shm, np.ndarray(shape, dtype, buffer=shm.buf)
+
+
+def build_candidate(name: str, params: dict, n_features: int):
+  """Build an estimator as test_random_hyperparameters would search it."""
+  estimator = predict.build_estimator(name, n_features)
+  best_params = predict.load_best_params()
+  if best_params:
+    estimator.set_params(**best_params[name])
+  estimator.set_params(**params)
+  # the pool already uses every core
+  if 'n_jobs' in estimator.get_params():
+    estimator.set_params(n_jobs=1)
+  return estimator
+
+
+def score_fold(name: str, params: dict, fold: int, n_folds: int):
+  """Fit a candidate on all but one fold and score it on that fold."""
+  X, y = worker_arrays['X'][1], worker_arrays['y'][1]
+  train, test = list(KFold(n_folds).split(X))[fold]
+  estimator = build_candidate(name, params, X.shape[1])
+  kwargs = {}
+  # weighting as test_random_hyperparameters does; the test fold is scored unweighted
+  if 'w' in worker_arrays and predict.accepts_sample_weight(name, estimator):
+    kwargs['sample_weight'] = worker_arrays['w'][1][train]
+  try:
+    estimator.fit(X[train], y[train], **kwargs)
+    return estimator.score(X[test], y[test])
+  except Exception as error:  # pylint: disable=broad-except
+    # RandomizedSearchCV also scores a failed fit as nan
+    print(f'{name} {params} failed on fold {fold}: {error!r}')
+    return np.nan
+
+
+def sample_candidates(names: list[str], n_iter: int, random_state=None):
+  """Draw up to n_iter candidates from the random grid of each model."""
+  return {name: list(ParameterSampler(predict.RANDOM_GRIDS[name], n_iter,
+                                      random_state=random_state))
+          for name in names if name in predict.RANDOM_GRIDS}
+
+
+def select_best(candidates: dict[str, list[dict]], scores: dict, n_folds: int):
+  """Pick the candidate of each model with the best mean score over folds."""
+  best_params = {}
+  for name, params in candidates.items():
+    means = np.array([np.mean([scores[name, i, fold] for fold in range(n_folds)])
+                      for i in range(len(params))])
+    if np.isnan(means).all():
+      raise ValueError(f'Every candidate of {name} failed to fit.')
+    best_params[name] = params[int(np.nanargmax(means))]
+  return best_params
+
+
+def fingerprint(arrays: dict[str, np.ndarray]):
+  """Hash the training arrays, whose fold scores a journal holds."""
+  digest = hashlib.blake2b(digest_size=16)
+  for key, array in sorted(arrays.items()):
+    digest.update(f'{key}{array.shape}{array.dtype.str}'.encode())
+    digest.update(array.tobytes())
+  return digest.hexdigest()
+
+
+def params_key(params: dict):
+  """Serialize params so that equal candidates give equal keys."""
+  return json.dumps(params, sort_keys=True)
+
+
+@dataclass
+class Journal:
+  """Candidates and fold scores of a search, appended to a JSON lines file."""
+  path: str
+  data: str | None = None  # fingerprint of the training arrays
+  candidates: dict[str, list[dict]] = field(default_factory=dict)
+  scores: dict[tuple[str, str, int, int], float] = field(default_factory=dict)
+
+  @classmethod
+  def load(cls, path: str):
+    """Read a journal, dropping a last line cut off by an interrupted run."""
+    journal = cls(path)
+    if not os.path.exists(path):
+      return journal
+    with open(path, 'rb+') as f:
+      lines = f.read().split(b'\n')
+      if lines[-1]:
+        f.truncate(f.tell() - len(lines[-1]))
+    for line in lines[:-1]:
+      entry = json.loads(line)
+      if 'data' in entry:
+        journal.data = entry['data']
+      elif 'candidates' in entry:
+        journal.candidates[entry['model']] = entry['candidates']
+      else:
+        journal.scores[entry['model'], params_key(entry['params']),
+                       entry['fold'], entry['n_folds']] = entry['score']
+    return journal
+
+  def get(self, name: str, params: dict, fold: int, n_folds: int):
+    """Look up the score of a fold, or None if it has not been fit."""
+    return self.scores.get((name, params_key(params), fold, n_folds))
+
+  def append(self, entry: dict):
+    """Write one entry to disk before returning."""
+    with open(self.path, 'a') as f:
+      f.write(json.dumps(entry) + '\n')
+      f.flush()
+      os.fsync(f.fileno())
+
+  def check_data(self, data: str):
+    """Record the fingerprint of the training arrays, or check that it matches."""
+    if self.data is None:
+      self.data = data
+      self.append({'data': data})
+    elif self.data != data:
+      raise ValueError(f'{self.path} was written for different training data.')
+
+  def add_candidates(self, name: str, candidates: list[dict]):
+    """Record the candidates drawn for a model."""
+    self.candidates[name] = candidates
+    self.append({'model': name, 'candidates': candidates})
+
+  def add_score(self, name: str, params: dict, fold: int, n_folds: int, score: float):
+    """Record the score of a fold."""
+    self.scores[name, params_key(params), fold, n_folds] = score
+    self.append({'model': name, 'params': params, 'fold': fold,
+                 'n_folds': n_folds, 'score': score})
+
+
+def tune_in_pool(X, y, n_iter: int, n_folds: int = 5, n_processes: int | None = None,
+                 names: list[str] | None = None, random_state=None,
+                 journal_path: str | None = None, sample_weight=None):
+  """Search random hyperparameters of all models on a single process pool.
+
+  Returns the best parameters of each model in names, which defaults to all
+  models, in the format of best_params.json. With a journal_path the search
+  is recorded there and resumed from it. sample_weight weights the training
+  rows of the estimators which take it."""
+
+  names = list(predict.MODELS) if names is None else names
+  candidates = sample_candidates(names, n_iter, random_state)
+  # sharing the arrays in their own dtype, eg the float32 features
+  arrays = {'X': np.ascontiguousarray(X), 'y': np.ascontiguousarray(y)}
+  if sample_weight is not None:
+    arrays['w'] = np.ascontiguousarray(sample_weight)
+  scores = {}
+  journal = None
+  if journal_path is not None:
+    journal = Journal.load(journal_path)
+    journal.check_data(fingerprint(arrays))
+    for name in candidates:
+      if name in journal.candidates:
+        candidates[name] = journal.candidates[name]
+      else:
+        journal.add_candidates(name, candidates[name])
+    for name, params in candidates.items():
+      for i, candidate in enumerate(params):
+        for fold in range(n_folds):
+          score = journal.get(name, candidate, fold, n_folds)
+          if score is not None:
+            scores[name, i, fold] = score
+    print(f'Resuming from {len(scores)} journaled fold scores.')
+
+  tasks = [(name, i, fold) for name in COST_ORDER if name in candidates
+           for i in range(len(candidates[name])) for fold in range(n_folds)
+           if (name, i, fold) not in scores]
+
+  shms = {key: share(array) for key, array in arrays.items()}
+  specs = {key: (shms[key].name, array.shape, array.dtype.str)
+           for key, array in arrays.items()}
+
+  try:
+    with concurrent.futures.ProcessPoolExecutor(
+        n_processes or os.cpu_count(), initializer=init_worker,
+        initargs=(specs,)) as pool:
+      futures = {pool.submit(score_fold, name, candidates[name][i], fold, n_folds):
+                 (name, i, fold) for name, i, fold in tasks}
+      for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+        name, i, fold = futures[future]
+        scores[name, i, fold] = future.result()
+        if journal is not None:
+          journal.add_score(name, candidates[name][i], fold, n_folds, scores[name, i, fold])
+  finally:
+    for shm in shms.values():
+      shm.close()
+      shm.unlink()
+
+  best_params = select_best(candidates, scores, n_folds)
+  # linear has no hyperparameters
+  return {name: best_params.get(name, {}) for name in names}
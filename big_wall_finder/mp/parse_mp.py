@@ -12,12 +12,20 @@ Notes on the scraped clean-data.json data:
 """
 
 from __future__ import annotations
-from typing import Any
-from dataclasses import dataclass
+from typing import Any, BinaryIO, Iterator
+from dataclasses import dataclass, field
+from array import array
+import multiprocessing
+import hashlib
+import pickle
 import random
 import json
+import os
+import re
+import ijson
+import numpy as np
 import pandas as pd
-from big_wall_finder import definitions
+from big_wall_finder import definitions, tables
 
 
 @dataclass(eq=True, frozen=True)  # making Coord hashable
@@ -40,36 +48,101 @@ class Count:
   n_views: int = 0
 
   def count_types(self, types: list[str]):
-    """Count number of routes by type. Route types include:
-    - tr
-    - trad
-    - sport
-    - boulder
-    - mixed
-    - ice
-    - alpine
-    - snow.
-    """
-
-    if 'boulder' in types:
-      self.n_boulder += 1
-    elif 'mixed' in types or 'ice' in types or 'snow' in types:
-      self.n_winter += 1
-    else:  # tr, trad, sport, alpine
-      self.n_rock += 1
+    """Count number of routes by type."""
+    column = route_column(types)
+    setattr(self, column, getattr(self, column) + 1)
 
 
-def load_data():
-  """Load clean-data.json file."""
+def route_column(types: list[str]):
+  """Get the count column for a route. Route types include:
+  - tr
+  - trad
+  - sport
+  - boulder
+  - mixed
+  - ice
+  - alpine
+  - snow.
+  """
 
-  print('Loading MP data ...')
-  with open(definitions.MP_SCRAPE_JSON_PATH) as f:
-    data = json.load(f)
-  print('Data loaded.')
+  if 'boulder' in types:
+    return 'n_boulder'
+  if 'mixed' in types or 'ice' in types or 'snow' in types:
+    return 'n_winter'
+  return 'n_rock'  # tr, trad, sport, alpine
 
-  # data is a list; converting it to a dict to match format of children
+
+COUNT_COLUMNS = ['n_boulder', 'n_winter', 'n_rock', 'n_views']
+
+
+@dataclass
+class Columns:
+  """Array-backed counts of MP routes with one row per interned coordinate."""
+  ids: dict[Coord, int] = field(default_factory=dict)
+  names: list[str] = field(default_factory=list)
+  latitude: array = field(default_factory=lambda: array('d'))
+  longitude: array = field(default_factory=lambda: array('d'))
+  n_boulder: array = field(default_factory=lambda: array('q'))
+  n_winter: array = field(default_factory=lambda: array('q'))
+  n_rock: array = field(default_factory=lambda: array('q'))
+  n_views: array = field(default_factory=lambda: array('q'))
+
+  def add_row(self, key: Coord, name: str):
+    """Intern an unseen key, returning the id of its zeroed row."""
+    i = self.ids[key] = len(self.names)
+    self.names.append(name)
+    self.latitude.append(key.latitude)
+    self.longitude.append(key.longitude)
+    for column in COUNT_COLUMNS:
+      getattr(self, column).append(0)
+    return i
+
+  def get_row(self, key: Coord, node: dict[str, Any]):
+    """Get the row id of key, adding a row named after node if key is unseen."""
+    i = self.ids.get(key)
+    if i is None:
+      i = self.add_row(key, clean_name(node['name']))
+    return i
+
+  def merge(self, other: Columns):
+    """Add in the counts of other, keeping the names of rows already present.
+
+    Merging the columns of sibling subtrees in order therefore gives the name
+    of the first highest node with each key, just as a single traversal does."""
+    for key, j in other.ids.items():
+      i = self.ids.get(key)
+      if i is None:
+        i = self.add_row(key, other.names[j])
+      for column in COUNT_COLUMNS:
+        getattr(self, column)[i] += getattr(other, column)[j]
+
+  @classmethod
+  def from_counts(cls, counts: dict[Coord, Count]):
+    """Convert counts built by dfs or stream_dfs to columns."""
+    columns = cls()
+    for key, count in counts.items():
+      i = columns.add_row(key, count.name)
+      for column in COUNT_COLUMNS:
+        getattr(columns, column)[i] = getattr(count, column)
+    return columns
+
+  def to_df(self):
+    """Build table data directly from the column arrays."""
+    df = pd.DataFrame({
+        'latitude': np.frombuffer(self.latitude, dtype=np.float64),
+        'longitude': np.frombuffer(self.longitude, dtype=np.float64),
+        'name': self.names,
+        **{column: np.frombuffer(getattr(self, column), dtype=np.int64)
+           for column in COUNT_COLUMNS}
+    })
+    # only keep if area contains some routes
+    df = df[(df.n_boulder + df.n_winter + df.n_rock) > 0]
+    return df.reset_index(drop=True)
+
+
+def root_node():
+  """Build the synthetic root node sitting above the scraped list of areas."""
   return {'name': 'All',
-          'children': data,
           # roughly at geographic center of US
           'lat': 39.0,
           'long': -98.0,
@@ -78,6 +151,20 @@ def load_data():
           'url': 'https://mountainproject.com'}
 
 
+def load_data():
+  """Load clean-data.json file."""
+
+  print('Loading MP data ...')
+  with open(definitions.MP_SCRAPE_JSON_PATH) as f:
+    data = json.load(f)
+  print('Data loaded.')
+
+  # data is a list; converting it to a dict to match format of children
+  root = root_node()
+  root['children'] = data
+  return root
+
+
 def get_gps(node: dict[str, Any]):
   """Get higher precision gps2 values."""
   lat1, long1 = node['lat'], node['long']
@@ -148,33 +235,372 @@ def dfs(node: dict[str, Any], counts: dict[Coord, Count], key: Coord | None = No
         dfs(child, counts, key)
 
 
-def save_as_df(counts: dict[Coord, Count]):
-  """Save tree data in table form."""
-  df = []
-  for coord, count in counts.items():
-    row = {
-        'latitude': coord.latitude,
-        'longitude': coord.longitude,
-        'name': count.name,
-        'n_boulder': count.n_boulder,
-        'n_winter': count.n_winter,
-        'n_rock': count.n_rock,
-        'n_views': count.n_views
-    }
-    # only keep if area contains some routes
-    if row['n_boulder'] + row['n_winter'] + row['n_rock']:
-      df.append(row)
-  df = pd.DataFrame(df)
-  path = definitions.MP_DATA_PATH
-  print(f'Writing table data to {path}')
-  df.to_csv(path, header=True, index=False)
+def iterative_dfs(node: dict[str, Any], columns: Columns, key: Coord | None = None):
+  """Traverse tree with an explicit stack, accumulating into columns.
+
+  Visits nodes in the same order as dfs, so rows are interned in the same
+  order, but is not bounded by the recursion limit."""
 
+  # each entry is a node and the row id of its parent key, or None if the node
+  # has its own geo key
+  i = None if key is None else columns.get_row(key, node)
+  stack: list[tuple[dict[str, Any], int | None]] = [(node, i)]
+  n_views = columns.n_views
+  counters = {column: getattr(columns, column) for column in COUNT_COLUMNS}
+  while stack:
+    node, i = stack.pop()
+    if i is None:
+      i = columns.get_row(get_gps(node), node)
+    views = node['totalViews']
 
-def main():
-  """Convert tree data to table data."""
-  root = load_data()
-  counts = {}
-  print('Searching data tree with DFS ...')
+    # node is a leaf; its views are counted twice just as in populate
+    if 'types' in node:
+      counters[route_column(node['types'])][i] += 1
+      views *= 2
+    n_views[i] += views
+
+    if 'children' in node:
+      stack.extend((child, None if 'lat' in child else i)
+                   for child in reversed(node['children']))
+
+
+# top-level areas and the root key, inherited by pool workers in parallel_dfs
+worker_areas: list[dict[str, Any]] = []
+worker_key: Coord | None = None
+
+
+def init_worker(areas: list[dict[str, Any]], key: Coord):
+  """Hand the top-level areas to a pool worker."""
+  global worker_areas, worker_key
+  worker_areas, worker_key = areas, key
+
+
+def parse_area(index: int):
+  """Aggregate a single top-level area within a pool worker."""
+  area = worker_areas[index]
+  columns = Columns()
+  iterative_dfs(area, columns, None if 'lat' in area else worker_key)
+  return columns
+
+
+def parallel_dfs(root: dict[str, Any], columns: Columns, n_processes: int):
+  """Traverse the top-level areas in a process pool, accumulating into columns.
+
+  The same key may appear in several areas, so the per-area columns are merged
+  in order. This gives the same rows, names, and counts as iterative_dfs."""
+
+  areas = root['children']
+  root = {k: v for k, v in root.items() if k != 'children'}
+  iterative_dfs(root, columns)
+
+  # with the fork start method the areas are inherited rather than pickled
+  initargs = (areas, get_gps(root))
+  with multiprocessing.Pool(n_processes, init_worker, initargs) as pool:
+    for area_columns in pool.imap(parse_area, range(len(areas))):
+      columns.merge(area_columns)
+
+
+CHILDREN_KEY = re.compile(rb'"children"\s*:\s*\[')
+
+
+@dataclass
+class JsonStructure:
+  """Positions of the brackets in raw JSON, found without parsing it."""
+  data: bytes
+  brackets: np.ndarray  # positions of brackets outside of strings
+  is_object: np.ndarray  # whether each bracket opens an object
+  levels: np.ndarray  # nesting level of each bracket, shared by matching pairs
+  partners: np.ndarray  # index of the matching bracket
+  children_arrays: dict[int, np.ndarray]  # sorted by level
+
+  @classmethod
+  def scan(cls, data: bytes, chunk_size: int = 2 ** 26):
+    """Locate brackets and children keys with vectorized byte comparisons."""
+    b = np.frombuffer(data, dtype=np.uint8)
+    quotes, brackets = [], []
+    for start in range(0, len(b), chunk_size):
+      chunk = b[start:start + chunk_size]
+      quotes.append(np.flatnonzero(chunk == ord('"')) + start)
+      is_bracket = ((chunk == ord('{')) | (chunk == ord('}')) |
+                    (chunk == ord('[')) | (chunk == ord(']')))
+      brackets.append(np.flatnonzero(is_bracket) + start)
+    quotes, brackets = np.concatenate(quotes), np.concatenate(brackets)
+
+    # dropping escaped quotes, ie those after an odd number of backslashes
+    keep = np.ones(len(quotes), dtype=bool)
+    for i in np.flatnonzero(b[np.maximum(quotes - 1, 0)] == ord('\\')):
+      n = 0
+      while b[quotes[i] - n - 1] == ord('\\'):
+        n += 1
+      keep[i] = n % 2 == 0
+    quotes = quotes[keep]
+
+    # an odd number of quotes precedes anything within a string
+    brackets = brackets[np.searchsorted(quotes, brackets) % 2 == 0]
+    is_object = b[brackets] == ord('{')
+    is_open = is_object | (b[brackets] == ord('['))
+    levels = np.cumsum(np.where(is_open, 1, -1))
+    levels[~is_open] += 1
+
+    # at each level, opening and closing brackets alternate
+    order = np.argsort(levels, kind='stable')
+    partners = np.empty_like(order)
+    partners[order[0::2]] = order[1::2]
+    partners[order[1::2]] = order[0::2]
+
+    # keeping those children keys that are keys rather than within strings
+    matches = [(m.start(), m.end() - 1) for m in CHILDREN_KEY.finditer(data)]
+    starts, ends = np.array(matches, dtype=np.int64).reshape(-1, 2).T
+    i = np.searchsorted(quotes, starts)
+    is_key = (i < len(quotes)) & (i % 2 == 0)
+    is_key[is_key] = quotes[i[is_key]] == starts[is_key]
+    arrays = np.searchsorted(brackets, ends[is_key])
+    children_arrays = {level: arrays[levels[arrays] == level]
+                       for level in np.unique(levels[arrays])}
+    return cls(data, brackets, is_object, levels, partners, children_arrays)
+
+  def elements(self, array: int):
+    """Get the brackets opening the objects in the array at index array."""
+    between = np.arange(array + 1, self.partners[array])
+    between = between[self.levels[between] == self.levels[array] + 1]
+    return between[self.is_object[between]]
+
+  def children(self, node: int):
+    """Get the bracket opening the children of the node at index node."""
+    arrays = self.children_arrays.get(self.levels[node] + 1)
+    if arrays is None:
+      return None
+    i = np.searchsorted(arrays, node)
+    if i < len(arrays) and arrays[i] < self.partners[node]:
+      return int(arrays[i])
+    return None
+
+  def span(self, node: int):
+    """Get the raw JSON of the node at index node."""
+    start, end = self.brackets[node], self.brackets[self.partners[node]] + 1
+    return memoryview(self.data)[start:end]
+
+  def load_without_children(self, node: int, array: int):
+    """Parse the node at index node, skipping over its children."""
+    start, end = self.brackets[node], self.brackets[self.partners[node]] + 1
+    cut, resume = self.brackets[array] + 1, self.brackets[self.partners[array]]
+    node = json.loads(self.data[start:cut] + self.data[resume:end])
+    del node['children']
+    return node
+
+
+def subtrees(structure: JsonStructure, array: int, key: Coord, depth: int):
+  """Cut the nodes in a list of children into independently aggregated pieces.
+
+  Yields pairs of a node and the key of its parent in preorder. Nodes less
+  than depth levels down the tree are parsed without their children; the nodes
+  at that depth are yielded as the raw JSON of their entire subtree."""
+  for node in structure.elements(array):
+    children = structure.children(node) if depth > 1 else None
+    if children is None:
+      yield structure.span(node), key
+      continue
+    shallow = structure.load_without_children(node, children)
+    yield shallow, key
+    node_key = get_gps(shallow) if 'lat' in shallow else key
+    yield from subtrees(structure, children, node_key, depth - 1)
+
+
+def hash_subtree(raw: memoryview, key: Coord):
+  """Hash the raw JSON of a subtree along with the key of its parent."""
+  h = hashlib.blake2b(repr(key).encode(), digest_size=16)
+  h.update(raw)
+  return h.hexdigest()
+
+
+def incremental_dfs(data: bytes, columns: Columns,
+                    index: dict[str, Columns], depth: int = 2):
+  """Traverse the raw scraped data, reusing the columns of subtrees in index.
+
+  The tree is cut into pieces with subtrees and a piece found in the index of
+  the previous parse is neither parsed nor traversed; its stored columns are
+  merged in place. This gives the same result as iterative_dfs while only the
+  bracket structure of unchanged pieces is read. Returns the index mapping the
+  hash of each piece of this tree to its columns."""
+
+  root = root_node()
+  iterative_dfs(root, columns)
+  structure = JsonStructure.scan(data)
+  if not len(structure.brackets) or structure.is_object[0]:
+    raise ValueError('Expected scraped data to be a list of areas.')
+
+  new_index = {}
+  n_reused = 0
+  for node, key in subtrees(structure, 0, get_gps(root), depth):
+    if isinstance(node, dict):  # a node without its children
+      iterative_dfs(node, columns, None if 'lat' in node else key)
+      continue
+    digest = hash_subtree(node, key)
+    subtree_columns = index.get(digest)
+    if subtree_columns is None:
+      node = json.loads(bytes(node))
+      subtree_columns = Columns()
+      iterative_dfs(node, subtree_columns, None if 'lat' in node else key)
+    else:
+      n_reused += 1
+    new_index[digest] = subtree_columns
+    columns.merge(subtree_columns)
+  print(f'Reused {n_reused} of {len(new_index)} subtrees.')
+  return new_index
+
+
+def load_index(path: str = definitions.MP_INDEX_PATH):
+  """Load the subtree index written by the previous incremental parse."""
+  if not os.path.exists(path):
+    return {}
+  with open(path, 'rb') as f:
+    return pickle.load(f)
+
+
+def save_index(index: dict[str, Columns], path: str = definitions.MP_INDEX_PATH):
+  """Save the subtree index next to the table data."""
+  print(f'Writing subtree index to {path}')
+  with open(path, 'wb') as f:
+    pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+@dataclass
+class Frame:
+  """A node whose closing brace has not yet been read by stream_dfs."""
+  parent_key: Coord
+  fields: dict[str, Any] = field(default_factory=dict)
+  key: Coord | None = None  # set once the node has been opened
+
+
+def open_node(node: dict[str, Any], counts: dict[Coord, Count]):
+  """Register a node in counts before its children are read.
+
+  Returns None if the fields read so far are not enough to determine the key
+  and name of the node, in which case the caller must buffer its children."""
+
+  # areas always carry their own coordinates; without them the key could
+  # still change once the rest of the node is read
+  if not all(k in node for k in ['name', 'lat', 'long', 'gps2']):
+    return None
+  key = get_gps(node)
+  if key not in counts:
+    counts[key] = Count(clean_name(node['name']))
+  return key
+
+
+def build_value(event: str, value: Any, events: Iterator[tuple[str, Any]]):
+  """Materialize the JSON value starting with the given event."""
+  builder = ijson.ObjectBuilder()
+  builder.event(event, value)
+  depth = 1
+  while depth:
+    event, value = next(events)
+    builder.event(event, value)
+    if event in ('start_map', 'start_array'):
+      depth += 1
+    elif event in ('end_map', 'end_array'):
+      depth -= 1
+  return builder.value
+
+
+def stream_dfs(f: BinaryIO, counts: dict[Coord, Count]):
+  """Traverse the tree while reading it, without loading the whole file.
+
+  Nodes are visited in the same order as in dfs, so counts ends up identical.
+  Only the scalar fields of the nodes along the current branch are held in
+  memory. A node whose children appear before its name and coordinates has its
+  subtree buffered and handed to dfs instead."""
+
+  root = root_node()
   dfs(root, counts)
+
+  events = ijson.basic_parse(f, use_float=True)
+  event, _ = next(events)
+  if event != 'start_array':
+    raise ValueError('Expected scraped data to be a list of areas.')
+
+  keys = [get_gps(root)]  # keys of the nodes whose children are being read
+  frames: list[Frame] = []
+  name = None  # the field whose value comes next, if any
+
+  for event, value in events:
+    if name is None:
+      if event == 'start_map':  # next node within a list of children
+        frames.append(Frame(keys[-1]))
+
+      elif event == 'end_map':
+        frame = frames.pop()
+        node = frame.fields
+        if frame.key is not None:
+          populate(node, counts, frame.key)
+        elif 'lat' in node:  # leaf or buffered node with its own key
+          dfs(node, counts)
+        else:
+          dfs(node, counts, frame.parent_key)
+
+      elif event == 'end_array':  # end of a list of children
+        keys.pop()
+
+      else:  # event == 'map_key'
+        name = value
+
+    elif name == 'children' and event == 'start_array':
+      frame = frames[-1]
+      frame.key = open_node(frame.fields, counts)
+      if frame.key is None:
+        frame.fields['children'] = build_value(event, value, events)
+      else:
+        keys.append(frame.key)
+      name = None
+
+    else:
+      if event in ('start_map', 'start_array'):
+        value = build_value(event, value, events)
+      frames[-1].fields[name] = value
+      name = None
+
+
+def save_as_df(columns: Columns, path: str = definitions.MP_DATA_PATH):
+  """Save tree data in table form."""
+  df = columns.to_df()
+  print(f'Writing table data to {path}')
+  # the CSV file is uploaded to earth engine; the column store is read locally
+  tables.write_table(df, path)
+
+
+def main(stream: bool = False, n_processes: int = 1, incremental: bool = False):
+  """Convert tree data to table data.
+
+  With stream=True the tree is aggregated while the file is being read, so
+  peak memory is bounded by the depth of the tree rather than the file size.
+  With n_processes > 1 the top-level areas are aggregated in parallel.
+  With incremental=True only the subtrees that changed since the last
+  incremental parse are traversed."""
+  if stream + (n_processes > 1) + incremental > 1:
+    raise ValueError('Choose at most one of stream, n_processes, incremental.')
+
+  if stream:
+    print('Streaming MP data through DFS ...')
+    counts = {}
+    with open(definitions.MP_SCRAPE_JSON_PATH, 'rb') as f:
+      stream_dfs(f, counts)
+    columns = Columns.from_counts(counts)
+  elif incremental:
+    with open(definitions.MP_SCRAPE_JSON_PATH, 'rb') as f:
+      data = f.read()
+    print('Searching changed subtrees with DFS ...')
+    columns = Columns()
+    index = incremental_dfs(data, columns, load_index())
+    save_index(index)
+  elif n_processes > 1:
+    root = load_data()
+    print(f'Searching data tree with DFS on {n_processes} processes ...')
+    columns = Columns()
+    parallel_dfs(root, columns, n_processes)
+  else:
+    root = load_data()
+    print('Searching data tree with DFS ...')
+    columns = Columns()
+    iterative_dfs(root, columns)
   print('Done searching data tree.')
-  save_as_df(counts)
+  save_as_df(columns)
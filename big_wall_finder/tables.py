@@ -0,0 +1,151 @@
+"""Read and write pipeline tables as CSV and as compact column stores.
+
+A column store is an uncompressed .npz file written next to the CSV file of the
+same name. Each column is saved in the smallest dtype holding its values
+exactly, eg int8 for flags and float32 for floats which fit, while strings are
+saved as a single UTF-8 buffer with offsets and categoricals as integer codes
+next to their categories. The original dtype of each column
+is recorded so that reading a column store gives the same DataFrame as reading
+the CSV file, without parsing text or inferring dtypes.
+
+Tables may be read with a schema mapping column names, or fnmatch patterns of
+them, to dtypes; see apply_schema.
+"""
+
+from __future__ import annotations
+import fnmatch
+import os
+import numpy as np
+import pandas as pd
+
+
+INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def columnar_path(path: str):
+  """Get the path of the column store next to a CSV file."""
+  return os.path.splitext(path)[0] + '.npz'
+
+
+def smallest_int(values: np.ndarray):
+  """Get the smallest integer dtype holding values."""
+  if not len(values):
+    return np.int8
+  lo, hi = values.min(), values.max()
+  return next(d for d in INT_DTYPES if np.iinfo(d).min <= lo and hi <= np.iinfo(d).max)
+
+
+def encode(column: pd.Series):
+  """Encode a column as arrays keyed by suffix."""
+  dtype = str(column.dtype)
+  if column.dtype == bool:
+    return {'': column.to_numpy(), '.dtype': np.array(dtype)}
+
+  if pd.api.types.is_integer_dtype(column.dtype):
+    values = column.to_numpy()
+    return {'': values.astype(smallest_int(values)), '.dtype': np.array(dtype)}
+
+  if pd.api.types.is_float_dtype(column.dtype):
+    values = column.to_numpy()
+    integral = np.isfinite(values).all() and (values == np.round(values)).all()
+    if integral and np.abs(values).max(initial=0) < 2 ** 31:
+      values = values.astype(smallest_int(values.astype(np.int64)))
+    elif np.array_equal(values.astype(np.float32), values, equal_nan=True):
+      values = values.astype(np.float32)
+    return {'': values, '.dtype': np.array(dtype)}
+
+  if isinstance(column.dtype, pd.CategoricalDtype):
+    # codes, and the categories encoded as a column of their own
+    codes = column.cat.codes.to_numpy()
+    categories = encode(pd.Series(column.cat.categories, name=column.name))
+    return {'': codes.astype(smallest_int(codes)),
+            **{'.categories' + suffix: array for suffix, array in categories.items()},
+            '.ordered': np.array(column.cat.ordered),
+            '.dtype': np.array('category')}
+
+  if pd.api.types.is_string_dtype(column.dtype):
+    is_null = column.isna().to_numpy()
+    encoded = [b'' if null else str(s).encode() for s, null in zip(column, is_null)]
+    lengths = np.array([len(s) for s in encoded], dtype=np.int64)
+    return {'': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            '.offsets': np.concatenate([[0], np.cumsum(lengths)]),
+            '.null': is_null,
+            '.dtype': np.array(dtype)}
+
+  raise TypeError(f'Cannot store column {column.name} with dtype {dtype}.')
+
+
+def decode(arrays: dict[str, np.ndarray], name: str):
+  """Decode a column from the arrays written by encode."""
+  dtype = str(arrays['.dtype'])
+  if '.categories.dtype' in arrays:
+    categories = decode({suffix[len('.categories'):]: array for suffix, array in arrays.items()
+                         if suffix.startswith('.categories')}, None)
+    return pd.Series(pd.Categorical.from_codes(arrays[''], categories,
+                                               ordered=bool(arrays['.ordered'])), name=name)
+  if '.offsets' not in arrays:
+    return pd.Series(arrays[''], name=name).astype(dtype)
+  buffer, offsets = arrays[''].tobytes(), arrays['.offsets']
+  # nulls read back as NaN, as from the CSV file
+  values = [np.nan if null else buffer[start:stop].decode()
+            for start, stop, null in zip(offsets[:-1], offsets[1:], arrays['.null'])]
+  return pd.Series(values, name=name, dtype=dtype)
+
+
+def write_columns(df: pd.DataFrame, path: str):
+  """Write df as a column store."""
+  arrays = {'columns': np.array(df.columns, dtype=str)}
+  for i, name in enumerate(df.columns):
+    for suffix, array in encode(df[name]).items():
+      arrays[f'{i}{suffix}'] = array
+  np.savez(path, **arrays)
+
+
+def read_columns(path: str):
+  """Read a column store written by write_columns."""
+  with np.load(path) as npz:
+    names = npz['columns'].tolist()
+    arrays = {}
+    for key in npz.files:
+      i, _, suffix = key.partition('.')
+      if i != 'columns':
+        arrays.setdefault(int(i), {})['.' + suffix if suffix else ''] = npz[key]
+  return pd.DataFrame({name: decode(arrays[i], name) for i, name in enumerate(names)})
+
+
+def write_table(df: pd.DataFrame, path: str, csv: bool = True, columnar: bool = True):
+  """Write df as CSV to path and as a column store next to it."""
+  if csv:
+    df.to_csv(path, header=True, index=False)
+  if columnar:
+    write_columns(df, columnar_path(path))
+
+
+def apply_schema(df: pd.DataFrame, schema: dict[str, str], default: str | None = None):
+  """Cast the columns of df to the dtypes of schema.
+
+  Keys of schema are column names or fnmatch patterns, and the first matching
+  key gives the dtype of a column. Numeric columns matching no key are cast to
+  default, if given. Columns already of their dtype are not copied."""
+  dtypes = {}
+  for name in df.columns:
+    dtype = next((d for key, d in schema.items() if fnmatch.fnmatchcase(name, key)), None)
+    if dtype is None and default is not None and pd.api.types.is_numeric_dtype(df[name]) \
+        and df[name].dtype != bool:
+      dtype = default
+    if dtype is not None and str(df[name].dtype) != dtype:
+      dtypes[name] = dtype
+  return df.astype(dtypes) if dtypes else df
+
+
+def read_table(path: str, schema: dict[str, str] | None = None, default: str | None = None):
+  """Read the table at CSV path, preferring a column store no older than it.
+
+  With a schema, columns are cast as in apply_schema."""
+  npz = columnar_path(path)
+  if os.path.exists(npz) and (not os.path.exists(path) or
+                              os.path.getmtime(npz) >= os.path.getmtime(path)):
+    df = read_columns(npz)
+  else:
+    df = pd.read_csv(path)
+  return df if schema is None else apply_schema(df, schema, default)
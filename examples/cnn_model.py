@@ -4,6 +4,7 @@ import os
 import glob
 import tensorflow as tf
 from tensorflow.keras import layers
+from big_wall_finder.models.cnn.naip_dataset import build_dataset as build_shard_dataset
 
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), 'yosemite_shards')
@@ -24,34 +25,24 @@ FEATURES_DICT = dict(zip(FEATURES, COLUMNS))
 
 @tf.function
 def convert_to_tuple(inputs):
-  """Helper function to convert features into an input, output tuple."""
+  """Helper function to convert a batch of features into an input, output tuple."""
   feature_list = [inputs.get(key) for key in FEATURES[:4]]
-  stacked = tf.stack(feature_list, axis=0)
-  # Convert from CHW to HWC
-  stacked = tf.transpose(stacked, [1, 2, 0])
+  # stacking bands last gives batches of HWC images
+  stacked = tf.stack(feature_list, axis=-1)
   slope = inputs.get('slope') / 90
   sin_aspect = tf.math.sin(inputs.get('aspect') / 360 * 2 * 3.14159)
   cos_aspect = tf.math.cos(inputs.get('aspect') / 360 * 2 * 3.14159)
-  return stacked, [slope, cos_aspect, sin_aspect]
+  return stacked, tf.stack([slope, cos_aspect, sin_aspect], axis=-1)
 
 
 def build_dataset(arg: str):
   """Load, parse, and return tf dataset for train and eval TFRecords."""
   if arg == 'train':
-    records = TRAIN_RECORDS
-  elif arg == 'eval':
-    records = EVAL_RECORDS
-  else:
-    raise ValueError
-
-  dataset = tf.data.TFRecordDataset(records, compression_type='GZIP')
-  dataset = dataset.map(
-      lambda inputs: tf.io.parse_single_example(inputs, FEATURES_DICT))
-
-  dataset = dataset.map(convert_to_tuple)
-  if arg == 'train':
-    return dataset.shuffle(10000).batch(16)
-  return dataset.batch(1)
+    return build_shard_dataset(TRAIN_RECORDS, FEATURES_DICT, 16, convert_to_tuple,
+                               shuffle_buffer=10000)
+  if arg == 'eval':
+    return build_shard_dataset(EVAL_RECORDS, FEATURES_DICT, 1, convert_to_tuple)
+  raise ValueError
 
 
 @tf.function
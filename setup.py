@@ -8,6 +8,7 @@ description = 'Apply ML to GIS to discover big walls.'
 
 install_requires = [
     'earthengine_api',
+    'ijson',
     'pandas',
     'xgboost',
     'scikit_learn',
@@ -0,0 +1,58 @@
+"""Benchmark reading NAIP shards with naip_dataset against a serial pipeline.
+
+Also compares float shards with the compact shards of convert_shard.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tensorflow as tf
+from naip_helpers import KERNEL_SIZE, build_serial_dataset, convert_shards, write_shards
+from big_wall_finder.models.cnn import naip_dataset
+
+
+def records_per_second(dataset, n_epochs=2):
+  """Iterate over a dataset; return records per second of each epoch."""
+  rates = []
+  for _ in range(n_epochs):
+    start, n_records = time.perf_counter(), 0
+    for batch in dataset:
+      n_records += int(tf.shape(batch['cliff_id'])[0])
+    rates.append(n_records / (time.perf_counter() - start))
+  return rates
+
+
+def benchmark(n_shards: int = 16, n_records: int = 2000, batch_size: int = 64):
+  """Compare records per second of the serial and the naip_dataset pipelines."""
+  features = naip_dataset.naip_features(KERNEL_SIZE)
+  with tempfile.TemporaryDirectory() as directory:
+    filenames = write_shards(directory, n_shards, n_records)
+    print(f'{n_shards} shards of {n_records} records, batches of {batch_size}.')
+    pipelines = {
+        'serial': build_serial_dataset(filenames, features, batch_size),
+        'naip_dataset': naip_dataset.build_dataset(filenames, features, batch_size),
+        'naip_dataset, cached': naip_dataset.build_dataset(
+            filenames, features, batch_size, cache=os.path.join(directory, 'cache'))}
+    os.makedirs(os.path.join(directory, 'compact'))
+    compact = convert_shards(filenames, os.path.join(directory, 'compact'))
+    pipelines['compact'] = naip_dataset.build_dataset(
+        compact, naip_dataset.compact_features(), batch_size,
+        decode=naip_dataset.decode_compact(KERNEL_SIZE))
+    pipelines['compact, cached'] = naip_dataset.build_dataset(
+        compact, naip_dataset.compact_features(), batch_size,
+        cache=os.path.join(directory, 'compact_cache'),
+        decode=naip_dataset.decode_compact(KERNEL_SIZE))
+    for name, dataset in pipelines.items():
+      rates = ', '.join(f'{rate:,.0f}' for rate in records_per_second(dataset))
+      print(f'{name}: {rates} records/s by epoch')
+
+    for name, shards in [('float', filenames), ('compact', compact)]:
+      size = sum(os.path.getsize(f) for f in shards)
+      raw = sum(len(record.numpy()) for record in
+                tf.data.TFRecordDataset(shards, compression_type='GZIP'))
+      print(f'{name} shards: {size / 2 ** 20:.1f} MB gzipped, {raw / 2 ** 20:.1f} MB of records')
+
+
+if __name__ == '__main__':
+  benchmark(*[int(arg) for arg in sys.argv[1:]])
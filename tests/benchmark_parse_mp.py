@@ -0,0 +1,80 @@
+"""Benchmark the columnar traversal of parse_mp against the recursive dfs."""
+
+import sys
+import time
+import random
+import pandas as pd
+from big_wall_finder.mp import parse_mp as mp
+
+
+def build_synthetic_tree(n_routes: int):
+  """Build a tree of states, areas, and crags holding roughly n_routes."""
+  random.seed(0)
+  types = [['trad'], ['sport', 'tr'], ['boulder'], ['ice', 'alpine']]
+  root = mp.root_node()
+  root['children'] = []
+  n_crags = n_routes // 20
+  for i in range(n_crags):
+    if i % 2000 == 0:
+      state = {'name': f'State {i}', 'lat': 39.0, 'long': -110.0,
+               'gps2': '39.0,-110.0', 'totalViews': 0, 'children': []}
+      root['children'].append(state)
+    if i % 20 == 0:
+      lat, long = 35 + i / n_crags * 10, -120 + i / n_crags * 10
+      area = {'name': f'Area {i}', 'lat': lat, 'long': long,
+              'gps2': f'{lat},{long}', 'totalViews': 10, 'children': []}
+      state['children'].append(area)
+    # most crags get their own coordinates, some inherit from the area
+    crag = {'name': f'Crag {i}', 'totalViews': 10, 'children': [
+        {'name': f'Route {j}', 'types': random.choice(types),
+         'totalViews': random.randint(0, 1000)} for j in range(20)]}
+    if i % 4:
+      lat, long = area['lat'] + i * 1e-6, area['long'] - i * 1e-6
+      crag.update({'lat': lat, 'long': long, 'gps2': f'{lat},{long}'})
+    area['children'].append(crag)
+  return root
+
+
+def legacy_df(counts):
+  """Build the table row by row, as save_as_df did before columns."""
+  df = []
+  for coord, count in counts.items():
+    row = {
+        'latitude': coord.latitude,
+        'longitude': coord.longitude,
+        'name': count.name,
+        'n_boulder': count.n_boulder,
+        'n_winter': count.n_winter,
+        'n_rock': count.n_rock,
+        'n_views': count.n_views
+    }
+    if row['n_boulder'] + row['n_winter'] + row['n_rock']:
+      df.append(row)
+  return pd.DataFrame(df)
+
+
+def benchmark(n_routes: int = 2_000_000):
+  """Time both traversals and check that they build the same table."""
+  root = build_synthetic_tree(n_routes)
+  print(f'Synthetic tree with {n_routes} routes.')
+
+  start = time.perf_counter()
+  counts = {}
+  mp.dfs(root, counts)
+  expected = legacy_df(counts)
+  legacy = time.perf_counter() - start
+  print(f'dfs + row-wise DataFrame: {legacy:.2f}s')
+
+  start = time.perf_counter()
+  columns = mp.Columns()
+  mp.iterative_dfs(root, columns)
+  df = columns.to_df()
+  columnar = time.perf_counter() - start
+  print(f'iterative_dfs + to_df: {columnar:.2f}s ({legacy / columnar:.1f}x)')
+
+  pd.testing.assert_frame_equal(df, expected)
+  print(f'Tables match: {len(df)} rows.')
+
+
+if __name__ == '__main__':
+  benchmark(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,35 @@
+"""Benchmark column stores against CSV on a table shaped like merged_data."""
+
+import os
+import sys
+import time
+import tempfile
+import pandas as pd
+from helpers import build_synthetic_table
+from big_wall_finder import tables
+
+
+def benchmark(n_rows: int = 200_000):
+  """Compare file sizes and load times of CSV and column stores."""
+  df = build_synthetic_table(n_rows)
+  print(f'Synthetic table with {n_rows} rows and {df.shape[1]} columns.')
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'merged_data.csv')
+    tables.write_table(df, path)
+    npz = tables.columnar_path(path)
+    csv_size, npz_size = os.path.getsize(path) / 1e6, os.path.getsize(npz) / 1e6
+    print(f'CSV: {csv_size:.1f} MB, column store: {npz_size:.1f} MB')
+
+    start = time.perf_counter()
+    expected = pd.read_csv(path)
+    csv_time = time.perf_counter() - start
+    start = time.perf_counter()
+    loaded = tables.read_columns(npz)
+    npz_time = time.perf_counter() - start
+    print(f'CSV load: {csv_time:.2f}s, column store load: {npz_time:.2f}s '
+          f'({csv_time / npz_time:.0f}x)')
+    pd.testing.assert_frame_equal(loaded, expected)
+
+
+if __name__ == '__main__':
+  benchmark(*[int(arg) for arg in sys.argv[1:]])
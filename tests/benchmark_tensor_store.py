@@ -0,0 +1,69 @@
+"""Benchmark reading NAIP patches from a tensor store against TFRecord shards."""
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import tensorflow as tf
+from benchmark_naip_dataset import records_per_second
+from naip_helpers import KERNEL_SIZE, convert_shards, write_shards
+from big_wall_finder.models.cnn import naip_dataset, tensor_store
+
+
+def scan_cliff(filenames, cliff_id: str):
+  """Patches of one cliff found by scanning compact shards."""
+  dataset = naip_dataset.build_dataset(filenames, naip_dataset.compact_features(), 1024,
+                                       decode=naip_dataset.decode_compact(KERNEL_SIZE))
+  dataset = dataset.unbatch().filter(lambda record: record['cliff_id'] == cliff_id)
+  return [record['R'] for record in dataset]
+
+
+def benchmark(n_shards: int = 16, n_records: int = 2000, batch_size: int = 64):
+  """Compare epochs and per-cliff lookups of compact shards and a tensor store."""
+  with tempfile.TemporaryDirectory() as directory:
+    filenames = write_shards(directory, n_shards, n_records)
+    os.makedirs(os.path.join(directory, 'compact'))
+    compact = convert_shards(filenames, os.path.join(directory, 'compact'))
+    print(f'{n_shards} shards of {n_records} records, batches of {batch_size}.')
+
+    start = time.perf_counter()
+    tensor_store.build_store(compact, os.path.join(directory, 'store'),
+                             naip_dataset.compact_features(),
+                             decode=naip_dataset.decode_compact(KERNEL_SIZE))
+    print(f'build_store: {time.perf_counter() - start:.1f}s')
+    store = tensor_store.TensorStore.load(os.path.join(directory, 'store'))
+
+    dataset = naip_dataset.build_dataset(compact, naip_dataset.compact_features(), batch_size,
+                                         decode=naip_dataset.decode_compact(KERNEL_SIZE))
+    rates = ', '.join(f'{rate:,.0f}' for rate in records_per_second(dataset))
+    print(f'compact shards: {rates} records/s by epoch')
+    for name, batches in [('shuffled views', lambda: store.batches(batch_size, True, 0)),
+                          ('random rows', lambda: (store.take(rows) for rows in np.array_split(
+                              np.random.default_rng(0).permutation(len(store)),
+                              len(store) // batch_size)))]:
+      rates = []
+      for _ in range(2):
+        start, n_records = time.perf_counter(), 0
+        for patches, _ in batches():
+          patches.sum()  # reading every patch, as training would
+          n_records += len(patches)
+        rates.append(n_records / (time.perf_counter() - start))
+      print(f'tensor store, {name}: ' + ', '.join(f'{rate:,.0f}' for rate in rates)
+            + ' records/s by epoch')
+
+    cliff_id = store.cliff_ids[len(store.cliff_ids) // 2]
+    start = time.perf_counter()
+    n_scanned = len(scan_cliff(compact, cliff_id))
+    scan_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    patches = np.array(store.cliff(cliff_id))
+    store_seconds = time.perf_counter() - start
+    assert len(patches) == n_scanned
+    print(f'patches of one cliff: scanning {scan_seconds * 1000:.0f} ms, '
+          f'tensor store {store_seconds * 1000:.3f} ms')
+
+
+if __name__ == '__main__':
+  tf.get_logger().setLevel('ERROR')
+  benchmark(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,48 @@
+"""Benchmark NumPy evaluation of exported tree ensembles against native predict."""
+
+import sys
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from xgboost import XGBRegressor
+from helpers import build_synthetic_table
+from big_wall_finder.models import predict
+from big_wall_finder.models.tree_ensemble import TreeEnsemble
+
+
+def best_time(f, repeat=3):
+  """Best wall time of calling f."""
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    f()
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+
+def benchmark(n_rows: int = 100_000, n_estimators: int = 500):
+  """Compare throughput and single row latency of exported and native models."""
+  data = build_synthetic_table(n_rows)
+  X = data.drop(columns=predict.NON_FEATURES, errors='ignore').to_numpy()
+  y = data.mp_score.to_numpy()
+  train = np.arange(n_rows) < 10_000
+  models = {'forest': RandomForestRegressor(n_estimators, max_depth=10, n_jobs=1),
+            'xgb': XGBRegressor(n_estimators=n_estimators, n_jobs=1)}
+  print(f'{n_rows} rows, {X.shape[1]} features, {n_estimators} trees, one thread.')
+  for name, model in models.items():
+    model.fit(X[train], y[train])
+    ensemble = TreeEnsemble.from_model(model)
+    native_time = best_time(lambda: model.predict(X))
+    numpy_time = best_time(lambda: ensemble.predict(X))
+    error = np.abs(ensemble.predict(X) - model.predict(X)).max()
+    print(f'{name}: native {n_rows / native_time:,.0f} rows/s, '
+          f'NumPy {n_rows / numpy_time:,.0f} rows/s, '
+          f'{len(ensemble.feature):,} nodes, max error {error:.1e}')
+    native_time = best_time(lambda: [model.predict(X[i:i + 1]) for i in range(20)])
+    numpy_time = best_time(lambda: [ensemble.predict(X[i:i + 1]) for i in range(20)])
+    print(f'{name} single row: native {native_time / 20 * 1000:.2f} ms, '
+          f'NumPy {numpy_time / 20 * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+  benchmark(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,27 @@
+"""Fixtures shared by the tests."""
+
+import pytest
+from helpers import build_synthetic_table
+from big_wall_finder import tables
+from big_wall_finder.models import predict
+
+
+@pytest.fixture
+def merged_data(monkeypatch, tmp_path):
+  """Point predict at a merged_data table in a temporary directory.
+
+  Yields a function writing a table there, by default a synthetic one of
+  n_rows, and returning it."""
+  monkeypatch.setattr(predict, 'DATA_PATH', str(tmp_path / 'merged_data.csv'))
+  monkeypatch.setattr(predict, 'PARAMS_PATH', str(tmp_path / 'best_params.json'))
+  predict.load_best_params.cache_clear()
+
+  def write(data=None, n_rows=2000):
+    data = build_synthetic_table(n_rows) if data is None else data
+    tables.write_table(data, predict.DATA_PATH)
+    predict.load_features.cache_clear()
+    return data
+
+  yield write
+  predict.load_features.cache_clear()
+  predict.load_best_params.cache_clear()
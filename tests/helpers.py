@@ -0,0 +1,29 @@
+"""Build synthetic data shared by tests and benchmarks."""
+
+import numpy as np
+import pandas as pd
+
+
+def build_synthetic_table(n_rows: int):
+  """Build a table with the columns and value ranges of merged_data."""
+  rng = np.random.default_rng(0)
+  df = {'latitude': rng.uniform(31, 49, n_rows),
+        'longitude': rng.uniform(-125, -102, n_rows),
+        'height': rng.integers(50, 1000, n_rows) / 1000,
+        'pixel_count': rng.uniform(0, 3, n_rows),
+        'elevation': rng.uniform(0, 4000, n_rows)}
+  for p in range(10, 100, 10):
+    df[f'slope_p{p}'] = rng.uniform(60, 90, n_rows)
+  for band in ['B2', 'B4', 'B5', 'B6', 'B7', 'B42', 'B65', 'B67']:
+    for p in [20, 35, 50, 65, 80]:
+      df[f'{band}_p{p}'] = rng.normal(size=n_rows)
+  for band in ['R', 'G', 'B', 'N']:
+    for p in [10, 50, 90]:
+      df[f'{band}_p{p}'] = rng.integers(0, 256, n_rows).astype(np.float64)
+  for rock in ['carbonate', 'non_carbonate', 'silicic_residual',
+               'colluvial_sediment', 'glacial_till_coarse', 'alluvium']:
+    df[f'geology_{rock}'] = rng.random(n_rows)
+  df['mp_score'] = np.where(rng.random(n_rows) < 0.1, rng.random(n_rows), 0)
+  df['is_accessible'] = rng.random(n_rows) < 0.3
+  df['geo_id'] = np.arange(n_rows)
+  return pd.DataFrame(df)
@@ -0,0 +1,49 @@
+"""Write and read NAIP shards for tests and benchmarks."""
+
+import os
+import numpy as np
+import tensorflow as tf
+from big_wall_finder.models.cnn import naip_dataset
+
+
+KERNEL_SIZE = 15  # definitions.NAIP_KERNEL_SIZE
+
+
+def write_shards(directory: str, n_shards: int, n_records: int):
+  """Write gzipped shards of random patches shaped as those of cliff_naip."""
+  rng = np.random.default_rng(0)
+  filenames = []
+  for shard in range(n_shards):
+    filename = os.path.join(directory, f'naip_shard_{shard}.tfrecord.gz')
+    options = tf.io.TFRecordOptions(compression_type='GZIP')
+    with tf.io.TFRecordWriter(filename, options) as writer:
+      for i in range(n_records):
+        feature = {band: tf.train.Feature(float_list=tf.train.FloatList(
+            value=rng.integers(0, 256, KERNEL_SIZE ** 2).astype(np.float32)))
+                   for band in naip_dataset.PIXEL_BANDS}
+        # spectral gradient angles in radians
+        feature['S'] = tf.train.Feature(float_list=tf.train.FloatList(
+            value=rng.uniform(0, 1.5, KERNEL_SIZE ** 2).astype(np.float32)))
+        feature['cliff_id'] = tf.train.Feature(bytes_list=tf.train.BytesList(
+            value=[f'{shard}_{i // 20}'.encode()]))
+        writer.write(tf.train.Example(features=tf.train.Features(feature=feature))
+                     .SerializeToString())
+    filenames.append(filename)
+  return filenames
+
+
+def build_serial_dataset(filenames, features, batch_size):
+  """The pipeline of examples/cnn_model.py before naip_dataset."""
+  dataset = tf.data.TFRecordDataset(filenames, compression_type='GZIP')
+  dataset = dataset.map(lambda x: tf.io.parse_single_example(x, features))
+  return dataset.batch(batch_size)
+
+
+def convert_shards(filenames, directory):
+  """Write compact copies of float shards into directory."""
+  features = naip_dataset.naip_features(KERNEL_SIZE)
+  compact = []
+  for filename in filenames:
+    compact.append(os.path.join(directory, os.path.basename(filename)))
+    naip_dataset.convert_shard(filename, compact[-1], features)
+  return compact
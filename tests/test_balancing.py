@@ -0,0 +1,32 @@
+"""Test balancing mp_score classes by sample weights."""
+
+import numpy as np
+from sklearn.linear_model import Ridge
+from sklearn.neighbors import KNeighborsRegressor
+from big_wall_finder.models import predict
+
+
+def test_balanced_weights():
+  """Test that every class of mp_score gets the same total weight."""
+  rng = np.random.default_rng(0)
+  y = np.where(rng.random(5000) < 0.9, 0, rng.random(5000))
+  weights = predict.balanced_weights(y)
+  classes = np.ceil(10 * y).astype(int)
+  totals = [weights[classes == c].sum() for c in np.unique(classes)]
+  assert np.allclose(totals, totals[0])
+  assert np.isclose(weights.mean(), 1)
+
+
+def test_weighted_indices():
+  """Test that resampling keeps the size of the training set and follows the weights."""
+  weights = np.array([1.0] * 900 + [9.0] * 100)
+  indices = predict.weighted_indices(weights)
+  assert len(indices) == len(weights)
+  assert abs((indices >= 900).mean() - 0.5) < 0.05
+  assert predict.accepts_sample_weight('ridge', Ridge())
+  assert not predict.accepts_sample_weight('knn', KNeighborsRegressor())
+
+
+if __name__ == '__main__':
+  test_balanced_weights()
+  test_weighted_indices()
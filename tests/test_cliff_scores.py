@@ -0,0 +1,111 @@
+"""Test the streaming reduction of CNN predictions by cliff."""
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+import tensorflow as tf
+from helpers import build_synthetic_table
+from naip_helpers import KERNEL_SIZE, write_shards
+from big_wall_finder.models import predict
+from big_wall_finder.models.cnn import cliff_scores, naip_dataset, tensor_store
+
+
+def expected_scores(cliff_ids, predictions):
+  """Reduce predictions by cliff with pandas."""
+  groups = pd.Series(predictions).groupby(np.asarray(cliff_ids), sort=False)
+  return pd.DataFrame({'cliff_id': list(groups.groups),
+                       'cnn_count': groups.size().to_numpy(),
+                       'cnn_mean': groups.mean().to_numpy(),
+                       'cnn_max': groups.max().to_numpy(),
+                       'cnn_q25': groups.quantile(0.25).to_numpy(),
+                       'cnn_q50': groups.quantile(0.5).to_numpy(),
+                       'cnn_q75': groups.quantile(0.75).to_numpy()})
+
+
+def check_scores(scores, expected):
+  """Compare a table of cliff scores to the one of pandas."""
+  assert list(scores.cliff_id) == list(expected.cliff_id)
+  assert np.array_equal(scores.cnn_count, expected.cnn_count)
+  for column in ['cnn_mean', 'cnn_max', 'cnn_q25', 'cnn_q50', 'cnn_q75']:
+    assert np.allclose(scores[column], expected[column], rtol=1e-5, atol=1e-6)
+
+
+def test_aggregator():
+  """Test that batches of any size give the scores of one groupby."""
+  rng = np.random.default_rng(0)
+  cliff_ids = np.repeat([f'c{i}' for i in range(50)], rng.integers(1, 30, 50))
+  predictions = rng.normal(size=len(cliff_ids))
+  expected = expected_scores(cliff_ids, predictions)
+  for batch_size in [1, 7, 64, len(cliff_ids)]:
+    aggregator = cliff_scores.CliffAggregator()
+    for start in range(0, len(cliff_ids), batch_size):
+      aggregator.update(cliff_ids[start:start + batch_size], predictions[start:start + batch_size])
+    check_scores(aggregator.result(), expected)
+
+  aggregator = cliff_scores.CliffAggregator()
+  with pytest.raises(ValueError):
+    aggregator.update(['a', 'a', 'b', 'a', 'c'], np.zeros(5))
+
+
+def test_no_patches():
+  """Test that scoring no patches gives an empty table with the usual columns."""
+  aggregator = cliff_scores.CliffAggregator()
+  aggregator.update([], np.zeros(0))
+  scores = aggregator.result()
+  assert list(scores.columns) == ['cliff_id', 'cnn_count', 'cnn_mean', 'cnn_max',
+                                  'cnn_q25', 'cnn_q50', 'cnn_q75']
+  assert len(scores) == 0 and scores.cnn_count.dtype == np.int32
+
+  features = naip_dataset.naip_features(KERNEL_SIZE)
+  assert len(cliff_scores.score_shards(None, [], features, lambda batch: batch)) == 0
+  merged = pd.DataFrame({'cliff_id': ['a', 'b'], 'height': [1.0, 2.0]})
+  joined = cliff_scores.join_scores(merged, scores)
+  assert list(joined.cnn_count) == [0, 0] and list(joined.cnn_max) == [0, 0]
+
+
+def test_score_shards():
+  """Test scoring shards and a tensor store with a keras model."""
+  inputs = tf.keras.Input((KERNEL_SIZE, KERNEL_SIZE, len(naip_dataset.NAIP_BANDS)))
+  outputs = tf.keras.layers.Dense(1)(tf.keras.layers.GlobalAveragePooling2D()(inputs))
+  model = tf.keras.Model(inputs, outputs)
+  features = naip_dataset.naip_features(KERNEL_SIZE)
+  stack = lambda batch: tf.stack([batch[band] for band in naip_dataset.NAIP_BANDS], axis=-1)
+
+  with tempfile.TemporaryDirectory() as directory:
+    filenames = write_shards(directory, 3, 50)
+    records = list(tf.data.TFRecordDataset(filenames, compression_type='GZIP')
+                   .batch(1000).map(lambda r: tf.io.parse_example(r, features)))[0]
+    predictions = model.predict_on_batch(stack(records)).ravel()
+    expected = expected_scores(cliff_scores.decode_ids(records['cliff_id'].numpy()), predictions)
+
+    check_scores(cliff_scores.score_shards(model, filenames, features, stack, batch_size=16),
+                 expected)
+    tensor_store.build_store(filenames, os.path.join(directory, 'store'), features)
+    store = tensor_store.TensorStore.load(os.path.join(directory, 'store'))
+    scores = cliff_scores.score_store(model, store, batch_size=16)
+    check_scores(scores, expected.sort_values('cliff_id', ignore_index=True))
+
+  merged = pd.DataFrame({'cliff_id': ['0_0', 'none', '2_1'], 'height': [1.0, 2.0, 3.0]})
+  joined = cliff_scores.join_scores(merged, scores)
+  assert list(joined.cnn_count) == [20, 0, 20]
+  assert joined.cnn_mean[1] == 0 and list(joined.height) == [1.0, 2.0, 3.0]
+
+
+def test_join_scores(merged_data):
+  """Test that models train on merged_data joined with scores of some cliffs."""
+  data = build_synthetic_table(500)
+  data['cliff_id'] = data.geo_id.astype(str)
+  scores = expected_scores(np.repeat(data.cliff_id[::3].to_numpy(), 2),
+                           np.random.default_rng(0).random(2 * len(data.cliff_id[::3])))
+  joined = cliff_scores.join_scores(data, scores)
+  assert not joined.isna().any().any()
+  merged_data(joined)
+  model = predict.Model('linear', random_state=0)
+  model.train()
+  assert 'cnn_mean' in model.X_train and 'cliff_id' not in model.X_train
+
+
+if __name__ == '__main__':
+  pytest.main([__file__])
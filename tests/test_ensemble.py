@@ -0,0 +1,25 @@
+"""Test ranking cliffs with an ensemble of models."""
+
+import numpy as np
+from big_wall_finder.models.ensemble import Ensemble
+
+
+def test_ensemble(merged_data):
+  """Test that the ranked table sums the weighted member scores."""
+  merged_data()
+  ensemble = Ensemble(['ridge', 'tree'], [2, 0.5], random_state=0)
+  # members share one split
+  assert ensemble.members['ridge'].X_train is ensemble.members['tree'].X_train
+  output = ensemble.run()
+
+  assert list(output.members.name) == ['ridge', 'tree']
+  assert (output.members.fit_seconds > 0).all()
+  results = output.results
+  assert (results.mp_score == 0).all()
+  assert np.allclose(results.summary_score, 2 * results.ridge_score + 0.5 * results.tree_score)
+  assert (np.diff(results.summary_score) <= 0).all()
+
+
+if __name__ == '__main__':
+  import pytest
+  pytest.main([__file__])
@@ -0,0 +1,34 @@
+"""Test the geometry store."""
+
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+from big_wall_finder.local import geometry_store as gs
+
+
+def test_round_trip():
+  """Test that geometries survive saving, memory-mapping, and lookup."""
+  square = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+  hole = [[0.25, 0.25], [0.75, 0.25], [0.5, 0.75], [0.25, 0.25]]
+  triangle = [[2.5, 2], [3, 2], [3, 3.125], [2.5, 2]]
+  geos = [{'type': 'Polygon', 'coordinates': [square, hole]},
+          {'type': 'MultiPolygon', 'coordinates': [[triangle], [square]]},
+          {'type': 'Polygon', 'coordinates': [triangle]}]
+  df = pd.DataFrame({'.geo': [json.dumps(geo) for geo in geos], 'height': [1, 2, 3]})
+
+  with tempfile.TemporaryDirectory() as directory:
+    df = gs.split_geometry(df, directory)
+    store = gs.GeometryStore.load(directory)
+    assert isinstance(store.coords, np.memmap)
+    assert list(df.columns) == ['height', 'geo_id']
+    assert [json.loads(store.to_geojson(i)) for i in df.geo_id] == geos
+
+    starts, ends, offsets = store.segments()
+    assert offsets.tolist() == [0, 7, 14, 17]
+    assert starts[7:10].tolist() == triangle[:3]
+    assert ends[7:10].tolist() == triangle[1:]
+
+
+if __name__ == '__main__':
+  test_round_trip()
@@ -0,0 +1,60 @@
+"""Test successive halving search of hyperparameters."""
+
+import numpy as np
+from big_wall_finder.models import halving, predict
+
+
+def build_data():
+  """Build a small regression problem."""
+  rng = np.random.default_rng(0)
+  X = rng.normal(size=(400, 5))
+  y = X[:, 0] - 2 * X[:, 1] ** 2 + rng.normal(size=400)
+  return X, y
+
+
+def test_halving_search():
+  """Test that halving returns parameters in the format of the random grids."""
+  X, y = build_data()
+  for name in ['ridge', 'knn', 'forest', 'xgb']:
+    grid = predict.RANDOM_GRIDS[name]
+    params = halving.halving_search(name, predict.build_estimator(name, X.shape[1]),
+                                    grid, X, y, n_candidates=9, verbose=0,
+                                    n_jobs=1, random_state=0)
+    assert set(params) == set(grid)
+    for key, value in params.items():
+      assert value in grid[key]
+
+
+def test_early_stopping():
+  """Test that xgb stops boosting before using its whole budget."""
+  X, y = build_data()
+  estimator = halving.with_early_stopping('xgb', predict.build_estimator('xgb', X.shape[1]))
+  estimator.set_params(n_estimators=500, learning_rate=.3)
+  estimator.fit(X, y)
+  assert estimator.best_iteration < 499
+  assert estimator.score(X, y) > 0.5
+
+
+def test_sample_weight(monkeypatch):
+  """Test that halving passes sample_weight on to the fits which take it."""
+  X, y = build_data()
+  sample_weight = np.random.default_rng(1).uniform(0, 2, len(y))
+  weighted = []
+  fit = halving.EarlyStoppingXGBRegressor.fit
+  def spy(self, X, y, sample_weight=None, **kwargs):
+    weighted.append(sample_weight is not None)
+    return fit(self, X, y, sample_weight=sample_weight, **kwargs)
+  monkeypatch.setattr(halving.EarlyStoppingXGBRegressor, 'fit', spy)
+  for name in ['xgb', 'knn']:
+    params = halving.halving_search(name, predict.build_estimator(name, X.shape[1]),
+                                    predict.RANDOM_GRIDS[name], X, y, n_candidates=6,
+                                    verbose=0, n_jobs=1, random_state=0,
+                                    sample_weight=sample_weight)
+    assert set(params) == set(predict.RANDOM_GRIDS[name])
+  assert weighted and all(weighted)
+
+
+if __name__ == '__main__':
+  test_halving_search()
+  test_early_stopping()
+  test_sample_weight()
@@ -0,0 +1,48 @@
+"""Test permutation importance of fitted models."""
+
+import numpy as np
+import pandas as pd
+from sklearn.inspection import permutation_importance
+from sklearn.linear_model import Ridge
+from sklearn.neighbors import KNeighborsRegressor
+from big_wall_finder.models import importance
+
+
+def build_data(n_rows=500):
+  """Build features of which only the first two matter."""
+  rng = np.random.default_rng(0)
+  X = pd.DataFrame(rng.normal(size=(n_rows, 5)).astype(np.float32),
+                   columns=['strong', 'weak', 'noise_1', 'noise_2', 'noise_3'])
+  y = 3 * X.strong + X.weak + 0.1 * rng.normal(size=n_rows)
+  return X, y
+
+
+def test_permutation_importance():
+  """Test that important features rank first, in one process and in several."""
+  X, y = build_data()
+  for estimator in [Ridge(), KNeighborsRegressor()]:
+    estimator.fit(X, y)
+    X_before = X.copy()
+    single = importance.permutation_importance(estimator, X, y, n_repeats=3)
+    pooled = importance.permutation_importance(estimator, X, y, n_repeats=3, n_processes=2)
+    pd.testing.assert_frame_equal(single, pooled)
+    pd.testing.assert_frame_equal(X, X_before)
+    assert list(single.feature[:2]) == ['strong', 'weak']
+    assert (single.importance[2:].abs() < 0.05).all()
+    # the estimator is not held after the call
+    assert not importance.worker_state
+
+
+def test_matches_sklearn():
+  """Test that mean importances agree with sklearn's."""
+  X, y = build_data()
+  estimator = Ridge().fit(X, y)
+  ours = importance.permutation_importance(estimator, X, y, n_repeats=20)
+  theirs = permutation_importance(estimator, X, y, n_repeats=20, random_state=0)
+  theirs = pd.Series(theirs.importances_mean, index=X.columns)
+  assert np.allclose(ours.set_index('feature').importance[X.columns], theirs, atol=0.1)
+
+
+if __name__ == '__main__':
+  test_permutation_importance()
+  test_matches_sklearn()
@@ -0,0 +1,49 @@
+"""Test incremental retraining on changed mp_score labels."""
+
+import numpy as np
+import pandas as pd
+from helpers import build_synthetic_table
+from big_wall_finder.models import predict
+
+
+def test_train_incremental(merged_data):
+  """Test that forest and xgb keep their fit and grow on new labels."""
+  data = build_synthetic_table(3000)
+  data['mp_score'] = (data.height + data.slope_p50 / 90) / 2
+  merged_data(data)
+  rng = np.random.default_rng(0)
+  changed = rng.choice(len(data), 100, replace=False)
+  delta = pd.Series(data.mp_score.to_numpy()[changed] * 1.1, index=changed)
+
+  forest = predict.Model('forest', {'n_estimators': 20}, random_state=0)
+  forest.train()
+  report = forest.train_incremental(delta, n_estimators=10, compare=True)
+  assert len(forest.model.estimators_) == 30
+  assert report.n_changed == (delta.index.isin(predict.load_features().y.index)).sum()
+  assert report.within(0.05)
+  changed_train = delta.index.intersection(forest.y_train.index)
+  assert np.allclose(forest.y_train.loc[changed_train], delta.loc[changed_train])
+  # the cached labels are left as they were
+  assert not np.allclose(predict.load_features().y.loc[changed_train],
+                         delta.loc[changed_train])
+
+  # a full train afterwards refits as many trees as before
+  assert not forest.model.get_params()['warm_start']
+  assert forest.model.get_params()['n_estimators'] == 20
+  trees = list(forest.model.estimators_)
+  forest.update_labels(delta * 0.9)
+  forest.train()
+  assert len(forest.model.estimators_) == 20
+  assert not any(tree is old for tree, old in zip(forest.model.estimators_, trees))
+
+  xgb = predict.Model('xgb', {'n_estimators': 50}, random_state=0)
+  xgb.train()
+  report = xgb.train_incremental(delta, n_estimators=10, compare=True)
+  assert xgb.model.get_booster().num_boosted_rounds() == 60
+  assert xgb.model.get_params()['n_estimators'] == 50
+  assert report.within(0.05)
+
+
+if __name__ == '__main__':
+  import pytest
+  pytest.main([__file__])
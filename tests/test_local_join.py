@@ -0,0 +1,54 @@
+"""Test the local join of MP data to cliffs."""
+
+import json
+import numpy as np
+import pandas as pd
+from big_wall_finder.local import cliff_join
+
+
+def square(lon: float, lat: float, size: float):
+  """Build a GeoJSON square with its lower left corner at lon, lat."""
+  ring = [[lon, lat], [lon + size, lat], [lon + size, lat + size],
+          [lon, lat + size], [lon, lat]]
+  return json.dumps({'type': 'Polygon', 'coordinates': [ring]})
+
+
+def test_join():
+  """Test distances and aggregation on two cliffs roughly 1km apart."""
+  # 0.001 degrees of latitude is roughly 111m
+  cliffs = pd.DataFrame({'.geo': [square(-119.6, 37.7, 0.002),
+                                  square(-119.6, 37.711, 0.002)]})
+  mp_data = pd.DataFrame({
+      'name': ['Inside', 'Near', 'Between', 'Vicinity', 'Far'],
+      'latitude': [37.701, 37.7045, 37.709, 37.696, 37.69],
+      'longitude': [-119.599, -119.599, -119.599, -119.6, -119.599],
+      'n_rock': [1, 2, 4, 8, 16],
+      'n_views': [10, 20, 40, 80, 160]})
+
+  joined = cliff_join.join(cliffs, mp_data)
+  # Near is 280m from the first cliff and 720m from the second; Between is
+  # 780m from the first and 220m from the second; Vicinity is 440m away
+  assert joined.n_rock.tolist() == [3, 4]
+  assert joined.n_views.tolist() == [30, 40]
+  assert joined.name.tolist() == ['Near - Inside - ', 'Between - ']
+  assert joined.vicinity_n_areas.tolist() == [4, 2]
+  assert joined.vicinity_n_rock.tolist() == [15, 6]
+
+
+def test_distance_to_segments():
+  """Test distances to a square with a square hole."""
+  square = np.array([[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]], dtype=float)
+  hole = np.array([[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]], dtype=float)
+  a = np.concatenate([square[:-1], hole[:-1]])
+  b = np.concatenate([square[1:], hole[1:]])
+  points = np.array([[0.5, 0.5], [2, 2.5], [6, 2], [2, -3]])
+  p = np.repeat(points, len(a), axis=0)
+  a, b = np.tile(a, (len(points), 1)), np.tile(b, (len(points), 1))
+  starts = np.arange(len(points)) * 8
+  distance = cliff_join.distance_to_segments(p, a, b, starts)
+  assert np.allclose(distance, [0, 0.5, 2, 3])
+
+
+if __name__ == '__main__':
+  test_join()
+  test_distance_to_segments()
@@ -0,0 +1,41 @@
+"""Test merge_data against the row by row merge it replaced."""
+
+import numpy as np
+import pandas as pd
+from big_wall_finder.models import merge_data
+
+
+def merge_mp_by_rows(cliff, mp):
+  """Merge cliff with mp one cliff at a time."""
+  cliff['mp_score'] = 0
+  cliff['num_views'] = 0
+  for i, row in cliff.iterrows():
+    filtered = mp[mp.custom_index == row.custom_index]
+    mp_count = filtered.shape[0]
+    if mp_count:
+      cliff.at[i, 'num_views'] = filtered.num_views.sum()
+      cliff.at[i, 'mp_score'] = 1000 + filtered.num_rock_routes.sum() + filtered.num_views.sum()
+  return cliff
+
+
+def test_merge_mp():
+  """Test the grouped merge on synthetic cliffs and MP areas."""
+  rng = np.random.default_rng(0)
+  n_cliffs, n_mp = 500, 300
+  cliff = pd.DataFrame({'custom_index': rng.permutation(n_cliffs) * 3,
+                        'height': rng.random(n_cliffs)})
+  mp = pd.DataFrame({
+      # many cliffs have several MP areas, and some MP areas match no cliff
+      'custom_index': rng.integers(0, 3 * n_cliffs + 100, n_mp),
+      'num_rock_routes': rng.integers(0, 50, n_mp),
+      'num_views': rng.integers(0, 10_000, n_mp)})
+  mp.loc[:10, ['num_rock_routes', 'num_views']] = 0
+
+  expected = merge_mp_by_rows(cliff.copy(), mp)
+  merged = merge_data.merge_mp(cliff.copy(), mp)
+  assert (expected.mp_score > 0).any()
+  pd.testing.assert_frame_equal(merged, expected)
+
+
+if __name__ == '__main__':
+  test_merge_mp()
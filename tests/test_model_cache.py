@@ -0,0 +1,77 @@
+"""Test the on-disk cache of fitted estimators."""
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Ridge
+from big_wall_finder.models import model_cache
+
+
+def build_data():
+  """Build a small training set."""
+  rng = np.random.default_rng(0)
+  X = pd.DataFrame(rng.normal(size=(100, 3)), columns=['a', 'b', 'c'])
+  y = pd.Series(X.a + rng.normal(size=100), name='mp_score')
+  return X, y
+
+
+def test_fingerprint():
+  """Test that keys change with the data and the params only."""
+  X, y = build_data()
+  key = model_cache.fingerprint(X, y, 'ridge', Ridge())
+  assert key == model_cache.fingerprint(X.copy(), y.copy(), 'ridge', Ridge())
+  assert key != model_cache.fingerprint(X, y, 'ridge', Ridge(alpha=2))
+  assert key != model_cache.fingerprint(X, y * 2, 'ridge', Ridge())
+  assert key != model_cache.fingerprint(X.iloc[1:], y.iloc[1:], 'ridge', Ridge())
+  assert key != model_cache.fingerprint(X.rename(columns={'a': 'd'}), y, 'ridge', Ridge())
+
+
+def test_cache():
+  """Test storing, loading, and evicting estimators."""
+  X, y = build_data()
+  with tempfile.TemporaryDirectory() as directory:
+    cache = model_cache.ModelCache(directory)
+    assert cache.get('missing') is None
+    estimator = Ridge().fit(X, y)
+    cache.put('first', estimator)
+    assert np.array_equal(cache.get('first').coef_, estimator.coef_)
+
+    # room for two estimators; the least recently used is evicted
+    cache.max_bytes = 2 * os.path.getsize(cache.path('first'))
+    cache.put('second', estimator)
+    os.utime(cache.path('second'), (0, 0))
+    cache.get('first')
+    cache.put('third', estimator)
+    assert cache.get('first') is not None
+    assert cache.get('second') is None
+    assert cache.get('third') is not None
+
+
+def test_concurrent_eviction(monkeypatch):
+  """Test that evicting tolerates files removed by another thread meanwhile."""
+  X, y = build_data()
+  estimator = Ridge().fit(X, y)
+  with tempfile.TemporaryDirectory() as directory:
+    cache = model_cache.ModelCache(directory)
+    for key in ['first', 'second', 'third']:
+      cache.put(key, estimator)
+    cache.max_bytes = 0
+
+    scandir, remove = os.scandir, os.remove
+    def racing_scandir(path):
+      entries = list(scandir(path))
+      remove(cache.path('first'))  # gone before its stat
+      return entries
+    def racing_remove(path):
+      remove(path)
+      remove(path)  # the other thread was first
+    monkeypatch.setattr(model_cache.os, 'scandir', racing_scandir)
+    monkeypatch.setattr(model_cache.os, 'remove', racing_remove)
+    cache.evict()
+    assert os.listdir(directory) == []
+
+
+if __name__ == '__main__':
+  test_fingerprint()
+  test_cache()
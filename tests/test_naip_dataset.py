@@ -0,0 +1,82 @@
+"""Test the tf.data pipeline over NAIP shards."""
+
+import os
+import tempfile
+import numpy as np
+import pytest
+import tensorflow as tf
+from naip_helpers import KERNEL_SIZE, build_serial_dataset, convert_shards, write_shards
+from big_wall_finder.models.cnn import cnn, naip_dataset, params
+
+
+def collect(dataset):
+  """Concatenate the batches of a dataset."""
+  batches = list(dataset.as_numpy_iterator())
+  return {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+
+
+def test_build_dataset():
+  """Test that interleaved, batch parsed records match serially parsed ones."""
+  features = naip_dataset.naip_features(KERNEL_SIZE)
+  with tempfile.TemporaryDirectory() as directory:
+    filenames = write_shards(directory, 3, 50)
+    expected = collect(build_serial_dataset(filenames, features, 16))
+    for cache in [None, '']:
+      parsed = collect(naip_dataset.build_dataset(filenames, features, 16, cache=cache))
+      # interleaving changes the order of records but not the records
+      order = np.lexsort(parsed['R'].reshape(len(parsed['R']), -1).T)
+      expected_order = np.lexsort(expected['R'].reshape(len(expected['R']), -1).T)
+      for key in features:
+        assert np.array_equal(parsed[key][order], expected[key][expected_order])
+
+    shuffled = naip_dataset.build_dataset(filenames, features, 16, shuffle_buffer=100,
+                                          repeat=2, drop_remainder=True)
+    assert sum(1 for _ in shuffled) == 300 // 16
+
+
+def test_compact_shards():
+  """Test that compact shards decode to the bands of the float shards."""
+  features = naip_dataset.naip_features(KERNEL_SIZE)
+  with tempfile.TemporaryDirectory() as directory:
+    filenames = write_shards(directory, 2, 30)
+    expected = collect(build_serial_dataset(filenames, features, 16))
+    compact = convert_shards(filenames, tempfile.mkdtemp(dir=directory))
+    decoded = collect(naip_dataset.build_dataset(
+        compact, naip_dataset.compact_features(), 16, cycle_length=1,
+        decode=naip_dataset.decode_compact(KERNEL_SIZE)))
+    for key in naip_dataset.PIXEL_BANDS + ['cliff_id']:
+      assert np.array_equal(decoded[key], expected[key])
+    assert decoded['S'].dtype == np.float32
+    assert np.abs(decoded['S'] - expected['S']).max() <= 0.5 / naip_dataset.S_SCALE + 1e-6
+
+  with pytest.raises(ValueError):
+    naip_dataset.encode_compact({'R': np.full((2, 2), 0.5), 'cliff_id': b'0'})
+
+
+def test_cnn_dataset():
+  """Test that the batches of cnn.py keep the batch axis first."""
+  with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, 'naip_shard_0.tfrecord.gz')
+    rng = np.random.default_rng(0)
+    options = tf.io.TFRecordOptions(compression_type='GZIP')
+    with tf.io.TFRecordWriter(filename, options) as writer:
+      for _ in range(40):
+        feature = {key: tf.train.Feature(float_list=tf.train.FloatList(
+            value=rng.uniform(0, 255, int(np.prod(spec.shape)))))
+                   for key, spec in params.FEATURES_DICT.items()}
+        writer.write(tf.train.Example(features=tf.train.Features(feature=feature))
+                     .SerializeToString())
+    dataset = cnn.build_training_dataset([filename])
+    n_bands = len(params.NAIP_KEYS)
+    inputs, outputs = dataset.element_spec
+    assert inputs.shape.as_list() == [None, params.KERNEL_SIZE, params.KERNEL_SIZE, n_bands]
+    assert outputs.shape.as_list() == [None, 1, 1]
+    inputs, outputs = next(iter(dataset))
+    assert inputs.shape == (params.BATCH_SIZE, params.KERNEL_SIZE, params.KERNEL_SIZE, n_bands)
+    assert outputs.shape == (params.BATCH_SIZE, 1, 1)
+
+
+if __name__ == '__main__':
+  test_build_dataset()
+  test_compact_shards()
+  test_cnn_dataset()
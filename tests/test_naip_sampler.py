@@ -0,0 +1,99 @@
+"""Test sampling NAIP patches of cliffs from local tiles."""
+
+import json
+import math
+import os
+import tempfile
+import numpy as np
+from big_wall_finder.local import naip_sampler
+from big_wall_finder.local.geometry_store import GeometryStore
+from big_wall_finder.models.cnn import naip_dataset
+
+
+KERNEL_SIZE = 5
+# 1e-5 degrees is roughly a meter
+TRANSFORM = (1e-5, 0, -119.6, 0, -1e-5, 37.7)
+
+
+def naive_gradient(bands):
+  """Spectral gradient computed pixel by pixel."""
+  unit = bands.astype(np.float64)
+  unit /= np.maximum(np.sqrt((unit ** 2).sum(axis=0)), 1e-300)
+  n_rows, n_cols = bands.shape[1:]
+  gradient = np.empty((n_rows, n_cols))
+  for r in range(n_rows):
+    for c in range(n_cols):
+      h = unit[:, r, max(c - 1, 0)] @ unit[:, r, min(c + 1, n_cols - 1)]
+      v = unit[:, max(r - 1, 0), c] @ unit[:, min(r + 1, n_rows - 1), c]
+      gradient[r, c] = np.arccos(np.clip(min(h, v), -1, 1))
+  return gradient
+
+
+def pixel_square(col, row, size, hole=None):
+  """GeoJSON square of the tile given in pixels, with an optional square hole."""
+  def ring(col, row, size):
+    corners = [[col, row], [col + size, row], [col + size, row + size],
+               [col, row + size], [col, row]]
+    return [[TRANSFORM[2] + c * TRANSFORM[0], TRANSFORM[5] + r * TRANSFORM[4]]
+            for c, r in corners]
+  rings = [ring(col, row, size)] + ([ring(*hole)] if hole else [])
+  return json.dumps({'type': 'Polygon', 'coordinates': rings})
+
+
+def test_sample_tile():
+  """Test sampled centers, patches, gradient, and shards on a synthetic tile."""
+  rng = np.random.default_rng(0)
+  bands = rng.integers(0, 256, (4, 60, 80), dtype=np.uint8)
+  bands[:, 0, 0] = 0  # a pixel with no signal
+  gradient = naive_gradient(bands)
+  assert np.allclose(naip_sampler.spectral_gradient(bands, chunk_rows=7), gradient, atol=1e-5)
+
+  with tempfile.TemporaryDirectory() as directory:
+    np.save(os.path.join(directory, 'tile.npy'), bands)
+    with open(os.path.join(directory, 'tile.json'), 'w') as f:
+      json.dump({'transform': TRANSFORM}, f)
+    tile = naip_sampler.Tile.load(os.path.join(directory, 'tile.npy'))
+    assert isinstance(tile.bands, np.memmap)
+
+    # a 20 x 20 pixel square with a 10 x 10 hole, one overlapping the edge, one
+    # outside the tile
+    store = GeometryStore.from_geojson([pixel_square(10, 10, 20, (15, 15, 10)),
+                                        pixel_square(70, 40, 20), pixel_square(200, 0, 5)])
+    polygons = store.rings(0)
+    assert abs(naip_sampler.area(polygons) - 300 * 0.88 * 1.11) < 10
+
+    centers = naip_sampler.sample_centers(tile, polygons, 1000, KERNEL_SIZE, rng)
+    inside = {(r, c) for r in range(10, 30) for c in range(10, 30)
+              if not (15 <= r < 25 and 15 <= c < 25)}
+    assert set(zip(*centers)) == inside
+    rows, cols = naip_sampler.sample_centers(tile, store.rings(1), 1000, KERNEL_SIZE, rng)
+    assert rows.min() == 40 and rows.max() == 57 and cols.min() == 70 and cols.max() == 77
+
+    samples = list(naip_sampler.sample_tile(tile, store, [0, 1, 2], ['a', 'b', 'c'],
+                                            KERNEL_SIZE, frac=0.1, seed=0))
+    assert [cliff_id for cliff_id, _ in samples] == ['a', 'b']
+    cliff_id, patches = samples[0]
+    assert len(patches['R']) == math.ceil(naip_sampler.area(polygons) * 0.1)
+    for i in range(len(patches['R'])):
+      # recovering the center from the patch
+      r, c = next((r, c) for r, c in inside
+                  if np.array_equal(bands[0, r - 2:r + 3, c - 2:c + 3], patches['R'][i]))
+      assert np.array_equal(patches['N'][i], bands[3, r - 2:r + 3, c - 2:c + 3])
+      assert np.allclose(patches['S'][i], gradient[r - 2:r + 3, c - 2:c + 3], atol=1e-5)
+
+    paths = naip_sampler.write_shards(samples, os.path.join(directory, 'shards'),
+                                      records_per_shard=1)
+    assert len(paths) == 2
+    # one shard per cliff
+    decoded = [next(naip_dataset.build_dataset(
+        [path], naip_dataset.compact_features(), 1000,
+        decode=naip_dataset.decode_compact(KERNEL_SIZE)).as_numpy_iterator()) for path in paths]
+    assert [len(batch['R']) for batch in decoded] == [len(p['R']) for _, p in samples]
+    for batch, (cliff_id, patches) in zip(decoded, samples):
+      assert set(batch['cliff_id']) == {cliff_id.encode()}
+      assert np.array_equal(batch['G'], patches['G'])
+      assert np.abs(batch['S'] - patches['S']).max() <= 0.5 / naip_dataset.S_SCALE + 1e-6
+
+
+if __name__ == '__main__':
+  test_sample_tile()
@@ -1,8 +1,37 @@
 """Test random branches."""
 
+import io
+import json
+import random
 from big_wall_finder.mp import parse_mp as mp
 
 
+def build_random_area(depth: int, lat: float, long: float):
+  """Build a random area node shaped like the scraped clean-data.json."""
+  # sub-areas often inherit their coordinates from the parent
+  if random.random() < 0.5:
+    lat += random.choice([-1, 1]) * 1e-4
+    long += random.choice([-1, 1]) * 1e-4
+  lat, long = round(lat, 4), round(long, 4)
+  area = {'name': f'Area {random.randint(0, 10 ** 6)}\n',
+          'url': 'https://mountainproject.com',
+          'lat': lat,
+          'long': long,
+          'gps2': f'{lat},{long}',
+          'totalViews': random.randint(0, 1000)}
+  if depth == 0 or random.random() < 0.3:
+    types = [['trad'], ['sport', 'tr'], ['boulder'], ['ice', 'alpine']]
+    area['children'] = [{'name': f'Route {i}',
+                         'url': 'https://mountainproject.com',
+                         'types': random.choice(types),
+                         'totalViews': random.randint(0, 1000)}
+                        for i in range(random.randint(0, 5))]
+  else:
+    area['children'] = [build_random_area(depth - 1, lat, long)
+                        for _ in range(random.randint(1, 3))]
+  return area
+
+
 def test_random_branch():
   """Test random branch."""
   d = mp.load_data()
@@ -10,5 +39,80 @@ def test_random_branch():
     mp.print_random_branch(d)
 
 
+def test_stream_dfs():
+  """Test that streaming the file gives the same counts as loading it."""
+  random.seed(0)
+  data = [build_random_area(4, 39.0, -110.0) for _ in range(5)]
+  # moving children before the coordinates in one area forces buffering
+  data[0] = {'children': data[0].pop('children'), **data[0]}
+
+  root = mp.root_node()
+  root['children'] = data
+  expected = {}
+  mp.dfs(root, expected)
+
+  counts = {}
+  mp.stream_dfs(io.BytesIO(json.dumps(data).encode()), counts)
+  assert list(counts.items()) == list(expected.items())
+
+
+def test_iterative_dfs():
+  """Test that the columnar traversal matches dfs row for row."""
+  random.seed(1)
+  root = mp.root_node()
+  root['children'] = [build_random_area(4, 39.0, -110.0) for _ in range(5)]
+  counts = {}
+  mp.dfs(root, counts)
+  expected = mp.Columns.from_counts(counts).to_df()
+
+  columns = mp.Columns()
+  mp.iterative_dfs(root, columns)
+  assert list(columns.ids) == list(counts)
+  assert columns.to_df().equals(expected)
+
+
+def test_parallel_dfs():
+  """Test that parsing areas in parallel matches a single traversal."""
+  random.seed(2)
+  root = mp.root_node()
+  # areas starting at the same coordinates share keys across subtrees
+  root['children'] = [build_random_area(3, 39.0, -110.0) for _ in range(8)]
+  expected = mp.Columns()
+  mp.iterative_dfs(root, expected)
+
+  columns = mp.Columns()
+  mp.parallel_dfs(root, columns, n_processes=2)
+  assert columns == expected
+
+
+def test_incremental_dfs():
+  """Test that reusing unchanged subtrees matches a full traversal."""
+  random.seed(3)
+  data = [build_random_area(4, 39.0, -110.0) for _ in range(4)]
+  # brackets, quotes, and keys within strings must not confuse the scanner
+  data[1]['children'][0]['name'] = 'Crack "children": [{\\'
+  index = mp.incremental_dfs(json.dumps(data).encode(), mp.Columns(), {})
+
+  # a new route in one area should only invalidate the subtree holding it
+  area = data[2]
+  while 'lat' in area['children'][0]:
+    area = area['children'][0]
+  area['children'].append({'name': 'New Route', 'types': ['trad'],
+                           'totalViews': 1})
+  root = mp.root_node()
+  root['children'] = data
+  expected = mp.Columns()
+  mp.iterative_dfs(root, expected)
+
+  columns = mp.Columns()
+  new_index = mp.incremental_dfs(json.dumps(data).encode(), columns, index)
+  assert columns == expected
+  assert len(set(new_index) - set(index)) == 1
+
+
 if __name__ == '__main__':
   test_random_branch()
+  test_stream_dfs()
+  test_iterative_dfs()
+  test_parallel_dfs()
+  test_incremental_dfs()
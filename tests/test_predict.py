@@ -0,0 +1,39 @@
+"""Test loading the features of predict once and its estimators lazily."""
+
+import os
+import subprocess
+import sys
+from big_wall_finder import tables
+from big_wall_finder.models import predict
+
+
+def test_cached_features(merged_data, monkeypatch):
+  """Test that Model instances share the features read once."""
+  merged_data()
+  reads = []
+  read_table = tables.read_table
+  monkeypatch.setattr(tables, 'read_table', lambda *args: reads.append(args) or read_table(*args))
+  first = predict.Model('linear', random_state=0)
+  second = predict.Model('ridge', random_state=1)
+  assert len(reads) == 1
+  features = predict.load_features()
+  assert set(features.X.columns).isdisjoint(predict.NON_FEATURES)
+  assert set(features.X.dtypes.astype(str)) == {'float32'}
+  for model in [first, second]:
+    assert list(model.X_train.columns) == list(features.X.columns)
+    assert len(model.X_train) + len(model.X_test) == len(features.X)
+    assert model.X_train.index.union(model.X_test.index).equals(features.X.index)
+
+
+def test_lazy_imports():
+  """Test that importing predict does not import the estimator libraries."""
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  code = ('import sys; from big_wall_finder.models import predict; '
+          'print(sorted({"tensorflow", "xgboost", "sklearn"} & set(sys.modules)))')
+  output = subprocess.run([sys.executable, '-c', code], cwd=root, check=True,
+                          capture_output=True, text=True).stdout
+  assert output.strip() == '[]'
+
+
+if __name__ == '__main__':
+  test_lazy_imports()
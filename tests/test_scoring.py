@@ -0,0 +1,84 @@
+"""Test chunked scoring of the cliff table."""
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+from big_wall_finder.models import predict, scoring
+
+
+def test_score_table():
+  """Test that chunked scores match scoring the table at once."""
+  rng = np.random.default_rng(0)
+  n = 1000
+  data = pd.DataFrame({'latitude': rng.uniform(30, 40, n),
+                       'longitude': rng.uniform(-120, -110, n),
+                       'height': rng.uniform(size=n),
+                       'slope': rng.uniform(size=n),
+                       'is_accessible': rng.uniform(size=n) < 0.5,
+                       'mp_score': rng.uniform(size=n)})
+  X = data.drop(columns=predict.NON_FEATURES, errors='ignore')
+  estimator = Ridge().fit(X, data.mp_score)
+  expected = estimator.predict(X)
+
+  with tempfile.TemporaryDirectory() as directory:
+    data_path = os.path.join(directory, 'merged_data.csv')
+    out_path = os.path.join(directory, 'results.csv')
+    data.to_csv(data_path, index=False)
+    for n_processes in [1, 2]:
+      n_rows = scoring.score_table(estimator, 'ridge_score', out_path, data_path,
+                                   chunk_size=64, n_processes=n_processes)
+      assert n_rows == n
+      results = pd.read_csv(out_path)
+      assert list(results.columns) == ['latitude', 'longitude', 'mp_score', 'ridge_score']
+      assert np.allclose(results.latitude, data.latitude)
+      assert np.allclose(results.ridge_score, expected)
+      assert scoring.worker_estimator is None
+
+    # scoring another model keeps the earlier scores
+    other = Ridge(alpha=100).fit(X, data.mp_score)
+    scoring.score_table(other, 'other_score', out_path, data_path, chunk_size=100)
+    results = pd.read_csv(out_path)
+    assert list(results.columns) == ['latitude', 'longitude', 'mp_score', 'ridge_score',
+                                     'other_score']
+    assert np.allclose(results.ridge_score, expected)
+    assert np.allclose(results.other_score, other.predict(X))
+    assert sorted(os.listdir(directory)) == ['merged_data.csv', 'results.csv']
+
+    scoring.score_table(other, 'other_score', out_path, data_path, merge=False)
+    assert list(pd.read_csv(out_path).columns)[-2:] == ['mp_score', 'other_score']
+    data.iloc[:-1].to_csv(data_path, index=False)
+    with pytest.raises(ValueError):
+      scoring.score_table(other, 'ridge_score', out_path, data_path)
+    assert len(pd.read_csv(out_path)) == n
+
+
+class DtypeRecorder():
+  """Estimator recording the dtypes of the features it scores."""
+
+  def __init__(self):
+    self.dtypes = set()
+
+  def predict(self, X):
+    self.dtypes.update(map(str, X.dtypes))
+    return np.zeros(len(X))
+
+
+def test_score_table_schema():
+  """Test that chunks are scored with the dtypes the model was trained on."""
+  data = pd.DataFrame({'latitude': [35.0, 36.0], 'longitude': [-115.0, -116.0],
+                       'height': [0.1, 0.2], 'pixel_count': [3, 4], 'geo_id': [0, 1],
+                       'is_accessible': [True, False], 'mp_score': [0.0, 0.5]})
+  estimator = DtypeRecorder()
+  with tempfile.TemporaryDirectory() as directory:
+    data_path = os.path.join(directory, 'merged_data.csv')
+    data.to_csv(data_path, index=False)
+    scoring.score_table(estimator, 'score', os.path.join(directory, 'results.csv'), data_path)
+    assert estimator.dtypes == {'float32'}
+
+
+if __name__ == '__main__':
+  test_score_table()
+  test_score_table_schema()
@@ -0,0 +1,90 @@
+"""Test reading and writing column stores."""
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from big_wall_finder import tables
+
+
+def test_round_trip():
+  """Test that a column store reads back the same as the CSV file."""
+  rng = np.random.default_rng(0)
+  n = 100
+  df = pd.DataFrame({
+      'latitude': rng.uniform(31, 49, n),
+      'B2_p20': rng.normal(size=n).astype(np.float32).astype(np.float64),
+      'height': rng.integers(50, 1000, n).astype(np.float64),
+      'n_rock': rng.integers(0, 100_000, n),
+      'road_within_500m': rng.integers(0, 2, n),
+      'is_accessible': rng.random(n) < 0.5,
+      'name': [f'Area {i} "quoted", ünicode' for i in range(n)],
+      '.geo': ['{"type":"Polygon"}'] * n,
+  })
+  df.loc[3, 'latitude'] = np.nan
+  df.loc[5, 'name'] = None
+
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'table.csv')
+    tables.write_table(df, path)
+    expected = pd.read_csv(path)
+    pd.testing.assert_frame_equal(tables.read_table(path), expected)
+
+    with np.load(tables.columnar_path(path)) as npz:
+      assert npz['1'].dtype == np.float32
+      assert npz['2'].dtype == np.int16
+      assert npz['4'].dtype == np.int8
+
+
+def test_schema():
+  """Test casting columns by name, by pattern, and by default."""
+  n = 10
+  df = pd.DataFrame({'latitude': np.linspace(31, 49, n),
+                     'slope_p50': np.linspace(60, 90, n),
+                     'road_within_500m': np.arange(n) % 2,
+                     'is_accessible': np.arange(n) < 5,
+                     'rock': ['granite', 'sandstone'] * 5,
+                     '.geo': ['{}'] * n})
+  schema = {'latitude': 'float64', 'road_within_*': 'int8', 'rock': 'category'}
+  cast = tables.apply_schema(df, schema, 'float32')
+  assert cast.dtypes.astype(str).to_dict() == {
+      'latitude': 'float64', 'slope_p50': 'float32', 'road_within_500m': 'int8',
+      'is_accessible': 'bool', 'rock': 'category', '.geo': df['.geo'].dtype.name}
+  assert tables.apply_schema(cast, schema, 'float32') is cast
+
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'table.csv')
+    tables.write_table(cast, path)
+    pd.testing.assert_frame_equal(tables.read_table(path, schema, 'float32'), cast)
+    pd.testing.assert_frame_equal(tables.read_columns(tables.columnar_path(path)), cast)
+
+
+def round_trip(df: pd.DataFrame):
+  """Write and read back df as a column store."""
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'table.npz')
+    tables.write_columns(df, path)
+    return tables.read_columns(path)
+
+
+def test_nulls():
+  """Test that nulls of object columns read back as NaN, as from CSV."""
+  read = round_trip(pd.DataFrame({'name': pd.Series(['a', None, 'c'], dtype=object)}))
+  assert isinstance(read.name[1], float) and np.isnan(read.name[1])
+  pd.testing.assert_series_equal(read.name, pd.Series(['a', np.nan, 'c'], dtype=object,
+                                                      name='name'))
+
+
+def test_categories():
+  """Test that categories of strings, ints, and floats round trip."""
+  df = pd.DataFrame({'rock': pd.Categorical(['granite', None, 'basalt'], ordered=True),
+                     'grade': pd.Categorical([5, 10, np.nan]),
+                     'height': pd.Categorical([1.5, 2.5, 1.5])})
+  pd.testing.assert_frame_equal(round_trip(df), df)
+
+
+if __name__ == '__main__':
+  test_round_trip()
+  test_schema()
+  test_nulls()
+  test_categories()
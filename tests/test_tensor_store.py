@@ -0,0 +1,54 @@
+"""Test the memory-mapped tensor store of NAIP patches."""
+
+import os
+import tempfile
+import numpy as np
+from naip_helpers import KERNEL_SIZE, build_serial_dataset, convert_shards, write_shards
+from big_wall_finder.models.cnn import naip_dataset, tensor_store
+
+
+def test_tensor_store():
+  """Test that the store holds every record, grouped by cliff."""
+  features = naip_dataset.naip_features(KERNEL_SIZE)
+  with tempfile.TemporaryDirectory() as directory:
+    filenames = write_shards(directory, 3, 50)
+    batches = list(build_serial_dataset(filenames, features, 1000).as_numpy_iterator())
+    expected = {key: np.concatenate([batch[key] for batch in batches]) for key in features}
+    expected_ids = expected['cliff_id'].astype(str)
+    expected_patches = np.stack([expected[band] for band in naip_dataset.NAIP_BANDS], axis=-1)
+
+    path = os.path.join(directory, 'store')
+    assert tensor_store.build_store(filenames, path, features, batch_size=32) == 150
+    store = tensor_store.TensorStore.load(path)
+    assert isinstance(store.patches, np.memmap)
+    assert store.patches.shape == (150, KERNEL_SIZE, KERNEL_SIZE, len(naip_dataset.NAIP_BANDS))
+    assert list(store.cliff_ids) == sorted(set(expected_ids))
+    # rows are sorted by cliff id, keeping the order of records within a cliff
+    order = np.argsort(expected_ids, kind='stable')
+    assert np.array_equal(store.patches, expected_patches[order])
+    assert np.array_equal(store.row_cliff_ids(), expected_ids[order])
+
+    cliff = store.cliff('1_0')
+    assert np.shares_memory(cliff, store.patches)
+    assert np.array_equal(cliff, expected_patches[expected_ids == '1_0'])
+    assert len(store.cliff('missing')) == 0
+
+    rows = np.array([5, 140, 0, 77])
+    patches, _ = store.take(rows)
+    assert np.array_equal(patches, store.patches[rows])
+    views = [patches for patches, _ in store.batches(64, shuffle=True, seed=0)]
+    assert sorted(map(len, views)) == [22, 64, 64]
+    assert all(np.shares_memory(view, store.patches) for view in views)
+
+    # compact shards give the same store up to the quantization of S
+    compact = convert_shards(filenames, tempfile.mkdtemp(dir=directory))
+    tensor_store.build_store(compact, os.path.join(directory, 'compact_store'),
+                             naip_dataset.compact_features(),
+                             decode=naip_dataset.decode_compact(KERNEL_SIZE))
+    compact_store = tensor_store.TensorStore.load(os.path.join(directory, 'compact_store'))
+    assert np.array_equal(compact_store.patches[..., :4], store.patches[..., :4])
+    assert np.abs(compact_store.patches[..., 4] - store.patches[..., 4]).max() < 1e-4
+
+
+if __name__ == '__main__':
+  test_tensor_store()
@@ -0,0 +1,51 @@
+"""Test NumPy evaluation of exported tree ensembles."""
+
+import os
+import tempfile
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+from xgboost import XGBRegressor
+from big_wall_finder.models.halving import with_early_stopping
+from big_wall_finder.models.tree_ensemble import TreeEnsemble
+
+
+def build_data(n_rows=1000, missing=0.05):
+  """Build features with missing values and a nonlinear target."""
+  rng = np.random.default_rng(0)
+  X = rng.normal(size=(n_rows, 5))
+  y = X[:, 0] * X[:, 1] + np.abs(X[:, 2]) + rng.normal(size=n_rows)
+  X[rng.random(X.shape) < missing] = np.nan
+  return X, y
+
+
+def test_predict():
+  """Test that exported ensembles predict as the native models."""
+  X, y = build_data()
+  X_test, _ = build_data(2000)
+  X_test[:500] = X[:500]  # rows with values on thresholds
+  models = [DecisionTreeRegressor(random_state=0),
+            RandomForestRegressor(30, random_state=0),
+            XGBRegressor(n_estimators=50, max_depth=5),
+            with_early_stopping('xgb', XGBRegressor(n_estimators=500, learning_rate=.3))]
+  for model in models:
+    model.fit(X, y)
+    ensemble = TreeEnsemble.from_model(model)
+    assert np.allclose(ensemble.predict(X_test), model.predict(X_test), atol=1e-5)
+
+
+def test_save_load():
+  """Test that saved ensembles load to the same predictions."""
+  X, y = build_data()
+  ensemble = TreeEnsemble.from_model(XGBRegressor(n_estimators=20).fit(X, y))
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'xgb.npz')
+    ensemble.save(path)
+    loaded = TreeEnsemble.load(path)
+  assert isinstance(loaded.max_depth, int)
+  assert np.array_equal(loaded.predict(X), ensemble.predict(X))
+
+
+if __name__ == '__main__':
+  test_predict()
+  test_save_load()
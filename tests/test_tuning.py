@@ -0,0 +1,104 @@
+"""Test tuning hyperparameters on a shared process pool."""
+
+import json
+import os
+import tempfile
+import numpy as np
+import pytest
+from sklearn.model_selection import RandomizedSearchCV
+from big_wall_finder.models import predict, tuning
+
+
+def test_tune_in_pool():
+  """Test that the pool picks the same candidates as RandomizedSearchCV."""
+  rng = np.random.default_rng(0)
+  X = rng.normal(size=(300, 5))
+  y = X[:, 0] - 2 * X[:, 1] ** 2 + rng.normal(size=300)
+  names = ['linear', 'ridge', 'knn']
+  best_params = tuning.tune_in_pool(X, y, n_iter=4, n_processes=2, names=names,
+                                    random_state=0)
+  assert list(best_params) == names
+  assert best_params['linear'] == {}
+  for name in names[1:]:
+    rs = RandomizedSearchCV(predict.build_estimator(name, X.shape[1]),
+                            predict.RANDOM_GRIDS[name], n_iter=4, cv=5, random_state=0)
+    rs.fit(X, y)
+    assert best_params[name] == rs.best_params_
+
+
+def test_sample_weight():
+  """Test that weighted candidates match a weighted RandomizedSearchCV."""
+  rng = np.random.default_rng(0)
+  X = rng.normal(size=(300, 5))
+  y = X[:, 0] - 2 * X[:, 1] ** 2 + rng.normal(size=300)
+  sample_weight = rng.uniform(0, 5, 300)
+  best_params = tuning.tune_in_pool(X, y, n_iter=6, n_processes=2, names=['ridge', 'knn'],
+                                    random_state=0, sample_weight=sample_weight)
+  rs = RandomizedSearchCV(predict.build_estimator('ridge', X.shape[1]),
+                          predict.RANDOM_GRIDS['ridge'], n_iter=6, cv=5, random_state=0)
+  rs.fit(X, y, sample_weight=sample_weight)
+  assert best_params['ridge'] == rs.best_params_
+  # knn does not take weights and is searched unweighted
+  assert best_params['knn'] == tuning.tune_in_pool(X, y, n_iter=6, n_processes=2,
+                                                   names=['knn'], random_state=0)['knn']
+
+
+def test_journal():
+  """Test that an interrupted search resumes from its journal."""
+  rng = np.random.default_rng(0)
+  X = rng.normal(size=(200, 4))
+  y = X[:, 0] + rng.normal(size=200)
+  names = ['ridge', 'knn']
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'journal.jsonl')
+    best_params = tuning.tune_in_pool(X, y, n_iter=3, n_processes=2, names=names,
+                                      journal_path=path)
+    with open(path) as f:
+      lines = f.readlines()
+    # data, candidates of two models, and 2 * 3 * 5 fold scores
+    assert len(lines) == 1 + 2 + 30
+
+    # interrupting the search while a score is being written
+    with open(path, 'w') as f:
+      f.writelines(lines[:20])
+      f.write(lines[20][:10])
+    resumed = tuning.tune_in_pool(X, y, n_iter=3, n_processes=2, names=names,
+                                  journal_path=path)
+    assert resumed == best_params
+    with open(path) as f:
+      entries = [json.loads(line) for line in f]
+    assert len(entries) == len(lines)
+    journal = tuning.Journal.load(path)
+    assert len(journal.scores) == 30
+
+    with pytest.raises(ValueError):
+      tuning.tune_in_pool(X[1:], y[1:], n_iter=3, names=names, journal_path=path)
+
+
+def test_shared_dtype(monkeypatch):
+  """Test that the arrays are shared in their own dtype."""
+  dtypes = []
+  share = tuning.share
+  monkeypatch.setattr(tuning, 'share', lambda array: dtypes.append(array.dtype) or share(array))
+  rng = np.random.default_rng(0)
+  X = rng.normal(size=(100, 3)).astype(np.float32)
+  y = X[:, 0] + rng.normal(size=100).astype(np.float32)
+  tuning.tune_in_pool(X, y, n_iter=2, n_processes=2, names=['ridge'], random_state=0)
+  assert dtypes == [np.float32, np.float32]
+
+
+def test_all_candidates_fail():
+  """Test that a model none of whose candidates fit raises."""
+  scores = {('ridge', i, fold): np.nan for i in range(2) for fold in range(3)}
+  with pytest.raises(ValueError):
+    tuning.select_best({'ridge': [{'alpha': 1}, {'alpha': 2}]}, scores, 3)
+  scores['ridge', 1, 0] = scores['ridge', 1, 1] = scores['ridge', 1, 2] = 0.5
+  assert tuning.select_best({'ridge': [{'alpha': 1}, {'alpha': 2}]}, scores, 3) == \
+      {'ridge': {'alpha': 2}}
+
+
+if __name__ == '__main__':
+  test_tune_in_pool()
+  test_sample_weight()
+  test_journal()
+  test_all_candidates_fail()